@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+
+"""Minimal in-process MQTT 3.1.1 broker for the benchmarks.
+
+It speaks enough of the protocol for the paho clients in ctdmon and winctl
+(CONNECT, SUBSCRIBE with + and # wildcards, UNSUBSCRIBE, PUBLISH at QoS 0, 1
+and 2, PINGREQ, DISCONNECT) and calls on_event for every message it sees,
+so a benchmark can time the broker hops:
+
+    on_event('publish', client_id, topic, payload, t)   message received from a publisher
+    on_event('deliver', client_id, topic, payload, t)   message released to a subscriber
+
+'t' is time.monotonic(). A QoS 2 message is passed on when the publisher's
+PUBREL arrives. It is released to a subscriber when the broker sends the
+last packet the subscriber needs before paho calls on_message: the PUBLISH
+at QoS 0 and 1, the PUBREL at QoS 2. Like mosquitto it forwards at
+min(publish QoS, subscription QoS). Retained
+messages, wills and persistent sessions are not supported.
+
+A connection with a client id that is already in use takes the id over,
+but unlike a real broker the old connection is left open, it just gets no
+more messages. winctl threads never stop some of their paho loops, and
+those would otherwise reconnect and take the id back from a restarted
+thread.
+"""
+
+import socket
+import struct
+import threading
+import time
+from typing import Callable, Union
+
+import paho.mqtt.client as mqtt
+
+CONNECT, CONNACK, PUBLISH, PUBACK, PUBREC, PUBREL, PUBCOMP = 1, 2, 3, 4, 5, 6, 7
+SUBSCRIBE, SUBACK, UNSUBSCRIBE, UNSUBACK, PINGREQ, PINGRESP, DISCONNECT = 8, 9, 10, 11, 12, 13, 14
+
+
+def _encode_length(length: int) -> bytes:
+    out = bytearray()
+    while True:
+        byte, length = length % 128, length // 128
+        out.append(byte | 0x80 if length else byte)
+        if not length:
+            return bytes(out)
+
+
+def _packet(ptype: int, flags: int, body: bytes) -> bytes:
+    return bytes([ptype << 4 | flags]) + _encode_length(len(body)) + body
+
+
+def _string(data: bytes, pos: int) -> tuple[str, int]:
+    length, = struct.unpack_from('!H', data, pos)
+    return data[pos + 2:pos + 2 + length].decode('utf-8'), pos + 2 + length
+
+
+class _Session:
+
+    def __init__(self, sock: socket.socket):
+        self.sock = sock
+        self.client_id = ''
+        self.subscriptions: dict[str, int] = {}
+        self.write_lock = threading.Lock()
+        self.next_mid = 0
+        self.outbound: dict[int, tuple[str, bytes]] = {}     # QoS 2 mid -> message waiting for PUBREC
+        self.inbound: dict[int, tuple[str, bytes, int]] = {}  # QoS 2 mid -> message waiting for PUBREL
+
+    def send(self, data: bytes):
+        with self.write_lock:
+            self.sock.sendall(data)
+
+    def recv_exact(self, n: int) -> bytes:
+        data = b''
+        while len(data) < n:
+            chunk = self.sock.recv(n - len(data))
+            if not chunk:
+                raise ConnectionError('client closed the connection')
+            data += chunk
+        return data
+
+    def read_packet(self) -> tuple[int, int, bytes]:
+        first = self.recv_exact(1)[0]
+        length, multiplier = 0, 1
+        while True:
+            byte = self.recv_exact(1)[0]
+            length += (byte & 0x7f) * multiplier
+            multiplier *= 128
+            if not byte & 0x80:
+                break
+        return first >> 4, first & 0x0f, self.recv_exact(length)
+
+    def mid(self) -> int:
+        self.next_mid = self.next_mid % 65535 + 1
+        return self.next_mid
+
+
+class StandInBroker:
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0,
+                 on_event: Union[None, Callable[[str, str, str, bytes, float], None]] = None):
+        self.on_event = on_event
+        self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.server.bind((host, port))
+        self.server.listen()
+        self.host, self.port = self.server.getsockname()
+        self.sessions: dict[str, _Session] = {}
+        self.lock = threading.Lock()
+        self.quit_evt = threading.Event()
+        self.published = 0
+        self.delivered = 0
+
+    def start(self):
+        threading.Thread(target=self.accept_loop, name='broker:accept', daemon=True).start()
+
+    def stop(self):
+        self.quit_evt.set()
+        self.server.close()
+        with self.lock:
+            sessions = list(self.sessions.values())
+        for session in sessions:
+            session.sock.close()
+
+    def _event(self, kind: str, client_id: str, topic: str, payload: bytes):
+        if kind == 'publish':
+            self.published += 1
+        else:
+            self.delivered += 1
+        if self.on_event is not None:
+            self.on_event(kind, client_id, topic, payload, time.monotonic())
+
+    def accept_loop(self):
+        while not self.quit_evt.is_set():
+            try:
+                sock, _ = self.server.accept()
+            except OSError:
+                break
+            # small packets both ways, don't let Nagle hold them back
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            session = _Session(sock)
+            threading.Thread(target=self.session_loop, args=(session,), name='broker:session', daemon=True).start()
+
+    def session_loop(self, session: _Session):
+        try:
+            while not self.quit_evt.is_set():
+                ptype, flags, body = session.read_packet()
+                if ptype == DISCONNECT:
+                    break
+                self.handle_packet(session, ptype, flags, body)
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            with self.lock:
+                if self.sessions.get(session.client_id) is session:
+                    del self.sessions[session.client_id]
+            session.sock.close()
+
+    def handle_packet(self, session: _Session, ptype: int, flags: int, body: bytes):
+
+        if ptype == CONNECT:
+            _, pos = _string(body, 0)        # protocol name
+            pos += 4                         # level, flags, keep alive
+            session.client_id, _ = _string(body, pos)
+            with self.lock:
+                self.sessions[session.client_id] = session
+            session.send(_packet(CONNACK, 0, b'\x00\x00'))
+
+        elif ptype == SUBSCRIBE:
+            mid, = struct.unpack_from('!H', body)
+            pos, granted = 2, bytearray()
+            while pos < len(body):
+                topic, pos = _string(body, pos)
+                qos = body[pos] & 0x03
+                pos += 1
+                session.subscriptions[topic] = qos
+                granted.append(qos)
+            session.send(_packet(SUBACK, 0, struct.pack('!H', mid) + bytes(granted)))
+
+        elif ptype == UNSUBSCRIBE:
+            mid, = struct.unpack_from('!H', body)
+            pos = 2
+            while pos < len(body):
+                topic, pos = _string(body, pos)
+                session.subscriptions.pop(topic, None)
+            session.send(_packet(UNSUBACK, 0, struct.pack('!H', mid)))
+
+        elif ptype == PUBLISH:
+            qos = (flags >> 1) & 0x03
+            topic, pos = _string(body, 0)
+            mid = 0
+            if qos:
+                mid, = struct.unpack_from('!H', body, pos)
+                pos += 2
+            payload = body[pos:]
+            self._event('publish', session.client_id, topic, payload)
+            if qos == 0:
+                self.route(topic, payload, qos)
+            elif qos == 1:
+                session.send(_packet(PUBACK, 0, struct.pack('!H', mid)))
+                self.route(topic, payload, qos)
+            else:
+                session.inbound[mid] = (topic, payload, qos)
+                session.send(_packet(PUBREC, 0, struct.pack('!H', mid)))
+
+        elif ptype == PUBREL:
+            mid, = struct.unpack_from('!H', body)
+            message = session.inbound.pop(mid, None)
+            session.send(_packet(PUBCOMP, 0, struct.pack('!H', mid)))
+            if message is not None:
+                self.route(*message)
+
+        elif ptype == PUBREC:
+            mid, = struct.unpack_from('!H', body)
+            message = session.outbound.pop(mid, None)
+            session.send(_packet(PUBREL, 0x02, struct.pack('!H', mid)))
+            if message is not None:
+                self._event('deliver', session.client_id, *message)
+
+        elif ptype == PINGREQ:
+            session.send(_packet(PINGRESP, 0, b''))
+
+    def route(self, topic: str, payload: bytes, qos: int):
+
+        with self.lock:
+            sessions = list(self.sessions.values())
+
+        topic_bytes = topic.encode('utf-8')
+        for session in sessions:
+            sub_qos = [q for sub, q in list(session.subscriptions.items()) if mqtt.topic_matches_sub(sub, topic)]
+            if not sub_qos:
+                continue
+            out_qos = min(qos, max(sub_qos))
+            body = struct.pack('!H', len(topic_bytes)) + topic_bytes
+            if out_qos:
+                mid = session.mid()
+                if out_qos == 2:
+                    session.outbound[mid] = (topic, payload)
+                body += struct.pack('!H', mid)
+            try:
+                session.send(_packet(PUBLISH, out_qos << 1, body + payload))
+            except OSError:
+                continue
+            if out_qos < 2:
+                self._event('deliver', session.client_id, topic, payload)
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+
+"""Drive SBE33SerialDataPort from the SBE33/SBE19plus V2 emulator over a
+pty and measure scan latency (emulator write -> CTDSample on data_q) and
+drop rate at several scan rates.
+
+The port goes through its normal start up (SBE33 menu, mode 2, CTD
+configuration, getcd, startnow), which takes ~20 secs, then each rate
+runs for --secs while the scans received are matched to the scans sent.
+
+    python -m benchmarks.ctd_throughput [--rates 4,24,100] [--secs 10]
+"""
+
+import argparse
+import os
+import queue
+import statistics
+import tempfile
+import threading
+import time
+
+from sbe19v2plus.emulator import SBE33Emulator, default_scan_values
+from sbe19v2plus.sbe33_serialport import SBE33SerialDataPort
+
+
+def main():
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rates', help="comma separated scans/s", default='4,24,100', type=str)
+    parser.add_argument('--secs', help="secs per rate", default=10.0, type=float)
+    parser.add_argument('--drain', help="secs to wait for late scans after each rate", default=3.0, type=float)
+    args = parser.parse_args()
+
+    sent = {}       # raw scan -> emulator write time
+    received = {}   # raw scan -> time it came off data_q
+    seq = 0
+
+    def unique_scan_values(t: float) -> dict:
+        # nudge temperature so every scan is distinct and can be matched up
+        nonlocal seq
+        seq += 1
+        values = default_scan_values(t)
+        values['t_c'] = 10 + seq / 100000
+        return values
+
+    emu = SBE33Emulator(scan_rate=float(args.rates.split(',')[0]), scan_values=unique_scan_values)
+    emu.on_scan = lambda line, ts: sent.__setitem__(line, ts)
+    port_name = emu.open()
+    emu.start()
+
+    quit_evt = threading.Event()
+    data_q = queue.Queue()
+    logfile = os.path.join(tempfile.mkdtemp(), 'ctd_throughput.log')
+    port = SBE33SerialDataPort(logfile, quit_evt, data_q, queue.Queue(), port_name, 9600, 5)
+
+    def consume():
+        while not quit_evt.is_set():
+            try:
+                sample = data_q.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            received[sample.raw] = time.monotonic()
+
+    consumer = threading.Thread(target=consume, name='ctd_throughput:consume')
+    consumer.start()
+
+    print(f'emulator on {port_name}, starting CTD port (log: {logfile})...')
+    port.start()
+    while emu.scans_sent == 0:
+        time.sleep(0.1)
+
+    results = []
+    for rate in [float(r) for r in args.rates.split(',')]:
+        emu.scan_rate = rate
+        time.sleep(1)   # let the new rate settle
+        first = set(sent)
+        time.sleep(args.secs)
+        window = [line for line in list(sent) if line not in first]
+        time.sleep(args.drain)
+
+        latencies = [(received[line] - sent[line]) * 1000 for line in window if line in received]
+        dropped = len(window) - len(latencies)
+        results.append((rate, len(window), dropped, latencies))
+
+    quit_evt.set()
+    consumer.join()
+    port.quit()
+    emu.stop()
+
+    print()
+    print(f'{"scans/s":>8} {"sent":>7} {"dropped":>8} {"drop %":>7} {"p50 ms":>8} {"p95 ms":>8} {"max ms":>8}')
+    for rate, nsent, dropped, latencies in results:
+        if latencies:
+            p50 = statistics.median(latencies)
+            p95 = statistics.quantiles(latencies, n=20, method='inclusive')[-1] if len(latencies) > 1 else latencies[0]
+            worst = max(latencies)
+        else:
+            p50 = p95 = worst = float('nan')
+        drop_pct = 100 * dropped / nsent if nsent else 0.0
+        print(f'{rate:>8.0f} {nsent:>7} {dropped:>8} {drop_pct:>7.1f} {p50:>8.1f} {p95:>8.1f} {worst:>8.1f}')
+    print(f'pty overruns: {emu.overruns}')
+
+
+if __name__ == '__main__':
+    main()
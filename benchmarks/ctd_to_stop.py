@@ -0,0 +1,368 @@
+#!/usr/bin/env python3
+
+"""End to end latency of the CTD -> winch stop path, split into stages.
+
+Runs the closed-loop cast simulator (real SBE33SerialDataPort, pausemon,
+wincmd and winmon threads against the SBE33/SBE19plus and DIO MCU
+emulators) on the stand-in MQTT broker from benchmarks.broker, with
+MIN_ALTITUDE set so that a low altimeter reading makes winmon stop the
+winch. Each cast goes down past STAGING_DEPTH, the emulated altitude
+drops below MIN_ALTITUDE, and the scan that first shows it is followed
+to the emulated winch stop pin going high:
+
+    read       emulator writes the scan -> SBE33SerialDataPort readline() returns it
+    decode     readline() -> CTDSample put on data_q
+    publish    data_q -> the relay's PUBLISH arrives at the broker
+    broker     broker -> released to winmon (on_message)
+    winmon     winmon on_message -> winmon publishes STOP-AT-MAX-DEPTH
+    command    STOP-AT-MAX-DEPTH at the broker -> released to wincmd (on_message)
+    dispatch   wincmd on_message -> DIOCommander.stop_winch() called
+    dio        stop_winch() called -> stop pin high at the MCU
+
+read, decode, publish and broker are measured for every scan, the rest
+once per cast. Save a run with --save and compare a later one against it
+with --baseline:
+
+    python -m benchmarks.ctd_to_stop [--rates 4,8,16] [--casts 3] [--save v1.json] [--baseline v0.json]
+
+The winctl and CTD reader output goes to a log file in the temp dir
+printed at the start. Each cast takes ~20 real secs, plus ~20 secs of
+CTD start up.
+"""
+
+import argparse
+import contextlib
+import json
+import queue
+import statistics
+import sys
+import threading
+import time
+from typing import Union
+
+import paho.mqtt.client as mqtt
+
+import config
+import log
+from sbe19v2plus.sample import CTDSample
+from simulator import ALT_VOLT_RANGE, WINCTL_CLIENT_ID, CastSimulator, SeafloorProfile
+from winch import WinchCmd, WinchStateName, pub_cmd
+from winch.dio_cmds import DIOCommander
+
+from .broker import StandInBroker
+
+STAGES = ['read', 'decode', 'publish', 'broker', 'winmon', 'command', 'dispatch', 'dio']
+SCAN_STAGES = STAGES[:4]
+
+MIN_ALTITUDE_M = 10         # winmon stops the winch below this
+CRUISE_ALTITUDE_M = 50
+TRIGGER_ALTITUDE_M = 5
+ARM_BELOW_STAGING_M = 1.0   # start the low altitude scans this far below STAGING_DEPTH
+
+# paho client ids of the CTD data relay and winctl's shared connection,
+# which winmon and wincmd both publish and subscribe through
+RELAY_PUB = 'sim-ctdmon'
+
+
+class StampedQueue(queue.Queue):
+    """data_q that records when each sample was put on it"""
+
+    def __init__(self):
+        super().__init__()
+        self.put_t: dict[str, float] = {}
+
+    def put(self, item, block=True, timeout=None):
+        self.put_t[item.raw] = time.monotonic()
+        super().put(item, block, timeout)
+
+
+class LatencyCast(CastSimulator):
+
+    def __init__(self, cfg: config.Config):
+
+        super().__init__(cfg, 1.0, SeafloorProfile([(0, 1000.0)]), pause_depths=[])
+
+        self.staging_depth = self.cfg.winch.STAGING_DEPTH
+        self.seq = 0
+        self.cast_no = 0
+        self.armed = False
+        self.low = False
+        self.trials: list[dict] = []
+
+        self.sent: dict[str, float] = {}
+        self.read_t: dict[str, float] = {}
+        self.payload_of: dict[str, bytes] = {}
+        self.published_t: dict[bytes, float] = {}
+        self.delivered_t: dict[bytes, float] = {}
+        self.stop_published: list[float] = []
+        self.stop_delivered: list[float] = []
+        self.stop_called: list[float] = []
+
+        self.data_q = StampedQueue()
+        self.ctd_io.data_q = self.data_q
+        self.ctd.on_scan = self.on_scan
+
+        read_line = self.ctd_io.ser_port.readline
+
+        def timed_readline():
+            line = read_line()
+            if line:
+                self.read_t[line.decode('utf-8', errors='replace').strip()] = time.monotonic()
+            return line
+
+        self.ctd_io.ser_port.readline = timed_readline
+
+    def scan_values(self, t: float) -> dict:
+        values = super().scan_values(t)
+        # a unique temperature per scan so each one can be followed through the stages
+        self.seq += 1
+        values['t_c'] = 10 + self.seq / 100000
+        self.low = self.armed
+        altitude = TRIGGER_ALTITUDE_M if self.low else CRUISE_ALTITUDE_M
+        values['v0'] = round(altitude * ALT_VOLT_RANGE / 100, 4)
+        return values
+
+    def on_scan(self, line: str, ts: float):
+        self.sent[line] = ts
+        if self.low and self.trials and 'scan' not in self.trials[-1]:
+            self.trials[-1]['scan'] = line
+
+    def on_broker_event(self, kind: str, client_id: str, topic: str, payload: bytes, t: float):
+        if topic == self.cfg["mqtt"]["CTD_DATA_TOPIC"]:
+            if kind == 'publish' and client_id == RELAY_PUB:
+                self.published_t[payload] = t
+            elif kind == 'deliver' and client_id == WINCTL_CLIENT_ID:
+                self.delivered_t[payload] = t
+        elif topic == self.cfg["mqtt"]["WINCH_CMD_TOPIC"] and \
+                json.loads(payload)['command'] == WinchCmd.WINCH_CMD_STOP_AT_MAX_DEPTH.value:
+            if kind == 'publish' and client_id == WINCTL_CLIENT_ID:
+                self.stop_published.append(t)
+            elif kind == 'deliver' and client_id == WINCTL_CLIENT_ID:
+                self.stop_delivered.append(t)
+
+    def data_relay_loop(self):
+
+        client = mqtt.Client(RELAY_PUB)
+        client.connect(self.cfg["mqtt"]["HOST"], self.cfg["mqtt"]["PORT"])
+        client.loop_start()
+        while not self.quit_evt.is_set():
+            try:
+                sample: CTDSample = self.data_q.get(block=True, timeout=0.5)
+                self.data_q.task_done()
+            except queue.Empty:
+                continue
+            payload = sample.to_json_bytes()
+            self.payload_of[sample.raw] = payload
+            client.publish(self.cfg["mqtt"]["CTD_DATA_TOPIC"], payload, qos=2)
+        client.loop_stop()
+        client.disconnect()
+
+    def trigger_loop(self):
+        """Drop the emulated altitude once per cast, when the winch is downcasting below STAGING_DEPTH"""
+
+        while not self.quit_evt.is_set():
+            downcasting = self.last_state() == WinchStateName.DOWNCASTING.value
+            if not self.armed and downcasting and \
+                    self.model.payout_m > self.staging_depth + ARM_BELOW_STAGING_M and \
+                    (not self.trials or self.trials[-1]['cast'] != self.cast_no):
+                self.trials.append({'cast': self.cast_no, 'rate': self.ctd.scan_rate})
+                self.armed = True
+            elif self.armed and not downcasting:
+                self.armed = False
+            time.sleep(0.02)
+
+    def measure_cast(self, timeout: float) -> bool:
+        """Publish START and wait up to timeout real secs for the winch to stop
+        on the low altitude scans. Only the way down is needed, so rather than
+        run the upcast and parking, put the bullet back on the latch and start
+        winctl again with a new Winch, ready for the next cast."""
+
+        deadline = time.monotonic() + timeout
+        while self.last_state() != WinchStateName.PARKED.value and time.monotonic() < deadline:
+            time.sleep(0.1)
+
+        self.cast_no += 1
+        started = time.monotonic()
+        pub_cmd(self.monitor_client, self.cfg["mqtt"]["WINCH_CMD_TOPIC"], WinchCmd.WINCH_CMD_START.value)
+        while not self.timeline_has(WinchStateName.MAXDEPTH.value, started) and time.monotonic() < deadline:
+            time.sleep(0.1)
+        stopped = self.timeline_has(WinchStateName.MAXDEPTH.value, started)
+
+        # before pausemon ends the MAXDEPTH pause and starts the upcast
+        self.stop_winctl()
+        # let the winch coast to rest
+        time.sleep(1)
+        self.model.move_to(0.0)
+        self.start_winctl()
+        return stopped
+
+    def last_state(self) -> str:
+        return self.winch_status.timeline[-1][1] if self.winch_status.timeline else ''
+
+    def timeline_has(self, state: str, since: float) -> bool:
+        return any(t >= since and entry_state == state for t, entry_state, _ in self.winch_status.timeline)
+
+    def stage_times(self, line: str) -> list[Union[None, float]]:
+        """Timestamps of a scan at each stage boundary, None from the first one it never reached"""
+
+        times = [self.sent.get(line), self.read_t.get(line), self.data_q.put_t.get(line)]
+        payload = self.payload_of.get(line)
+        times += [self.published_t.get(payload), self.delivered_t.get(payload)]
+        return times
+
+    def trial_times(self, trial: dict) -> list[Union[None, float]]:
+
+        def first_after(events: list[float], t: Union[None, float]) -> Union[None, float]:
+            if t is None:
+                return None
+            return next((e for e in sorted(events) if e >= t), None)
+
+        times = self.stage_times(trial['scan'])
+        times.append(first_after(self.stop_published, times[-1]))
+        times.append(first_after(self.stop_delivered, times[-1]))
+        times.append(first_after(self.stop_called, times[-1]))
+        times.append(first_after([stop_t for stop_t, _, _ in self.model.stops], times[-1]))
+        return times
+
+
+def stats(values: list[float]) -> dict:
+    if not values:
+        return {'n': 0}
+    p95 = statistics.quantiles(values, n=20, method='inclusive')[-1] if len(values) > 1 else values[0]
+    return {'n': len(values), 'p50': statistics.median(values), 'p95': p95, 'max': max(values)}
+
+
+def summarize(sim: LatencyCast, windows: list[tuple[float, float, float]]) -> dict:
+    """Per rate stage latencies in ms, plus scans sent and lost before reaching the broker.
+    Scans sent while winctl restarts between casts have no winmon to go to,
+    so broker counts fewer scans than publish."""
+
+    results = {}
+    for rate, start, end in windows:
+        lines = [line for line, t in sim.sent.items() if start <= t < end]
+        stage_ms: dict[str, list[float]] = {stage: [] for stage in STAGES + ['total']}
+        lost = 0
+        for line in lines:
+            times = sim.stage_times(line)
+            if None in times[:len(SCAN_STAGES)]:
+                lost += 1
+            for stage, t0, t1 in zip(SCAN_STAGES, times, times[1:]):
+                if t0 is not None and t1 is not None:
+                    stage_ms[stage].append((t1 - t0) * 1000)
+
+        trials = [trial for trial in sim.trials if trial['rate'] == rate and 'scan' in trial]
+        for trial in trials:
+            times = sim.trial_times(trial)
+            for stage, t0, t1 in zip(STAGES[len(SCAN_STAGES):], times[len(SCAN_STAGES):], times[len(SCAN_STAGES) + 1:]):
+                if t0 is not None and t1 is not None:
+                    stage_ms[stage].append((t1 - t0) * 1000)
+            if None not in times:
+                stage_ms['total'].append((times[-1] - times[0]) * 1000)
+
+        results[f'{rate:g}'] = {
+            'scans': len(lines), 'lost': lost, 'casts': len(trials),
+            'stages': {stage: stats(values) for stage, values in stage_ms.items()},
+        }
+    return results
+
+
+def report(results: dict, baseline: Union[None, dict]):
+
+    for rate, res in results.items():
+        print()
+        print(f'{rate} scans/s: {res["casts"]} casts, {res["scans"]} scans, {res["lost"]} lost before the broker')
+        header = f'{"stage":<10} {"n":>6} {"p50 ms":>9} {"p95 ms":>9} {"max ms":>9}'
+        base_stages: dict = {}
+        if baseline is not None and rate in baseline:
+            base_stages = baseline[rate]['stages']
+            header += f' {"base p50":>9} {"change":>8}'
+        print(header)
+        for stage, st in res['stages'].items():
+            if not st['n']:
+                print(f'{stage:<10} {0:>6} {"-":>9} {"-":>9} {"-":>9}')
+                continue
+            row = f'{stage:<10} {st["n"]:>6} {st["p50"]:>9.1f} {st["p95"]:>9.1f} {st["max"]:>9.1f}'
+            base = base_stages.get(stage, {})
+            if base.get('n'):
+                change = 100 * (st['p50'] - base['p50']) / base['p50'] if base['p50'] else float('nan')
+                row += f' {base["p50"]:>9.1f} {change:>+7.0f}%'
+            print(row)
+
+
+def main():
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rates', help="comma separated CTD scans/s", default='4,8,16', type=str)
+    parser.add_argument('--casts', help="casts (stops) per rate", default=3, type=int)
+    parser.add_argument('--cast-timeout', help="give up on a cast after this many real secs", default=120, type=float)
+    parser.add_argument('--save', help="write the results to this JSON file", default=None, type=str)
+    parser.add_argument('--baseline', help="compare with results saved by an earlier --save", default=None, type=str)
+    args = parser.parse_args()
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as fl:
+            baseline = json.load(fl)['results']
+
+    cfg = config.read()
+    if cfg == None:
+        print(f'ctd_to_stop: ERROR unable to read rift-ox.toml config file. Quitting.')
+        sys.exit(1)
+
+    cfg = cfg.replace('winch', STAGING_DEPTH=2, MIN_ALTITUDE=MIN_ALTITUDE_M,
+                      PAUSE_DURATION_SECS=2, BOTTLE_PAUSE_DURATION_SECS=2)
+    cfg = cfg.replace('rift-ox-pi', REALTIME_CTD=False)
+
+    broker = StandInBroker()
+    broker.start()
+    cfg = cfg.replace('mqtt', HOST=broker.host, PORT=broker.port)
+
+    sim = LatencyCast(cfg)
+    # winctl and the CTD reader log to <tmp dir>/winctl.log, not the terminal
+    log.setup(sim.cfg, 'winctl', console=False)
+    broker.on_event = sim.on_broker_event
+
+    stop_winch = DIOCommander.stop_winch
+
+    def timed_stop_winch(cmndr: DIOCommander):
+        sim.stop_called.append(time.monotonic())
+        stop_winch(cmndr)
+
+    DIOCommander.stop_winch = timed_stop_winch
+
+    rates = [float(rate) for rate in args.rates.split(',') if rate]
+    windows = []
+    log_fn = sim.tmp_dir.joinpath('ctd_to_stop.log')
+    print(f'ctd_to_stop: {args.casts} casts at each of {args.rates} scans/s, output in {log_fn}')
+    with open(log_fn, 'w') as out, contextlib.redirect_stdout(out):
+        sim.start()
+        trigger_thr = threading.Thread(target=sim.trigger_loop, name='ctd_to_stop:trigger')
+        trigger_thr.start()
+        if sim.wait_for_ctd(120):
+            for rate in rates:
+                sim.ctd.scan_rate = rate
+                start = time.monotonic()
+                for _ in range(args.casts):
+                    stopped = sim.measure_cast(args.cast_timeout)
+                    print(f'ctd_to_stop: {rate:g} scans/s cast {sim.cast_no} stopped: {stopped}', file=sys.__stdout__)
+                windows.append((rate, start, time.monotonic()))
+        sim.stop()
+        trigger_thr.join()
+    broker.stop()
+    DIOCommander.stop_winch = stop_winch
+
+    if not windows:
+        print('ctd_to_stop: ERROR no CTD data from the emulator')
+        sys.exit(1)
+
+    results = summarize(sim, windows)
+    report(results, baseline)
+    if args.save:
+        with open(args.save, 'w') as fl:
+            json.dump({'created': time.strftime('%Y-%m-%dT%H:%M:%S'), 'rates': args.rates,
+                       'casts': args.casts, 'results': results}, fl, indent=2)
+        print(f'\nsaved to {args.save}')
+
+
+if __name__ == '__main__':
+    main()
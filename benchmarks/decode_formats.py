@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+
+"""Compare decode throughput of converted HEX (outputformat=1) and
+converted decimal (outputformat=3) SBE19plus V2 scans.
+
+Both formats are built from the same channel schema and the same sample
+values, so the numbers are directly comparable.
+
+    python -m benchmarks.decode_formats [-n SCANS] [--channels volt0,volt2,...]
+"""
+
+import argparse
+import queue
+import threading
+import timeit
+
+import sbe19v2plus.config
+from sbe19v2plus.config import Config, SBE19OutputFmt
+from sbe19v2plus.sbe33_serialport import SBE33SerialDataPort
+
+# typical values, one per channel key in sbe19v2plus.config.CHANNELS
+SAMPLE_VALUES = {
+    't_c': 18.6798, 'cond': 4.2145, 'pres': 152.449,
+    'v0': 3.2519, 'v1': 0.1234, 'v2': 3.3738, 'v3': 0.5, 'v4': 1.25, 'v5': 2.5,
+    'sbe38': 18.6712,
+    'wetlabs0': 1234, 'wetlabs1': 2345, 'wetlabs2': 3456,
+    'GTD1_press': 101.325, 'GTD1_tempc': 18.5, 'GTD2_press': 101.4, 'GTD2_tempc': 18.6,
+    'optode': 250.5, 'ox_ph': 30.123, 'ox_temp_vstr': 0.54321,
+    'time2000': 846000000,
+    'sal': 34.5123, 'sv': 1510.1234,
+}
+
+
+def make_port(cfg: Config) -> SBE33SerialDataPort:
+    port = SBE33SerialDataPort('/dev/null', threading.Event(), queue.Queue(), queue.Queue(),
+                               'loop://', 9600, 5)
+    port.ctd_config = cfg
+    return port
+
+
+def bench(label: str, stmt, number: int) -> float:
+    secs = min(timeit.repeat(stmt, number=number, repeat=5))
+    ns_per_scan = secs / number * 1e9
+    print(f'{label:<28} {ns_per_scan:>10.0f} ns/scan {number / secs:>12.0f} scans/s')
+    return ns_per_scan
+
+
+def main():
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', '--scans', help="scans per timing run", default=20000, type=int)
+    parser.add_argument('--channels', help="comma separated Config data channel flags to enable",
+                        default='volt0,volt2', type=str)
+    args = parser.parse_args()
+
+    flags = {f'data_chan_{name}': True for name in args.channels.split(',') if name}
+    hex_cfg = Config(output_format=SBE19OutputFmt.OUTPUT_FORMAT_1, **flags)
+    dec_cfg = Config(output_format=SBE19OutputFmt.OUTPUT_FORMAT_3, **flags)
+
+    hex_layout = hex_cfg.layout()
+    dec_layout = dec_cfg.layout()
+    hex_line = hex_layout.encode_hex(SAMPLE_VALUES)
+    dec_line = dec_layout.encode_dec(SAMPLE_VALUES)
+    print(f'channels: {hex_layout.csv_header}')
+    print(f'format 1: {hex_line}')
+    print(f'format 3: {dec_line}')
+
+    hex_port = make_port(hex_cfg)
+    dec_port = make_port(dec_cfg)
+
+    # the full schema decode on its own, then the parse_data path
+    # (length checks, real-time channels, gsw depth)
+    bench('format 1 layout decode', lambda: hex_layout.decode_hex(hex_line), args.scans)
+    bench('format 3 layout decode', lambda: dec_layout.decode_dec(dec_line.split(',')), args.scans)
+    bench('format 1 parse_data', lambda: hex_port.parse_data(hex_line), args.scans)
+    bench('format 3 parse_data', lambda: dec_port.parse_data(dec_line), args.scans)
+    # ... and what an archival consumer pays to pull every channel out of the sample
+    bench('format 1 parse_data, all', lambda: hex_port.parse_data(hex_line).to_dict(full=True), args.scans)
+    bench('format 3 parse_data, all', lambda: dec_port.parse_data(dec_line).to_dict(full=True), args.scans)
+
+    hex_port.ser_port.close()
+    dec_port.ser_port.close()
+
+
+if __name__ == '__main__':
+    main()
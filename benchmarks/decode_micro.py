@@ -0,0 +1,423 @@
+#!/usr/bin/env python3
+
+"""Micro-benchmarks for the sbe19v2plus per-scan decode path and GetCD parsing.
+
+Times the steps ctdmon's read loop takes for every scan (update_state,
+expected_sample_line_length, _convert_output_format_1 and parse_data, and
+all of them together as 'read line') and both ways a GetCD response gets
+parsed (Config.update_getcd_info on the whole document, update_state line
+by line as it arrives). For each it reports
+
+    ns/op      best of the timing runs
+    blocks/op  memory blocks still allocated per op with the results kept (sys.getallocatedblocks)
+    bytes/op   size of what is still allocated (tracemalloc)
+    peak B/op  transient memory while a single op runs
+
+where an op is one scan, or one GetCD document for the getcd rows.
+
+The recorded scans and GetCD documents in benchmarks/fixtures are run as
+they are. Other channel combinations are synthesized from the channel
+schema: by default the deployed channels, none, each channel on its own and
+all of them; with --all every combination of the 12 data channel flags in
+both profile and moored mode (~40 min), leaving out the getcd rows. Every
+combination is checked to decode back to the values it was built from in
+both output formats and to parse back from its GetCD document, and every
+recorded scan against what ctdmon logged for it; a mismatch fails the run.
+
+Save a run with --save and compare a later one against it with --baseline.
+--max-change fails the run when any op got that many percent slower or
+allocates more blocks than in the baseline.
+
+    python -m benchmarks.decode_micro [-n SCANS] [--all] [--save v1.json] [--baseline v0.json] [--max-change 20]
+"""
+
+import argparse
+import contextlib
+import gc
+import itertools
+import json
+import math
+import os
+import statistics
+import sys
+import time
+import timeit
+import tracemalloc
+from pathlib import Path
+from typing import Callable, Union
+
+from benchmarks.decode_formats import SAMPLE_VALUES, make_port
+from sbe19v2plus.config import Config, SBE19Mode, SBE19OutputFmt
+from sbe19v2plus.emulator import SBE33Emulator, encode_gps
+from sbe19v2plus.sbe33_serialport import SBE33SerialDataPort
+
+FIXTURES = Path(__file__).parent / 'fixtures'
+
+# Config data channel flags, in GetCD <DataChannels> order
+CHANNEL_FLAGS = ('volt0', 'volt1', 'volt2', 'volt3', 'volt4', 'volt5',
+                 'sbe38', 'wetlabs', 'optode', 'sbe63', 'GTD', 'DualGTD')
+DEPLOYED = ('volt0', 'volt2')
+
+FORMATS = (SBE19OutputFmt.OUTPUT_FORMAT_1, SBE19OutputFmt.OUTPUT_FORMAT_3)
+
+# position appended to the synthesized converted HEX scans by the SBE33
+LAT, LON = 32.86806, -117.25266
+
+# blocks/op are averaged over many ops, anything above this is a real extra allocation
+BLOCKS_TOLERANCE = 0.1
+
+
+def combinations(exhaustive: bool) -> list[tuple[SBE19Mode, tuple]]:
+    """(mode, enabled channel flags) to run. Moored mode adds the time channel."""
+
+    if exhaustive:
+        flag_sets = [tuple(flag for flag, on in zip(CHANNEL_FLAGS, bits) if on)
+                     for bits in itertools.product((False, True), repeat=len(CHANNEL_FLAGS))]
+        return [(mode, flags) for mode in SBE19Mode for flags in flag_sets]
+
+    flag_sets = [DEPLOYED, ()] + [(flag,) for flag in CHANNEL_FLAGS] + [CHANNEL_FLAGS]
+    return ([(SBE19Mode.PROFILE_MODE, flags) for flags in flag_sets] +
+            [(SBE19Mode.MOORED_MODE, DEPLOYED), (SBE19Mode.MOORED_MODE, CHANNEL_FLAGS)])
+
+
+def make_config(mode: SBE19Mode, flags: tuple, output_format: SBE19OutputFmt) -> Config:
+    # moored deployments also have the CTD compute salinity and sound velocity,
+    # so the derived converted decimal fields get covered too
+    moored = mode == SBE19Mode.MOORED_MODE
+    return Config(mode=mode, output_format=output_format, output_sal=moored, output_sv=moored,
+                  **{f'data_chan_{flag}': flag in flags for flag in CHANNEL_FLAGS})
+
+
+def make_scan(cfg: Config) -> str:
+    layout = cfg.layout()
+    if cfg.output_format == SBE19OutputFmt.OUTPUT_FORMAT_1:
+        return layout.encode_hex(SAMPLE_VALUES) + encode_gps(LAT, LON)
+    return layout.encode_dec(SAMPLE_VALUES)
+
+
+def row_name(output_format: SBE19OutputFmt, mode: SBE19Mode, flags: tuple) -> str:
+    mode_name = 'moored' if mode == SBE19Mode.MOORED_MODE else 'profile'
+    return f'format {output_format.value} {mode_name} {",".join(flags) or "-"}'
+
+
+def read_scans(path: Path) -> list[tuple[SBE19OutputFmt, tuple, str, Union[None, dict]]]:
+    """Recorded scans: (output format, channel flags, scan, sample ctdmon logged or None)"""
+
+    scans = []
+    with open(path) as fl:
+        for line in fl:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            output_format, flags, rest = line.split(' ', 2)
+            scan, sep, logged = rest.partition(' {')
+            scans.append((SBE19OutputFmt(int(output_format)), tuple(flags.split(',')),
+                          scan, json.loads('{' + logged) if sep else None))
+    return scans
+
+
+def read_line(port: SBE33SerialDataPort, line: str):
+    """Per-line work of SBE33SerialDataPort.read_loop, less the log file and data_q"""
+
+    port.update_state(line)
+    if port.is_data_line(line):
+        port.ctd_status[port.CTD_STATE] = port.CTD_STATE_ACQUIRING_DATA
+    if port.ctd_status[port.CTD_STATE] == port.CTD_STATE_ACQUIRING_DATA:
+        return port.parse_data(line)
+    return None
+
+
+def feed_getcd(port: SBE33SerialDataPort, lines: list[str]) -> bool:
+    """A GetCD response arriving line by line, as read_loop hands it to update_state"""
+
+    for line in lines:
+        port.update_state(line)
+    return port.getcd_read_event.is_set()
+
+
+def check_decode(port: SBE33SerialDataPort, scan: str) -> list[str]:
+    """Every channel (and derived field) decodes back to SAMPLE_VALUES within its resolution"""
+
+    sample = port.parse_data(scan)
+    if sample is None:
+        return ['parse_data returned None']
+
+    layout = port.ctd_config.layout()
+    values = sample.to_dict(full=True)
+    errors = []
+    expected_keys = layout.keys + (() if sample.is_hex else layout.dec_derived)
+    for key in expected_keys:
+        if key not in values:
+            errors.append(f'no {key}')
+    channels = {ch.key: ch for ch in layout.channels}
+    for key in expected_keys:
+        if key not in values:
+            continue
+        ch = channels.get(key)
+        if ch is None:
+            tolerance = 1e-4    # derived decimal fields have 4 decimals
+        elif ch.counts:
+            tolerance = 0
+        else:
+            tolerance = 1 / ch.scale + 10 ** -ch.digits
+        if abs(values[key] - SAMPLE_VALUES[key]) > tolerance:
+            errors.append(f'{key} {values[key]} != {SAMPLE_VALUES[key]}')
+    if sample.is_hex and (abs(sample.lat - LAT) > 1e-4 or abs(sample.lon - LON) > 1e-4):
+        errors.append(f'position {sample.lat},{sample.lon} != {LAT},{LON}')
+    return errors
+
+
+def check_logged(port: SBE33SerialDataPort, scan: str, logged: dict) -> list[str]:
+    """A recorded scan decodes to the real-time values ctdmon logged for it"""
+
+    sample = port.parse_data(scan)
+    if sample is None:
+        return ['parse_data returned None']
+    values = sample.to_dict()
+    return [f'{key} {values.get(key)} != logged {logged[key]}'
+            for key in sample.REALTIME_KEYS
+            if key in logged and not math.isclose(values.get(key, math.nan), logged[key], rel_tol=1e-9)]
+
+
+def check_getcd(xml: str, cfg: Config) -> list[str]:
+    """The GetCD document parses back to the configuration it was generated from"""
+
+    parsed = Config()
+    if not parsed.update_getcd_info(xml):
+        return ['update_getcd_info failed']
+    errors = [f'{attr} {getattr(parsed, attr)} != {getattr(cfg, attr)}'
+              for attr in ('mode', 'output_format', 'output_sal', 'output_sv') + CHANNEL_FLAGS
+              if getattr(parsed, attr) != getattr(cfg, attr)]
+    if parsed.layout().keys != cfg.layout().keys:
+        errors.append(f'channels {parsed.layout().csv_header} != {cfg.layout().csv_header}')
+    return errors
+
+
+def time_op(op: Callable, number: int, repeat: int) -> float:
+    return min(timeit.repeat(op, number=number, repeat=repeat)) / number * 1e9
+
+
+def alloc_op(op: Callable, number: int) -> tuple[float, float, float]:
+    """(blocks, bytes) still allocated per op with every result kept, and the peak bytes of one op"""
+
+    keep = [None] * number
+    op()    # anything cached on first use is not a per-op cost
+    gc.collect()
+    tracemalloc.start()
+    blocks = sys.getallocatedblocks()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.reset_peak()
+    keep[0] = op()
+    peak = tracemalloc.get_traced_memory()[1] - size
+    for ndx in range(1, number):
+        keep[ndx] = op()
+    # the XML parsers leave reference cycles behind, that's garbage not retained memory
+    gc.collect()
+    blocks = sys.getallocatedblocks() - blocks
+    size = tracemalloc.get_traced_memory()[0] - size
+    tracemalloc.stop()
+    return blocks / number, size / number, float(peak)
+
+
+def measure(ops: dict[str, Callable], number: int, repeat: int, alloc_number: int) -> dict:
+
+    res = {}
+    # update_state prints the configuration once a GetCD document is complete
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        for name, op in ops.items():
+            blocks, size, peak = alloc_op(op, alloc_number)
+            res[name] = {'ns': time_op(op, number, repeat), 'blocks': blocks, 'bytes': size, 'peak': peak}
+    return res
+
+
+def scan_ops(port: SBE33SerialDataPort, scan: str) -> dict[str, Callable]:
+
+    ops = {'update_state': lambda: port.update_state(scan)}
+    if port.ctd_config.output_format == SBE19OutputFmt.OUTPUT_FORMAT_1:
+        has_gps = len(scan) == port.expected_sample_line_length(True)
+        ops['expected_sample_line_length'] = lambda: port.expected_sample_line_length(has_gps)
+        ops['_convert_output_format_1'] = lambda: port._convert_output_format_1(scan, has_gps)
+    ops['parse_data'] = lambda: port.parse_data(scan)
+    ops['read line'] = lambda: read_line(port, scan)
+    return ops
+
+
+def getcd_ops(port: SBE33SerialDataPort, xml: str) -> dict[str, Callable]:
+
+    lines = [line.strip() for line in xml.splitlines() if line.strip()]
+    return {
+        'getcd update_getcd_info': lambda: Config().update_getcd_info(xml),
+        'getcd update_state': lambda: feed_getcd(port, lines),
+    }
+
+
+def run(port: SBE33SerialDataPort, cfg: Config, ops_for: Callable, arg: str,
+        number: int, repeat: int, alloc_number: int) -> dict:
+
+    port.ctd_config = cfg
+    # as read_loop has it mid-cast
+    port.ctd_status[port.CTD_STATE] = port.CTD_STATE_ACQUIRING_DATA
+    port.getcd_read_event.clear()
+    res = measure(ops_for(port, arg), number, repeat, alloc_number)
+    # update_state swaps in the Config it parsed
+    port.ctd_config = cfg
+    return res
+
+
+def report_rows(results: dict, baseline: Union[None, dict]):
+
+    for row, ops in results.items():
+        print()
+        print(row)
+        header = f'  {"op":<28} {"ns/op":>10} {"blocks/op":>10} {"bytes/op":>10} {"peak B/op":>10}'
+        if baseline is not None and row in baseline:
+            header += f' {"base ns":>10} {"change":>8}'
+        print(header)
+        for name, st in ops.items():
+            line = (f'  {name:<28} {st["ns"]:>10.0f} {st["blocks"]:>10.1f} '
+                    f'{st["bytes"]:>10.0f} {st["peak"]:>10.0f}')
+            base = (baseline or {}).get(row, {}).get(name)
+            if base is not None:
+                line += f' {base["ns"]:>10.0f} {100 * (st["ns"] - base["ns"]) / base["ns"]:>+7.0f}%'
+            print(line)
+
+
+def report_summary(results: dict):
+    """ns/op spread of each op across the synthesized channel combinations, per output format"""
+
+    print()
+    print(f'{"format":<7} {"op":<28} {"rows":>6} {"min ns":>9} {"median ns":>10} {"max ns":>9} '
+          f'{"max blocks":>11}  slowest')
+    for output_format in FORMATS:
+        prefix = f'format {output_format.value} '
+        by_op: dict[str, list[tuple[float, float, str]]] = {}
+        for row, ops in results.items():
+            if row.startswith(prefix):
+                for name, st in ops.items():
+                    by_op.setdefault(name, []).append((st['ns'], st['blocks'], row))
+        for name, entries in by_op.items():
+            ns = [entry[0] for entry in entries]
+            slowest = max(entries)[2][len(prefix):]
+            print(f'{output_format.value:<7} {name:<28} {len(entries):>6} {min(ns):>9.0f} '
+                  f'{statistics.median(ns):>10.0f} {max(ns):>9.0f} '
+                  f'{max(entry[1] for entry in entries):>11.1f}  {slowest}')
+
+
+def regressions(results: dict, baseline: dict, max_change: float) -> list[str]:
+
+    res = []
+    for row, ops in results.items():
+        for name, st in ops.items():
+            base = baseline.get(row, {}).get(name)
+            if base is None:
+                continue
+            change = 100 * (st['ns'] - base['ns']) / base['ns'] if base['ns'] else 0
+            if change > max_change:
+                res.append(f'{row}: {name} {base["ns"]:.0f} -> {st["ns"]:.0f} ns/op ({change:+.0f}%)')
+            if st['blocks'] > base['blocks'] + BLOCKS_TOLERANCE:
+                res.append(f'{row}: {name} {base["blocks"]:.1f} -> {st["blocks"]:.1f} blocks/op')
+    return res
+
+
+def main():
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', '--scans', help="ops per timing run (default 20000, 100 with --all)",
+                        default=None, type=int)
+    parser.add_argument('--all', help="time every channel combination, not just the representative ones",
+                        action='store_true')
+    parser.add_argument('--save', help="write the results to this JSON file", default=None, type=str)
+    parser.add_argument('--baseline', help="compare with results saved by an earlier --save", default=None, type=str)
+    parser.add_argument('--max-change', help="fail when an op is this many %% slower than the baseline",
+                        default=None, type=float)
+    args = parser.parse_args()
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as fl:
+            baseline = json.load(fl)['results']
+
+    number = args.scans if args.scans is not None else (100 if args.all else 20000)
+    repeat = 3 if args.all else 5
+    alloc_number = min(number, 2000)
+    # a GetCD document is ~100 times the work of a scan, but the XML parsers keep
+    # a few hundred blocks of free lists around that need as many documents to average out
+    doc_number = max(10, number // 100)
+    doc_alloc_number = 2000
+
+    ports = {output_format: make_port(Config(output_format=output_format)) for output_format in FORMATS}
+
+    # every combination has to decode, timed or not
+    failures = []
+    for mode, flags in combinations(True):
+        for output_format in FORMATS:
+            cfg = make_config(mode, flags, output_format)
+            ports[output_format].ctd_config = cfg
+            failures += [f'{row_name(output_format, mode, flags)}: {err}'
+                         for err in check_decode(ports[output_format], make_scan(cfg))]
+        cfg = make_config(mode, flags, SBE19OutputFmt.OUTPUT_FORMAT_1)
+        failures += [f'{row_name(cfg.output_format, mode, flags)} getcd: {err}'
+                     for err in check_getcd(SBE33Emulator(config=cfg).getcd_xml(), cfg)]
+
+    results = {}
+
+    for output_format, flags, scan, logged in read_scans(FIXTURES / 'scans.txt'):
+        row = f'recorded {row_name(output_format, SBE19Mode.PROFILE_MODE, flags)}'
+        cfg = make_config(SBE19Mode.PROFILE_MODE, flags, output_format)
+        port = ports[output_format]
+        port.ctd_config = cfg
+        if logged is not None:
+            failures += [f'{row}: {err}' for err in check_logged(port, scan, logged)]
+        results[row] = run(port, cfg, scan_ops, scan, number, repeat, alloc_number)
+
+    for path in sorted(FIXTURES.glob('getcd_*.xml')):
+        xml = path.read_text()
+        cfg = Config()
+        if not cfg.update_getcd_info(xml):
+            failures.append(f'{path.name}: update_getcd_info failed')
+            continue
+        port = ports[SBE19OutputFmt.OUTPUT_FORMAT_1]
+        results[f'recorded {path.name}'] = run(port, cfg, getcd_ops, xml, doc_number, repeat, doc_alloc_number)
+
+    todo = combinations(args.all)
+    started = time.monotonic()
+    for ndx, (mode, flags) in enumerate(todo):
+        for output_format in FORMATS:
+            cfg = make_config(mode, flags, output_format)
+            port = ports[output_format]
+            row = row_name(output_format, mode, flags)
+            results[row] = run(port, cfg, scan_ops, make_scan(cfg), number, repeat, alloc_number)
+            # the GetCD documents of two combinations only differ in some yes/no texts
+            if output_format == SBE19OutputFmt.OUTPUT_FORMAT_1 and not args.all:
+                results[row].update(run(port, cfg, getcd_ops, SBE33Emulator(config=cfg).getcd_xml(),
+                                        doc_number, repeat, doc_alloc_number))
+        if args.all:
+            elapsed = time.monotonic() - started
+            print(f'{ndx + 1}/{len(todo)} combinations, {elapsed / (ndx + 1) * (len(todo) - ndx - 1):.0f} secs to go',
+                  end='\r', file=sys.stderr)
+
+    for port in ports.values():
+        port.ser_port.close()
+
+    if not args.all:
+        report_rows(results, baseline)
+    report_summary({row: ops for row, ops in results.items() if not row.startswith('recorded')})
+
+    if args.save:
+        with open(args.save, 'w') as fl:
+            json.dump({'created': time.strftime('%Y-%m-%dT%H:%M:%S'), 'scans': number, 'all': args.all,
+                       'python': sys.version.split()[0], 'results': results}, fl, indent=1)
+        print(f'\nsaved to {args.save}')
+
+    if baseline is not None and args.max_change is not None:
+        failures += regressions(results, baseline, args.max_change)
+
+    if failures:
+        print(f'\n{len(failures)} FAILED:')
+        for failure in failures:
+            print(f'  {failure}')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+
+"""Host side cost of each DIOCommander winch action and query, built from
+its command table against formatting every command per call as it used to.
+
+An in-process stand-in for the MCU's serial port answers every command as
+soon as it is written, and sleeps return at once, so only the host's work
+is timed. For each action:
+
+    build      making the bytes to write: f-strings encoded per pin, or a CMDS lookup
+    exchange   the whole action: one exchange per pin as before, or DIOCommander
+               sending the concatenated table entry in one write
+    writes     serial port writes per action
+
+    python -m benchmarks.dio_table [-n ACTIONS] [--config config/rift-ox.toml]
+"""
+
+import argparse
+from pathlib import Path
+import sys
+import timeit
+from unittest import mock
+
+import clock
+import config
+from winch.dio_cmds import DIOCommander, dio_command
+from winch.dio_emulator import DIOEmulator, PROMPT
+
+# output pin levels of each winch action, in the order they are set
+SETS = {
+    'pin_hi': (('stop', True),),
+    'stop_winch': (('stop', True), ('down', False), ('up', False)),
+    'down_cast': (('up', False), ('down', True), ('stop', False)),
+    'up_cast': (('up', True), ('down', False), ('stop', False)),
+}
+# (input pin, 'edge' or 'input') of each query, made together
+QUERIES = {
+    'snapshot': (('payout1', 'edge'), ('payout2', 'edge'), ('latch', 'input')),
+    'latch_poll': (('latch', 'edge'), ('payout1', 'edge')),
+}
+
+
+class InstantClock(clock.RealClock):
+
+    def sleep(self, secs: float):
+        pass
+
+
+class LoopbackMCU:
+    """Serial port stand-in answering each '\\r' terminated command as it is
+    written, with DIOEmulator's echo, result line and prompt"""
+
+    def __init__(self, emu: DIOEmulator):
+        self.emu = emu
+        self.out = bytearray()
+        self.pending = ''
+        self.writes = 0
+
+    @property
+    def in_waiting(self) -> int:
+        return len(self.out)
+
+    def read(self, size: int) -> bytes:
+        data = bytes(self.out[:size])
+        del self.out[:size]
+        return data
+
+    def write(self, data: bytes) -> int:
+        self.writes += 1
+        *lines, self.pending = (self.pending + data.decode()).split('\r')
+        for line in lines:
+            line = line.strip('\n')
+            result = self.emu.command(line) if line else None
+            self.out += f'{line}\r\n{result}\r\n{PROMPT}'.encode() if result is not None else \
+                f'{line}\r\n{PROMPT}'.encode()
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+    def __enter__(self) -> 'LoopbackMCU':
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+
+def formatted_sets(pins: dict, levels: tuple) -> list[bytes]:
+    return [f'dio set DO_G{pins[pin]["group"]} {pins[pin]["pin"]} {"high" if high else "low"}\r'.encode()
+            for pin, high in levels]
+
+
+def formatted_queries(pins: dict, queries: tuple) -> list[bytes]:
+    cmds = []
+    for pin, kind in queries:
+        if kind == 'edge':
+            cmds.append(f'dio edge DI_G{pins[pin]["group"]} {pins[pin]["pin"]}\r'.encode())
+        else:
+            cmds.append(f'dio get DI_G{pins[pin]["group"]} input {pins[pin]["pin"]}\r'.encode())
+    return cmds
+
+
+def bench(stmt, number: int) -> float:
+    return min(timeit.repeat(stmt, number=number, repeat=5)) / number
+
+
+def main():
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', '--actions', help="actions per timing run", default=20000, type=int)
+    parser.add_argument('--config', help="rift-ox toml config", default='config/rift-ox.toml', type=str)
+    args = parser.parse_args()
+
+    cfg = config.load(Path(args.config))
+    if cfg is None:
+        sys.exit(1)
+    # any port that exists, the loopback stands in for it
+    cfg = cfg.replace('rift-ox-pi', DIO_PORT=sys.executable, SIMULATION=False)
+    pi_cfg = cfg.rift_ox_pi
+    # the pin dicts DIOCommander formatted its commands from
+    out_pins = {name: {'group': pin.group, 'pin': pin.pin} for name, pin in pi_cfg.output_pins.items()}
+    in_pins = {name: {'group': pin.group, 'pin': pin.pin} for name, pin in pi_cfg.input_pins.items()}
+
+    mcu = LoopbackMCU(DIOEmulator(cfg, latency=0))
+    clock.use(InstantClock())
+    with mock.patch('winch.dio_cmds.serial.Serial', return_value=mcu):
+        cmndr = DIOCommander(cfg)
+        with cmndr.session():
+            # every action exchanges in full and the shadow register is not due a read back
+            cmndr.shadow_verify_secs = float('inf')
+            cmndr.snapshot()
+
+            print(f'{"":<12} {"build ns":>20} {"exchange us":>20} {"writes":>12}')
+            print(f'{"action":<12} {"formatted":>10}{"table":>10} {"formatted":>10}{"table":>10} {"before":>6}{"now":>6}')
+            actions = [(name, levels, None) for name, levels in SETS.items()] + \
+                      [(name, None, queries) for name, queries in QUERIES.items()]
+            for name, levels, queries in actions:
+                key = name if name != 'pin_hi' else levels[0]
+                if levels is not None:
+                    def build_before():
+                        return formatted_sets(out_pins, levels)
+
+                    def exchange_before():
+                        # one exchange per pin, each command formatted as it is sent
+                        for cmd in formatted_sets(out_pins, levels):
+                            cmndr.issue(dio_command(cmd.decode()))
+                else:
+                    def build_before():
+                        return formatted_queries(in_pins, queries)
+
+                    def exchange_before():
+                        cmndr.issue(dio_command(*(cmd.decode() for cmd in formatted_queries(in_pins, queries))))
+
+                def exchange_table():
+                    cmndr.issue(cmndr.CMDS[key])
+
+                build_formatted = bench(build_before, args.actions)
+                build_table = bench(lambda: cmndr.CMDS[key].data, args.actions)
+                exchange_formatted = bench(exchange_before, args.actions // 10)
+                exchange_now = bench(exchange_table, args.actions // 10)
+
+                writes = mcu.writes
+                exchange_before()
+                writes_before = mcu.writes - writes
+                exchange_table()
+                writes_now = mcu.writes - writes - writes_before
+
+                print(f'{name:<12} {build_formatted * 1e9:>10.0f}{build_table * 1e9:>10.0f} '
+                      f'{exchange_formatted * 1e6:>10.1f}{exchange_now * 1e6:>10.1f} '
+                      f'{writes_before:>6}{writes_now:>6}')
+
+    print(f'{mcu.emu.commands} MCU commands')
+
+
+if __name__ == '__main__':
+    main()
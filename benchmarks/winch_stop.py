@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+
+"""Measure DIOCommander command latency and winch stop accuracy against the
+DIO MCU emulator.
+
+Command latency is the wall time of each DIOCommander call (port open,
+wake, command, response). Stop latency is from calling stop_winch() to
+the emulated stop pin going high, and overshoot is how far the cable keeps
+paying out from there until the winch is at rest.
+
+    python -m benchmarks.winch_stop [-n STOPS] [--latency SECS] [--inertia SECS]
+"""
+
+import argparse
+from pathlib import Path
+import random
+import statistics
+import sys
+import time
+
+import config
+
+from winch.dio_cmds import DIOCommander
+from winch.dio_emulator import DIOEmulator, WinchModel
+
+
+def report(label: str, values: list[float], unit: str):
+    p95 = statistics.quantiles(values, n=20, method='inclusive')[-1] if len(values) > 1 else values[0]
+    print(f'{label:<24} p50 {statistics.median(values):>8.1f} p95 {p95:>8.1f} max {max(values):>8.1f} {unit}')
+
+
+def main():
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', '--stops', help="number of down/stop cycles", default=10, type=int)
+    parser.add_argument('--latency', help="emulated MCU response latency in secs", default=0.005, type=float)
+    parser.add_argument('--inertia', help="emulated motor time constant in secs", default=0.25, type=float)
+    parser.add_argument('--config', help="rift-ox toml config", default='config/rift-ox.toml', type=str)
+    args = parser.parse_args()
+
+    cfg = config.load(Path(args.config))
+    if cfg is None:
+        sys.exit(1)
+    model = WinchModel(sheave_radius_inch=cfg.winch.SHEAVE_RADIUS_INCH,
+                       cable_diameter_inch=cfg.winch.SEA_CABLE_DIAMETER_INCH,
+                       inertia_s=args.inertia, payout_m=1.0)
+    emu = DIOEmulator(cfg, model=model, latency=args.latency)
+    cfg = cfg.replace('rift-ox-pi', DIO_PORT=emu.open(), SIMULATION=False)
+    emu.start()
+
+    cmndr = DIOCommander(cfg)
+
+    get_ms = []
+    edge_ms = []
+    for _ in range(20):
+        t = time.monotonic()
+        cmndr.get_latch_sensor_state()
+        get_ms.append((time.monotonic() - t) * 1000)
+        t = time.monotonic()
+        cmndr.get_latch_edge_count()
+        edge_ms.append((time.monotonic() - t) * 1000)
+
+    stop_call_ms = []
+    stop_pin_ms = []
+    overshoot_cm = []
+    for _ in range(args.stops):
+        cmndr.down_cast()
+        time.sleep(random.uniform(1.0, 2.0))
+        t = time.monotonic()
+        cmndr.stop_winch()
+        stop_call_ms.append((time.monotonic() - t) * 1000)
+        while len(model.stops) <= len(overshoot_cm):
+            time.sleep(0.05)
+        pin_t, commanded, rest = model.stops[-1]
+        stop_pin_ms.append((pin_t - t) * 1000)
+        overshoot_cm.append((rest - commanded) * 100)
+
+    emu.stop()
+
+    print(f'emulated latency {args.latency * 1000:.1f}ms, inertia {args.inertia}s, '
+          f'{model.payout_rate_mps}m/s, {emu.commands} MCU commands')
+    report('get latch sensor', get_ms, 'ms')
+    report('get latch edges', edge_ms, 'ms')
+    report('stop_winch() call', stop_call_ms, 'ms')
+    report('stop_winch() -> pin', stop_pin_ms, 'ms')
+    report('stop overshoot', overshoot_cm, 'cm')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+
+"""Process wide clock used by the winch, pausemon, CTD reader and the
+emulators, so a whole mission can run faster than real time.
+
+    import clock
+    clock.sleep(2)              # instead of time.sleep(2)
+    ts = clock.time()           # instead of time.time()
+    q.get(timeout=clock.timeout(0.25))
+
+Everything uses RealClock unless a simulator or test installs another one
+with clock.use() before starting its threads:
+
+    clock.use(clock.ScaledClock(20))    # 20x real time
+    clock.use(clock.ManualClock())      # only moves when advance()d
+"""
+
+import threading
+import time as _time
+from typing import Callable, Union
+
+
+class RealClock:
+
+    def time(self) -> float:
+        """Seconds since the epoch"""
+        return _time.time()
+
+    def monotonic(self) -> float:
+        return _time.monotonic()
+
+    def sleep(self, secs: float):
+        _time.sleep(secs)
+
+    def timeout(self, secs: float) -> float:
+        """Real secs to block on a queue or event for `secs` of clock time"""
+        return secs
+
+
+class ScaledClock(RealClock):
+    """Runs `scale` times faster than real time, starting from the real time now"""
+
+    def __init__(self, scale: float):
+        if scale <= 0:
+            raise ValueError(f'clock scale must be > 0, not {scale}')
+        self.scale = scale
+        self._real_start = _time.monotonic()
+        self._epoch_start = _time.time()
+
+    def _elapsed(self) -> float:
+        return (_time.monotonic() - self._real_start) * self.scale
+
+    def time(self) -> float:
+        return self._epoch_start + self._elapsed()
+
+    def monotonic(self) -> float:
+        return self._real_start + self._elapsed()
+
+    def sleep(self, secs: float):
+        if secs > 0:
+            _time.sleep(secs / self.scale)
+
+    def timeout(self, secs: float) -> float:
+        return secs / self.scale
+
+
+class ManualClock(RealClock):
+    """Stands still until advance() is called. Sleepers wake once the clock
+    has been advanced past their wake up time."""
+
+    # real secs that blocking calls wait before polling again
+    POLL_SECS = 0.01
+
+    def __init__(self, start: Union[None, float] = None):
+        self._now = _time.time() if start is None else start
+        self._cond = threading.Condition()
+
+    def advance(self, secs: float):
+        with self._cond:
+            self._now += secs
+            self._cond.notify_all()
+
+    def time(self) -> float:
+        return self._now
+
+    def monotonic(self) -> float:
+        return self._now
+
+    def sleep(self, secs: float):
+        with self._cond:
+            wake = self._now + secs
+            while self._now < wake:
+                self._cond.wait()
+
+    def timeout(self, secs: float) -> float:
+        return min(secs, self.POLL_SECS)
+
+
+_clock: RealClock = RealClock()
+
+
+def use(clk: RealClock):
+    global _clock
+    _clock = clk
+
+
+def get() -> RealClock:
+    return _clock
+
+
+def time() -> float:
+    return _clock.time()
+
+
+def monotonic() -> float:
+    return _clock.monotonic()
+
+
+def sleep(secs: float):
+    _clock.sleep(secs)
+
+
+def timeout(secs: float) -> float:
+    return _clock.timeout(secs)
+
+
+def timer(interval: float, function: Callable, args: tuple = ()) -> threading.Thread:
+    """Like threading.Timer, in clock time. Returns the started thread."""
+
+    def _run():
+        sleep(interval)
+        function(*args)
+
+    thr = threading.Thread(target=_run, name='clock:timer', daemon=True)
+    thr.start()
+    return thr
@@ -6,24 +6,47 @@ from typing import Union
 
 import toml
 
-def read() -> Union[None, dict]:
+from .schema import Config, ConfigError
+
+def path() -> Union[None, Path]:
     # check for config file ENV VAR
     config_file = os.getenv("RIFT_OX_CONFIG_FILE", "")
     if not config_file:
         print(f'CONFIG ERROR: Config file ENV VAR $RIFT_OX_CONFIG_FILE not set.')
         return None
+    return Path(config_file)
+
+def load(config_path: Path) -> Union[None, Config]:
 
-    config_path = Path(config_file)
     if not config_path.exists():
         print(f'CONFIG ERROR: Config file {config_path} does not exist.')
         return None
 
-    cfg = None
-    with config_path.open(mode="rt") as cfg_fl:
-        cfg = toml.load(cfg_fl)
+    raw = None
+    try:
+        with config_path.open(mode="rt") as cfg_fl:
+            raw = toml.load(cfg_fl)
+    except toml.TomlDecodeError as e:
+        print(f"ERROR parsing cfg file: {config_path.absolute()}: {e}")
+        return None
 
-    if type(cfg) is not dict:
+    if type(raw) is not dict:
         print(f"ERROR parsing cfg file: {config_path.absolute()}.")
         return None
 
+    try:
+        cfg = Config.from_dict(raw)
+    except ConfigError as e:
+        for problem in e.problems:
+            print(f'CONFIG ERROR: {config_path}: {problem}')
+        return None
+    for key in cfg.unknown:
+        print(f'CONFIG WARNING: {config_path}: {key} unknown, ignored')
+
     return cfg
+
+def read() -> Union[None, Config]:
+    config_path = path()
+    if config_path is None:
+        return None
+    return load(config_path)
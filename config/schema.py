@@ -0,0 +1,581 @@
+#!/usr/bin/env python3
+
+"""rift-ox.toml as a frozen, typed and checked Config.
+
+Each section is a frozen dataclass whose UPPER_CASE fields are its toml
+keys, converted to the field's type as the file is read (an int is fine
+for a float), so code reads
+
+    cfg.winch.MAX_DEPTH        # float
+    cfg.rift_ox_pi.DIO_PORT
+
+with no casts. Sections are still read only mappings, cfg['winch']['MAX_DEPTH']
+and cfg['winch'].get('NO_PARKING') work as they did on the parsed dict.
+
+Values worked out from several keys are computed once here, as lower case
+fields, e.g. winch.m_per_edge and rift_ox_pi.output_pins.
+
+Config.from_dict() raises ConfigError listing every missing key, wrong
+type and out of range value, so a bad file stops a daemon at startup
+rather than in one of its threads. Keys it does not know are ignored and
+listed in Config.unknown, sections it does not know are kept as they are.
+
+Each [[instances]] table is another winch and CTD run by the same
+daemons, the main file's settings with that table's subtables over them:
+
+    [[instances]]
+    NAME = 'b'
+    [instances.rift-ox-pi]
+    DIO_PORT = '/dev/ttyACM2'
+
+Its topics are the main ones with the NAME after the first level
+(rift-ox/b/winch/cmd) and its payout logs and AWS client id are
+suffixed with it, unless the table sets them. cfg.instances holds
+one Config per table, cfg.systems is cfg followed by those.
+"""
+
+import dataclasses
+from dataclasses import dataclass, field
+import logging
+from math import pi
+import re
+from types import MappingProxyType
+from typing import Any, ClassVar, Iterator, Mapping, Tuple, Union, get_type_hints
+
+INCHES_PER_M = 39.37008
+# payout sensor edges per sheave turn
+EDGES_PER_REV = 12
+
+
+class ConfigError(ValueError):
+
+    def __init__(self, problems: list[str]):
+        super().__init__('; '.join(problems))
+        self.problems = problems
+
+
+def freeze(value: Any) -> Any:
+    """Read only copy of a parsed toml value: dicts become mappingproxies, lists tuples"""
+    if isinstance(value, Mapping):
+        return MappingProxyType({key: freeze(val) for key, val in value.items()})
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(val) for val in value)
+    return value
+
+
+def thaw(value: Any) -> Any:
+    """Plain dicts and lists again, e.g. to edit and rebuild a Config"""
+    if isinstance(value, Mapping):
+        return {key: thaw(val) for key, val in value.items()}
+    if isinstance(value, tuple):
+        return [thaw(val) for val in value]
+    return value
+
+
+# default of the keys that must be in the file
+_REQUIRED: Any = object()
+
+
+def setting(default: Any = _REQUIRED, *, min: Union[None, float] = None,
+            max: Union[None, float] = None, positive: bool = False):
+    """A toml key, required unless it has a default"""
+    metadata = {'min': min, 'max': max, 'positive': positive}
+    if isinstance(default, Mapping):
+        return field(default_factory=lambda: default, metadata=metadata)
+    return field(default=default, metadata=metadata)
+
+
+def derived():
+    """A value computed from the keys in __post_init__"""
+    return field(init=False, repr=False, compare=False)
+
+
+def _convert(kind: type, value: Any) -> Any:
+    # the value as `kind`, or raise TypeError
+    if kind is bool:
+        if isinstance(value, bool):
+            return value
+    elif kind is int:
+        if isinstance(value, int) and not isinstance(value, bool):
+            return value
+    elif kind is float:
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            return float(value)
+    elif kind is str:
+        if isinstance(value, str):
+            return value
+    elif isinstance(value, Mapping):
+        return freeze(value)
+    raise TypeError(type(value).__name__)
+
+
+@dataclass(frozen=True, eq=False)
+class Section(Mapping):
+    """Base of the config sections, a read only mapping of its toml keys"""
+
+    NAME: ClassVar[str] = ''
+    _KEYS: ClassVar[Tuple[str, ...]] = ()
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._KEYS = ()
+
+    @classmethod
+    def keys_(cls) -> Tuple[str, ...]:
+        if not cls._KEYS:
+            cls._KEYS = tuple(fld.name for fld in dataclasses.fields(cls) if fld.init)
+        return cls._KEYS
+
+    def __getitem__(self, key: str) -> Any:
+        if key not in self.keys_():
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.keys_())
+
+    def __len__(self) -> int:
+        return len(self.keys_())
+
+    def check(self) -> list[str]:
+        """Problems involving more than one key"""
+        return []
+
+    @classmethod
+    def build(cls, raw: Mapping, problems: list[str], unknown: list[str]) -> Union[None, 'Section']:
+        """The section from its parsed toml, adding to `problems` and `unknown`"""
+
+        kinds = get_type_hints(cls)
+        values: dict[str, Any] = {}
+        ok = True
+        for fld in dataclasses.fields(cls):
+            if not fld.init:
+                continue
+            if fld.name not in raw:
+                if fld.default is _REQUIRED:
+                    problems.append(f'[{cls.NAME}] {fld.name} missing')
+                    ok = False
+                continue
+            try:
+                value = _convert(kinds[fld.name], raw[fld.name])
+            except TypeError as e:
+                problems.append(f'[{cls.NAME}] {fld.name} is {e}, should be {kinds[fld.name].__name__}')
+                ok = False
+                continue
+            low, high = fld.metadata.get('min'), fld.metadata.get('max')
+            if (low is not None and value < low) or (high is not None and value > high) or \
+                    (fld.metadata.get('positive') and value <= 0):
+                limits = 'above 0' if fld.metadata.get('positive') else \
+                    f'from {low} to {high}' if low is not None and high is not None else \
+                    f'at least {low}' if low is not None else f'at most {high}'
+                problems.append(f'[{cls.NAME}] {fld.name} = {value} should be {limits}')
+                ok = False
+                continue
+            values[fld.name] = value
+        unknown.extend(f'[{cls.NAME}] {key}' for key in raw if key not in cls.keys_())
+        if not ok:
+            return None
+
+        section = cls(**values)
+        checks = section.check()
+        problems.extend(f'[{cls.NAME}] {problem}' for problem in checks)
+        return None if checks else section
+
+
+@dataclass(frozen=True, eq=False)
+class Mqtt(Section):
+    NAME: ClassVar[str] = 'mqtt'
+
+    HOST: str = setting()
+    PORT: int = setting(min=1, max=65535)
+    CTD_DATA_TOPIC: str = setting()
+    CTD_CMD_TOPIC: str = setting()
+    WINCH_CMD_TOPIC: str = setting()
+    WINCH_PAUSE_TOPIC: str = setting()
+    WINCH_LATCH_TOPIC: str = setting('rift-ox/winch/latch')
+    WINCH_PLAN_TOPIC: str = setting('rift-ox/winch/plan')
+    REMOTE_HOST: str = setting('')
+
+    AWS_ENDPOINT: str = setting()
+    AWS_PORT: int = setting(min=1, max=65535)
+    AWS_ROOT_CA_FILE: str = setting()
+    AWS_CERT_FILE: str = setting()
+    AWS_PRIV_KEY_FILE: str = setting()
+    AWS_DATA_TOPIC: str = setting()
+    AWS_RIFT_OX_CLIENT_ID: str = setting()
+
+    def check(self) -> list[str]:
+        if not self.AWS_RIFT_OX_CLIENT_ID.startswith('rift-ox-'):
+            return [f"AWS_RIFT_OX_CLIENT_ID {self.AWS_RIFT_OX_CLIENT_ID} must start with 'rift-ox-'"]
+        return []
+
+
+@dataclass(frozen=True, eq=False)
+class Winch(Section):
+    NAME: ClassVar[str] = 'winch'
+
+    STAGING_DEPTH: float = setting(min=0)
+    MAX_DEPTH: float = setting(positive=True)
+    MIN_ALTITUDE: float = setting(max=100)
+    DEPTH_OFFSET_M: float = setting()
+    PAUSE_DURATION_SECS: float = setting(min=0)
+    BOTTLE_PAUSE_DURATION_SECS: float = setting(min=0)
+
+    PARKING_DOWNCAST_MS: int = setting(min=0)
+    UNPARKING_UPCAST_MS: int = setting(min=0)
+    UNPARKING_DOWNCAST_MS: int = setting(min=0)
+    PARKING_LATCH_POLL_MS: int = setting(20, min=1)
+    PARKING_TIMEOUT_SECS: float = setting(60.0, positive=True)
+    PARKING_MAX_POLL_ERRORS: int = setting(3, min=1)
+
+    PAYOUT_RATE_MPS: float = setting(0.67, positive=True)
+    BATHYMETRY_DEPTH_M: float = setting(0.0, min=0)
+    PLAN_REVISE_M: float = setting(1.0, min=0)
+
+    NO_PARKING: bool = setting(False)
+    STATUS_DEPTH_DELTA_M: float = setting(0.05, min=0)
+
+    SEA_CABLE_DIAMETER_INCH: float = setting(positive=True)
+    SHEAVE_RADIUS_INCH: float = setting(positive=True)
+
+    # cable paid out per payout sensor edge: a turn of the sheave, out to the cable's centre, per EDGES_PER_REV
+    m_per_edge: float = derived()
+
+    def __post_init__(self):
+        circumference_inch = 2 * pi * (self.SHEAVE_RADIUS_INCH + self.SEA_CABLE_DIAMETER_INCH / 2)
+        object.__setattr__(self, 'm_per_edge', circumference_inch / EDGES_PER_REV / INCHES_PER_M)
+
+    def check(self) -> list[str]:
+        problems = []
+        if self.STAGING_DEPTH >= self.MAX_DEPTH:
+            problems.append(f'STAGING_DEPTH {self.STAGING_DEPTH:g} should be above MAX_DEPTH {self.MAX_DEPTH:g}')
+        # parking reels in from STAGING_DEPTH
+        park_secs = self.STAGING_DEPTH / self.PAYOUT_RATE_MPS
+        if self.PARKING_TIMEOUT_SECS <= park_secs:
+            problems.append(f'PARKING_TIMEOUT_SECS {self.PARKING_TIMEOUT_SECS:g} should be more than the '
+                            f'{park_secs:.0f} secs to reel in STAGING_DEPTH at PAYOUT_RATE_MPS')
+        return problems
+
+
+@dataclass(frozen=True)
+class OutputPin:
+    """A DIO output line and the MCU commands for it"""
+
+    group: int
+    pin: int
+    high: str = derived()
+    low: str = derived()
+    get: str = derived()
+
+    def __post_init__(self):
+        object.__setattr__(self, 'high', f'dio set DO_G{self.group} {self.pin} high\r')
+        object.__setattr__(self, 'low', f'dio set DO_G{self.group} {self.pin} low\r')
+        object.__setattr__(self, 'get', f'dio get DO_G{self.group} output {self.pin}\r')
+
+
+@dataclass(frozen=True)
+class InputPin:
+    """A DIO input line and the MCU commands for it"""
+
+    group: int
+    pin: int
+    get: str = derived()
+    edge: str = derived()
+
+    def __post_init__(self):
+        object.__setattr__(self, 'get', f'dio get DI_G{self.group} input {self.pin}\r')
+        object.__setattr__(self, 'edge', f'dio edge DI_G{self.group} {self.pin}\r')
+
+
+@dataclass(frozen=True, eq=False)
+class RiftOxPi(Section):
+    NAME: ClassVar[str] = 'rift-ox-pi'
+
+    REALTIME_CTD: bool = setting(False)
+    SIMULATION: bool = setting(False)
+    SKIP_AWS: bool = setting(False)
+
+    LOG_DIR: str = setting()
+    PAYOUT_FN: str = setting('payouts')
+    PAYOUT_FLUSH_SECS: float = setting(5.0, min=0)
+
+    DIO_PORT: str = setting()
+    INVERTER_CMD_PORT: str = setting('')
+    DIO_SHADOW_VERIFY_SECS: float = setting(10.0, min=0)
+
+    # the MCU has digital groups DO_G0..3 and DI_G0..3
+    DIO_MOTOR_STOP_GROUP: int = setting(min=0, max=3)
+    DIO_MOTOR_STOP_PIN: int = setting(min=0)
+    DIO_UPCAST_GROUP: int = setting(min=0, max=3)
+    DIO_UPCAST_PIN: int = setting(min=0)
+    DIO_DOWNCAST_GROUP: int = setting(min=0, max=3)
+    DIO_DOWNCAST_PIN: int = setting(min=0)
+    DIO_LATCH_RELEASE_GROUP: int = setting(min=0, max=3)
+    DIO_LATCH_RELEASE_PIN: int = setting(min=0)
+
+    DIO_PAYOUT1_SENSOR_GROUP: int = setting(min=0, max=3)
+    DIO_PAYOUT1_SENSOR_PIN: int = setting(min=0)
+    DIO_PAYOUT2_SENSOR_GROUP: int = setting(min=0, max=3)
+    DIO_PAYOUT2_SENSOR_PIN: int = setting(min=0)
+    DIO_LATCH_SENSOR_GROUP: int = setting(min=0, max=3)
+    DIO_LATCH_SENSOR_PIN: int = setting(min=0)
+
+    # 'stop', 'up', 'down', 'latch' (release)
+    output_pins: Mapping[str, OutputPin] = derived()
+    # 'payout1', 'payout2', 'latch' (sensor)
+    input_pins: Mapping[str, InputPin] = derived()
+
+    def __post_init__(self):
+        object.__setattr__(self, 'output_pins', MappingProxyType({
+            'stop': OutputPin(self.DIO_MOTOR_STOP_GROUP, self.DIO_MOTOR_STOP_PIN),
+            'up': OutputPin(self.DIO_UPCAST_GROUP, self.DIO_UPCAST_PIN),
+            'down': OutputPin(self.DIO_DOWNCAST_GROUP, self.DIO_DOWNCAST_PIN),
+            'latch': OutputPin(self.DIO_LATCH_RELEASE_GROUP, self.DIO_LATCH_RELEASE_PIN),
+        }))
+        object.__setattr__(self, 'input_pins', MappingProxyType({
+            'payout1': InputPin(self.DIO_PAYOUT1_SENSOR_GROUP, self.DIO_PAYOUT1_SENSOR_PIN),
+            'payout2': InputPin(self.DIO_PAYOUT2_SENSOR_GROUP, self.DIO_PAYOUT2_SENSOR_PIN),
+            'latch': InputPin(self.DIO_LATCH_SENSOR_GROUP, self.DIO_LATCH_SENSOR_PIN),
+        }))
+
+    def check(self) -> list[str]:
+        problems = []
+        for kind, pins in (('output', self.output_pins), ('input', self.input_pins)):
+            seen: dict[Tuple[int, int], str] = {}
+            for name, line in pins.items():
+                other = seen.setdefault((line.group, line.pin), name)
+                if other != name:
+                    problems.append(f'{name} and {other} {kind} pins are both G{line.group} {line.pin}')
+        return problems
+
+
+@dataclass(frozen=True, eq=False)
+class Bottles(Section):
+    NAME: ClassVar[str] = 'bottles'
+
+    PAUSE_DEPTHS_FN: str = setting()
+
+
+@dataclass(frozen=True, eq=False)
+class Logging(Section):
+    NAME: ClassVar[str] = 'logging'
+
+    LEVEL: str = setting('INFO')
+    CONSOLE_LEVEL: str = setting('INFO')
+    MAX_BYTES: int = setting(5000000, positive=True)
+    BACKUP_COUNT: int = setting(5, min=0)
+    RATE_LIMIT_SECS: float = setting(10.0, min=0)
+    # module name -> LEVEL
+    LEVELS: Mapping = setting(MappingProxyType({}))
+
+    def check(self) -> list[str]:
+        levels = {'LEVEL': self.LEVEL, 'CONSOLE_LEVEL': self.CONSOLE_LEVEL,
+                  **{f'LEVELS {name}': level for name, level in self.LEVELS.items()}}
+        return [f'{key} {level} is not a log level' for key, level in levels.items()
+                if not isinstance(logging.getLevelName(str(level).upper()), int)]
+
+
+@dataclass(frozen=True, eq=False)
+class Metrics(Section):
+    NAME: ClassVar[str] = 'metrics'
+
+    ENABLED: bool = setting(False)
+    INTERVAL_SECS: float = setting(10.0, positive=True)
+    TOPIC: str = setting('rift-ox/metrics')
+    PROM_DIR: str = setting('dev/logs/metrics')
+
+
+@dataclass(frozen=True, eq=False)
+class Profiling(Section):
+    NAME: ClassVar[str] = 'profiling'
+
+    DIR: str = setting('dev/logs/profiles')
+    DEFAULT_SECS: float = setting(60.0, positive=True)
+    MAX_SECS: float = setting(600.0, positive=True)
+    INTERVAL_MS: float = setting(10.0, positive=True)
+    TRACEMALLOC: bool = setting(True)
+    TRACEMALLOC_FRAMES: int = setting(10, min=1)
+    TOP_ALLOCATIONS: int = setting(25, min=1)
+
+
+@dataclass(frozen=True, eq=False)
+class Reload(Section):
+    NAME: ClassVar[str] = 'reload'
+
+    WATCH: bool = setting(True)
+    POLL_SECS: float = setting(2.0, positive=True)
+
+
+# attribute name -> section class; those with no default instance must be in the file
+SECTIONS: Mapping[str, type] = MappingProxyType({
+    'mqtt': Mqtt,
+    'winch': Winch,
+    'rift_ox_pi': RiftOxPi,
+    'bottles': Bottles,
+    'logging': Logging,
+    'metrics': Metrics,
+    'profiling': Profiling,
+    'reload': Reload,
+})
+REQUIRED = ('mqtt', 'winch', 'rift_ox_pi', 'bottles')
+_ATTRS = MappingProxyType({cls.NAME: attr for attr, cls in SECTIONS.items()})
+
+INSTANCES = 'instances'
+_INSTANCE_NAME = re.compile(r'[A-Za-z0-9_-]+')
+# [mqtt] keys each instance has its own of, unless it sets them
+INSTANCE_TOPICS = ('CTD_DATA_TOPIC', 'CTD_CMD_TOPIC', 'WINCH_CMD_TOPIC', 'WINCH_PAUSE_TOPIC',
+                   'WINCH_LATCH_TOPIC', 'WINCH_PLAN_TOPIC')
+
+
+def _namespaced(topic: str, name: str) -> str:
+    # rift-ox/winch/cmd -> rift-ox/<name>/winch/cmd
+    first, sep, rest = topic.partition('/')
+    return f'{first}/{name}/{rest}' if sep else f'{topic}/{name}'
+
+
+def _instance_raw(base: Mapping, overrides: Mapping, name: str) -> dict:
+    # the parsed config of instance `name`: the main one, namespaced, with its tables over it
+    raw = thaw(base)
+    raw.pop(INSTANCES, None)
+    mqtt_raw, pi_raw = raw['mqtt'], raw['rift-ox-pi']
+    for key in INSTANCE_TOPICS:
+        mqtt_raw[key] = _namespaced(mqtt_raw[key], name)
+    mqtt_raw['AWS_RIFT_OX_CLIENT_ID'] = f"{mqtt_raw['AWS_RIFT_OX_CLIENT_ID']}-{name}"
+    pi_raw['PAYOUT_FN'] = f"{pi_raw['PAYOUT_FN']}-{name}"
+    for section, values in overrides.items():
+        if section != 'NAME':
+            raw.setdefault(section, {}).update(thaw(values))
+    return raw
+
+
+@dataclass(frozen=True, eq=False)
+class Config(Mapping):
+    """The whole config file, a read only mapping of section name to section"""
+
+    mqtt: Mqtt
+    winch: Winch
+    rift_ox_pi: RiftOxPi
+    bottles: Bottles
+    logging: Logging = field(default_factory=Logging)
+    metrics: Metrics = field(default_factory=Metrics)
+    profiling: Profiling = field(default_factory=Profiling)
+    reload: Reload = field(default_factory=Reload)
+    # sections not in the schema, as read
+    extra: Mapping = field(default_factory=lambda: MappingProxyType({}))
+    # '[section] KEY' of keys not in the schema, ignored
+    unknown: Tuple[str, ...] = ()
+    # '' for the main config, else its [[instances]] NAME
+    name: str = ''
+    instances: Tuple['Config', ...] = ()
+
+    @classmethod
+    def from_dict(cls, raw: Mapping) -> 'Config':
+        """Check and convert a parsed config file, raising ConfigError with every problem found"""
+
+        problems: list[str] = []
+        unknown: list[str] = []
+        sections: dict[str, Section] = {}
+        for attr, section_cls in SECTIONS.items():
+            section_raw = raw.get(section_cls.NAME)
+            if section_raw is None:
+                if attr in REQUIRED:
+                    problems.append(f'[{section_cls.NAME}] missing')
+                continue
+            if not isinstance(section_raw, Mapping):
+                problems.append(f'[{section_cls.NAME}] is not a table')
+                continue
+            section = section_cls.build(section_raw, problems, unknown)
+            if section is not None:
+                sections[attr] = section
+        if problems:
+            raise ConfigError(problems)
+
+        extra = freeze({name: value for name, value in raw.items() if name not in _ATTRS})
+        cfg = cls(**sections, extra=extra, unknown=tuple(unknown))
+        if INSTANCES not in raw:
+            return cfg
+        instances = cfg._build_instances(raw[INSTANCES], problems, unknown)
+        if problems:
+            raise ConfigError(problems)
+        return dataclasses.replace(cfg, unknown=tuple(unknown), instances=instances)
+
+    def _build_instances(self, tables: Any, problems: list[str], unknown: list[str]) -> Tuple['Config', ...]:
+        # a Config per [[instances]] table, adding to `problems` and `unknown`
+
+        if not isinstance(tables, (list, tuple)) or not all(isinstance(table, Mapping) for table in tables):
+            problems.append(f'[[{INSTANCES}]] should be tables')
+            return ()
+        instances = []
+        for ndx, table in enumerate(tables):
+            name = table.get('NAME')
+            if not isinstance(name, str) or not _INSTANCE_NAME.fullmatch(name):
+                problems.append(f'[[{INSTANCES}]] {ndx + 1} NAME = {name!r} should be letters, digits, _ and -')
+                continue
+            not_tables = [section for section, values in table.items()
+                          if section != 'NAME' and not isinstance(values, Mapping)]
+            if not_tables:
+                problems.extend(f'[[{INSTANCES}]] {name}: {section} is not a table' for section in not_tables)
+                continue
+            try:
+                instance = Config.from_dict(_instance_raw(self, table, name))
+            except ConfigError as e:
+                problems.extend(f'[[{INSTANCES}]] {name}: {problem}' for problem in e.problems)
+                continue
+            unknown.extend(f'[[{INSTANCES}]] {name}: {key}' for key in instance.unknown)
+            instances.append(dataclasses.replace(instance, name=name))
+
+        # the instances may not share a name, winch or command topic
+        for what, value_of in (('NAME', lambda cfg: cfg.name),
+                               ('[rift-ox-pi] DIO_PORT', lambda cfg: cfg.rift_ox_pi.DIO_PORT),
+                               ('[mqtt] WINCH_CMD_TOPIC', lambda cfg: cfg.mqtt.WINCH_CMD_TOPIC)):
+            seen: dict[str, str] = {}
+            for cfg in (self, *instances):
+                value = value_of(cfg)
+                if value in seen:
+                    problems.append(f'[[{INSTANCES}]] {cfg.name}: {what} {value} is '
+                                    f'already {seen[value] or "the main config"}\'s')
+                seen.setdefault(value, cfg.name)
+        return tuple(instances)
+
+    @property
+    def systems(self) -> Tuple['Config', ...]:
+        """This config followed by its instances, a winch and CTD each"""
+        return (self, *self.instances)
+
+    def instance(self, name: str) -> 'Config':
+        """The config of instance `name`, '' for the main one"""
+        for cfg in self.systems:
+            if cfg.name == name:
+                return cfg
+        raise KeyError(name)
+
+    def client_id(self, base: str) -> str:
+        """A daemon name or MQTT client id for this instance, unique among the instances"""
+        return f'{base}-{self.name}' if self.name else base
+
+    @property
+    def metric_labels(self) -> Mapping[str, str]:
+        """Labels telling this instance's metrics from the others'"""
+        return {'winch': self.name} if self.name else {}
+
+    def replace(self, section: str, **changes: Any) -> 'Config':
+        """A checked copy with some keys of `section` changed, its instances as they are:
+
+            cfg = cfg.replace('winch', MAX_DEPTH=40)
+        """
+        raw = thaw(self)
+        raw.setdefault(section, {}).update(changes)
+        return dataclasses.replace(Config.from_dict(raw), name=self.name, instances=self.instances)
+
+    def __getitem__(self, name: str) -> Any:
+        attr = _ATTRS.get(name)
+        if attr is not None:
+            return getattr(self, attr)
+        return self.extra[name]
+
+    def __iter__(self) -> Iterator[str]:
+        yield from _ATTRS
+        yield from self.extra
+
+    def __len__(self) -> int:
+        return len(_ATTRS) + len(self.extra)
@@ -0,0 +1,272 @@
+#!/usr/bin/env python3
+
+"""Config reloading while the daemons run (see [reload] in rift-ox.toml).
+
+LiveConfig holds the running Config, which is frozen, and a version
+number. When rift-ox.toml changes on disk it is parsed and checked against
+the schema, and a new Config is swapped in whole, so a thread never sees half of an edit.
+Threads pick up the new one at the top of their loop:
+
+    if live.version != cfg_version:
+        cfg, cfg_version = live.get(cfg.name)
+
+Only the LIVE_SECTIONS are taken from the new file, changes anywhere else
+(ports, pins, topics, [[instances]]) need a restart and are logged as
+such. The instances are rebuilt over the new main sections, so an edit to
+the main [winch] reaches every instance that does not set the key itself.
+
+Other files (the pause depths) can be watched through the same thread with
+watch(path, callback); the callback runs on the watcher thread.
+
+Files are watched with inotify on Linux and by polling their mtime and
+size every POLL_SECS elsewhere.
+"""
+
+import ctypes
+import ctypes.util
+import logging
+import os
+from pathlib import Path
+import select
+import struct
+import threading
+from typing import Any, Callable, Tuple, Union
+
+import toml
+
+from .schema import Config, ConfigError, thaw
+
+logger = logging.getLogger(__name__)
+
+# sections applied to the running daemons when rift-ox.toml changes
+LIVE_SECTIONS = ('winch', 'logging')
+
+
+def _signature(path: Path) -> Union[None, Tuple[int, int]]:
+    try:
+        stat = path.stat()
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+def _changed(running: Any, new: Any) -> bool:
+    # keys the running config ignored are not a change
+    if isinstance(running, dict) and isinstance(new, dict):
+        return any(key in running and running[key] != value for key, value in new.items())
+    return running != new
+
+
+class _Inotify:
+    """Just enough of inotify(7), through libc, to hear about files in a few directories being written"""
+
+    IN_CLOSE_WRITE = 0x008
+    IN_MOVED_TO = 0x080
+    IN_CREATE = 0x100
+    EVENT = struct.Struct('iIII')
+
+    def __init__(self):
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        self._add_watch = libc.inotify_add_watch
+        self._add_watch.argtypes = (ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32)
+        self.fd: int = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1')
+        self.dirs: dict[int, Path] = {}
+
+    def add_dir(self, path: Path):
+        if path in self.dirs.values():
+            return
+        wd = self._add_watch(self.fd, bytes(path), self.IN_CLOSE_WRITE | self.IN_MOVED_TO | self.IN_CREATE)
+        if wd < 0:
+            raise OSError(ctypes.get_errno(), f'inotify_add_watch {path}')
+        self.dirs[wd] = path
+
+    def read(self, timeout: float) -> set[Path]:
+        """Paths written, or moved or created, within `timeout` secs"""
+
+        changed: set[Path] = set()
+        if not select.select([self.fd], [], [], timeout)[0]:
+            return changed
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return changed
+        ndx = 0
+        while ndx + self.EVENT.size <= len(data):
+            wd, _, _, name_len = self.EVENT.unpack_from(data, ndx)
+            ndx += self.EVENT.size
+            name = data[ndx:ndx + name_len].rstrip(b'\0').decode(errors='replace')
+            ndx += name_len
+            if wd in self.dirs and name:
+                changed.add(self.dirs[wd].joinpath(name))
+        return changed
+
+    def close(self):
+        os.close(self.fd)
+
+
+class FileWatcher:
+    """Calls back when a watched file's mtime or size changes"""
+
+    # editors write in several goes, wait this long after the first event for the rest
+    SETTLE_SECS = 0.2
+
+    def __init__(self, poll_secs: float = 2.0):
+        self.poll_secs = poll_secs
+        self.lock = threading.Lock()
+        self.files: dict[Path, list[Callable[[Path], None]]] = {}
+        self.signatures: dict[Path, Union[None, Tuple[int, int]]] = {}
+        self.inotify: Union[None, _Inotify] = None
+
+    def watch(self, path: Path, callback: Callable[[Path], None]):
+        path = Path(path).absolute()
+        with self.lock:
+            if path not in self.files:
+                self.files[path] = []
+                self.signatures[path] = _signature(path)
+                if self.inotify is not None:
+                    self._add_dir(path.parent)
+            self.files[path].append(callback)
+
+    def _add_dir(self, path: Path):
+        try:
+            self.inotify.add_dir(path)
+        except OSError as e:
+            logger.warning('not watching %s (%s), polling every %gs', path, e, self.poll_secs)
+
+    def check(self):
+        """Call back for each watched file that changed since the last check"""
+
+        with self.lock:
+            changed = []
+            for path, callbacks in self.files.items():
+                signature = _signature(path)
+                if signature != self.signatures[path]:
+                    self.signatures[path] = signature
+                    if signature is not None:
+                        changed.append((path, list(callbacks)))
+        for path, callbacks in changed:
+            logger.info('%s changed', path)
+            for callback in callbacks:
+                try:
+                    callback(path)
+                except Exception as e:
+                    logger.exception('ERROR handling change to %s: %s', path, e)
+
+    def run(self, quit_evt: threading.Event):
+
+        try:
+            self.inotify = _Inotify()
+            with self.lock:
+                for path in self.files:
+                    self._add_dir(path.parent)
+        except (OSError, AttributeError, TypeError) as e:
+            # no inotify (not Linux), poll instead
+            logger.info('inotify unavailable (%s), polling every %gs', e, self.poll_secs)
+            self.inotify = None
+
+        while not quit_evt.is_set():
+            if self.inotify is None:
+                quit_evt.wait(self.poll_secs)
+                self.check()
+                continue
+            # wake up now and then for quit_evt, and check anyway in case an event was missed
+            changed = self.inotify.read(self.poll_secs)
+            if changed & set(self.files):
+                quit_evt.wait(self.SETTLE_SECS)
+            self.check()
+
+        if self.inotify is not None:
+            self.inotify.close()
+
+
+class LiveConfig:
+    """The latest good config snapshot, replaced whole when the config file changes"""
+
+    def __init__(self, cfg: Config, config_path: Path, poll_secs: Union[None, float] = None):
+        self.path = Path(config_path).absolute()
+        self.watcher = FileWatcher(poll_secs or cfg.reload.POLL_SECS)
+        self.lock = threading.Lock()
+        self._snapshot: Config = cfg
+        self._version = 0
+        self.subscribers: list[Callable[[Config], None]] = []
+
+    def get(self, name: str = '') -> Tuple[Config, int]:
+        """The snapshot of instance `name`, '' for the main config, and its version"""
+        with self.lock:
+            return self._snapshot.instance(name), self._version
+
+    @property
+    def version(self) -> int:
+        return self._version
+
+    def subscribe(self, callback: Callable[[Config], None]):
+        """Call back with each new snapshot, on the watcher thread"""
+        self.subscribers.append(callback)
+
+    def watch(self, path: Path, callback: Callable[[Path], None]):
+        self.watcher.watch(path, callback)
+
+    def reload(self, path: Union[None, Path] = None) -> bool:
+        """Re-read the config file and swap in its LIVE_SECTIONS. Returns
+        False, keeping the running config, if it does not parse or check out."""
+
+        try:
+            new = toml.load(self.path)
+        except (OSError, toml.TomlDecodeError) as e:
+            logger.error('CONFIG ERROR: %s not reloaded: %s', self.path, e)
+            return False
+
+        running, _ = self.get()
+        old = thaw(running)
+        merged = thaw(running)
+        problems = [f'[{section}] missing' for section in LIVE_SECTIONS if section in old and section not in new]
+        for section in new:
+            if section in LIVE_SECTIONS:
+                merged[section] = new[section]
+            elif _changed(old.get(section), new[section]):
+                logger.warning('CONFIG: changes to [%s] need a restart, not applied', section)
+        try:
+            snapshot = Config.from_dict(merged)
+        except ConfigError as e:
+            problems += e.problems
+        if problems:
+            logger.error('CONFIG ERROR: %s not reloaded: %s', self.path, '; '.join(problems))
+            return False
+        for key in snapshot.unknown:
+            logger.warning('CONFIG: %s unknown, ignored', key)
+
+        # compared as converted, so 300 -> 300.0 is not a change
+        new_cfg = thaw(snapshot)
+        changed = [f'[{section}] {key}' for section in LIVE_SECTIONS if section in new_cfg
+                   for key, value in new_cfg[section].items() if old.get(section, {}).get(key) != value]
+        if not changed:
+            return True
+
+        with self.lock:
+            self._snapshot = snapshot
+            self._version += 1
+            version = self._version
+        logger.info('CONFIG: v%d applied %s', version, ', '.join(changed))
+        for callback in self.subscribers:
+            callback(snapshot)
+        return True
+
+    def start(self, quit_evt: threading.Event) -> threading.Thread:
+        self.watcher.watch(self.path, self.reload)
+        thr = threading.Thread(target=self.watcher.run, args=(quit_evt,), name='config-watch', daemon=True)
+        thr.start()
+        return thr
+
+
+def start(cfg: Config, quit_evt: threading.Event) -> Union[None, LiveConfig]:
+    """Watch $RIFT_OX_CONFIG_FILE, unless [reload] WATCH is false"""
+
+    from . import path
+    config_path = path()
+    if not cfg.reload.WATCH or config_path is None:
+        return None
+    live = LiveConfig(cfg, config_path)
+    live.start(quit_evt)
+    return live
@@ -13,22 +13,16 @@ import serial
 import signal
 import pytz
 
-# {'temp_c': 2.7479, 
-# 'cond': 3.0075, 
-# 'pres': 0.637, 
-# 'volt0': 4.9928, 
-# 'alt_m': 99.86, 
-# 'volt2': 1.5949, 
-# 'depth_m': 0.63, 
-# 'lat': 74.80584, 
-# 'lon': 103.65894, 
-# 'ts': 1705377669.34,
-# 'type': 'ctd'
-# }
+# 2BC30D103CA5018861A67EACBD19138B5974E941 {"t_c": 18.6798, "cond": 0.0641,
+# "pres": 0.449, "v0": 3.2519, "alt_m": 65.04, "dep_m": 0.45, "lat": 32.86806,
+# "lon": -117.25266, "v2": 3.3738, "ts": 1705377669.34, "type": "ctd", "c_id": "rift-ox-1", "wsta": "NYI"}
+
+# sample JSON keys that are not CSV columns (type goes last, after hts)
+SKIP_KEYS = ('type', 'c_id', 'wsta')
 
 ### reads from source raw ctdmon serialport.log file
-### and cnverts all valid data lines (start with 40 hex byte string)
-### to CSV
+### and cnverts all valid data lines (hex frame followed by the sample JSON)
+### to CSV, a column for every key in the logged samples
 
 if __name__ == "__main__":
 
@@ -40,12 +34,21 @@ if __name__ == "__main__":
     args = parser.parse_args()
 
     serialport_fn = abspath(expanduser(args.logfile))
-    hex_regex = r'[0-9[A-F]{40} '
+    hex_regex = r'^[0-9A-F]+ {'
     json_str: str
 
+    # the columns are the keys of the logged samples, in the order they first appear,
+    # so whatever channels the CTD was configured with are all kept
+    csv_keys: list[str] = []
+    with open(serialport_fn, 'rt') as ifl:
+        for line in ifl:
+            if re.search(hex_regex, line):
+                json_str = line.split(maxsplit=1)[1].strip()
+                csv_keys += [key for key in json.loads(json_str) if key not in SKIP_KEYS and key not in csv_keys]
+
     with open(serialport_fn, 'rt') as ifl, open('serialport.csv', 'wt') as ofl:
 
-        ofl.write('temp_c,cond,pres,volt0,alt_m,volt2,depth_m,lat,lon,ts,type\n')
+        ofl.write(','.join(csv_keys) + ',hts,type\n')
 
         line = ifl.readline()
         while line != '':  # The EOF char is an empty string
@@ -54,9 +57,7 @@ if __name__ == "__main__":
                 json_str = line.split(maxsplit=1)[1].strip()
                 jobj = json.loads(json_str)
                 hts: str = datetime.fromtimestamp(jobj['ts'], tz=pytz.UTC).isoformat(timespec='milliseconds')
-                ofl.write(f"{jobj['temp_c']}, {jobj['cond']}, {jobj['pres']}, {jobj['volt0']}, {jobj['alt_m']}, {jobj['volt2']}, {jobj['depth_m']}, {jobj['lat']}, {jobj['lon']}, {jobj['ts']}, {hts}, '{jobj['type']}'\n")
+                values = ', '.join(str(jobj.get(key, '')) for key in csv_keys)
+                ofl.write(f"{values}, {hts}, '{jobj['type']}'\n")
                 
             line = ifl.readline()
-            
-
-       
@@ -2,7 +2,9 @@
 
 import argparse
 import json
+import logging
 from os.path import abspath, expanduser
+from pathlib import Path
 import queue
 import shlex
 import signal
@@ -15,6 +17,13 @@ from awscrt import mqtt as awsmqtt
 from awsiot import mqtt_connection_builder
 
 import config
+import config.watch
+from config import Config
+import log
+import metrics
+import mqttbus
+import profiling
+from sbe19v2plus.sample import CTDSample
 from sbe19v2plus.sbe33_serialport import SBE33SerialDataPort
 
 SBE33_MENU_TOGGLE_CMD = '@'
@@ -24,6 +33,8 @@ COMMANDS_CTD = ['getcd', 'getsd', 'gethd', 'ds', 'tt', 'startnow', 'stop', 'wake
                 'setvolttype', 'setvoltsn', 'volt', 'outputsal=', 'profilemode']
 COMMANDS_SBE33 = [str(num) for num in range(1,10)]
 
+logger = logging.getLogger('ctdmon')
+
 
 def process_commands(ctd : SBE33SerialDataPort):
 
@@ -123,33 +134,42 @@ def process_commands(ctd : SBE33SerialDataPort):
 
         time.sleep(2)
 
-    print('user input thread shutting down...')
+    logger.info('user input thread shutting down...')
     
     return
 
 
-def data_relay_loop(cfg: dict, data_q : queue.Queue, quit_evt : threading.Event):
+def data_relay_loop(cfg: Config, data_q : queue.Queue, quit_evt : threading.Event):
+
+    # publish() to PUBCOMP from the local broker, by message id
+    publish_time = metrics.histogram('ctd_publish_seconds', 'CTD data publish to PUBCOMP from the local broker')
+    publish_starts: dict[int, float] = {}
+
+    def on_publish(mid: int):
+        t0 = publish_starts.pop(mid, None)
+        if t0 is not None:
+            publish_time.observe_since(t0)
 
-    client : mqtt.Client = mqtt.Client('ctdmon')
-    client.connect('localhost', 1883)
-    client.loop_start()
+    client = mqttbus.connection()
+    client.on_publish(on_publish)
 
     # Callback when connection is accidentally lost.
     def on_connection_interrupted(connection, error, **kwargs):
-        print("Connection interrupted. error: {}".format(error))
+        logger.error('Connection interrupted. error: %s', error)
 
     # Callback when an interrupted connection is re-established.
     def on_connection_resumed(connection, return_code, session_present, **kwargs):
-        print("Connection resumed. return_code: {} session_present: {}".format(return_code, session_present))
-
-    skip_aws: bool = cfg['rift-ox-pi']['SKIP_AWS']
-    client_id = cfg['mqtt']['AWS_RIFT_OX_CLIENT_ID']
-    endpoint = cfg['mqtt']['AWS_ENDPOINT']
-    aws_topic = cfg['mqtt']['AWS_DATA_TOPIC']
-    port = cfg['mqtt']['AWS_PORT']
-    rootca_fn = abspath(expanduser(cfg['mqtt']['AWS_ROOT_CA_FILE']))
-    cert_fn = abspath(expanduser(cfg['mqtt']['AWS_CERT_FILE']))
-    privkey_fn = abspath(expanduser(cfg['mqtt']['AWS_PRIV_KEY_FILE']))
+        logger.info('Connection resumed. return_code: %s session_present: %s', return_code, session_present)
+
+    skip_aws: bool = cfg.rift_ox_pi.SKIP_AWS
+    client_id = cfg.mqtt.AWS_RIFT_OX_CLIENT_ID
+    endpoint = cfg.mqtt.AWS_ENDPOINT
+    aws_topic = cfg.mqtt.AWS_DATA_TOPIC
+    port = cfg.mqtt.AWS_PORT
+    rootca_fn = abspath(expanduser(cfg.mqtt.AWS_ROOT_CA_FILE))
+    cert_fn = abspath(expanduser(cfg.mqtt.AWS_CERT_FILE))
+    privkey_fn = abspath(expanduser(cfg.mqtt.AWS_PRIV_KEY_FILE))
+    topic = cfg.mqtt.CTD_DATA_TOPIC
     if not skip_aws:
        # Create a MQTT connection using AWS SDK
         awsclient = mqtt_connection_builder.mtls_from_path(
@@ -167,26 +187,25 @@ def data_relay_loop(cfg: dict, data_q : queue.Queue, quit_evt : threading.Event)
         connect_future = awsclient.connect()
         # Future.result() waits until a result is available
         connect_future.result()
-        print("awsclient connected!")
+        logger.info('awsclient connected!')
 
     while not quit_evt.is_set():
 
         try:
-            msg = data_q.get(block=True, timeout=1)
+            sample: CTDSample = data_q.get(block=True, timeout=1)
             data_q.task_done()
 
-            # add client_id & winch state (NYI)
-            msg['c_id'] = client_id
-            msg['wsta'] = "NYI"
-            # Convert the dictionary to bytes
-            json_str = json.dumps(msg)
-            bytes_data = json_str.encode("utf-8")
-            # Print the bytes data
-            client.publish(cfg["mqtt"]["CTD_DATA_TOPIC"], bytes_data, qos=2)
+            # client_id & winch state were stamped on by the serial port reader,
+            # and the JSON was already built when the sample was logged
+            bytes_data = sample.to_json_bytes()
+            t0 = publish_time.start()
+            msg_info = client.publish(topic, bytes_data, qos=2)
+            if metrics.enabled():
+                publish_starts[msg_info.mid] = t0
             if not skip_aws:
                 awsclient.publish(
                     topic=aws_topic,
-                    payload=json_str,
+                    payload=bytes_data,
                     qos=awsmqtt.QoS.AT_LEAST_ONCE)
 
         except queue.Empty as e:
@@ -199,9 +218,6 @@ def data_relay_loop(cfg: dict, data_q : queue.Queue, quit_evt : threading.Event)
         disconnect_future = awsclient.disconnect()
         disconnect_future.result()
 
-    client.loop_stop()
-    client.disconnect()
-
 
 def interrupt_handler(signum, frame):
 
@@ -225,58 +241,75 @@ def main(quit_evt : threading.Event):
                         default="9600", type=str)
     parser.add_argument('--max-alt-voltage', help="VA500 full range voltage in Volts", 
                         default=5, type=int)
+    parser.add_argument('--output-format', help="CTD output format: 1 (converted HEX) or 3 (converted decimal, for debugging)", 
+                        default=1, type=int, choices=[1, 3])
+    parser.add_argument('--instance', help="NAME of the [[instances]] table whose CTD this is, the main config's if not given",
+                        default='', type=str)
 
     args = parser.parse_args()
 
     serialport = args.serialport
     baud = int(args.baud)
     altimeter_max_volts = args.max_alt_voltage
+    output_format = args.output_format
 
     # ctd_config = sbe19v2plus.config.Config(
     #     mode = sbe19v2plus.config.SBE19Mode.PROFILE_MODE, 
     #     output_format = sbe19v2plus.config.SBE19OutputFmt.OUTPUT_FORMAT_1,
     #     data_chan_volt0=True, data_chan_volt2=True
     # )
-    cfg = config.read()
-    if cfg == None:
+    main_cfg = config.read()
+    if main_cfg == None:
         print(f'ctdmon: ERROR unable to read rift-ox.toml config file. Quitting.')
         sys.exit(1)
+    try:
+        cfg = main_cfg.instance(args.instance)
+    except KeyError:
+        print(f'ctdmon: ERROR no [[instances]] NAME {args.instance} in rift-ox.toml. Quitting.')
+        sys.exit(1)
+    # ctdmon-<NAME> for an instance's CTD: its own log file, metrics and client id
+    daemon = cfg.client_id('ctdmon')
+
+    log.setup(cfg, daemon)
+    # one connection for the data relay, the external commands and the metrics
+    bus = mqttbus.start(cfg, daemon)
+    metrics.start(cfg, daemon, quit_evt)
+    live_cfg = config.watch.start(main_cfg, quit_evt)
+    if live_cfg is not None:
+        live_cfg.subscribe(log.set_levels)
 
     data_q : queue.Queue = queue.Queue()
+    metrics.gauge('ctdmon_data_q_depth', 'decoded scans waiting for the MQTT relay', fn=data_q.qsize)
     data_relay_thr = threading.Thread(target=data_relay_loop, args=(cfg, data_q, quit_evt), name="ctdmon:datarelay")
     data_relay_thr.start()
 
     ext_cmd_q: queue.Queue = queue.Queue()   # this queue accepts 'cmds' which are passed directly, as is, to the SBE33 serialport
-    ctd_io = SBE33SerialDataPort("serialport.log", quit_evt, data_q, ext_cmd_q, serialport, baud, altimeter_max_volts)
+    # raw CTD lines and their decoded samples, <LOG_DIR>/serialport[-<NAME>].log
+    serialport_log = Path.home().joinpath(cfg.rift_ox_pi.LOG_DIR, f"{cfg.client_id('serialport')}.log")
+    ctd_io = SBE33SerialDataPort(str(serialport_log), quit_evt, data_q, ext_cmd_q, serialport, baud, altimeter_max_volts,
+                                  output_format=output_format,
+                                  client_id=cfg.mqtt.AWS_RIFT_OX_CLIENT_ID)
     ctd_io.start()
 
-    def _on_connect(client, userdata, flags, rc):
-        if rc==0:
-            print("ctdmon: connected OK: {client}")
-        else:
-            print("winctl:winmon: Bad connection for {client} Returned code: ", rc)
-            client.loop_stop()
-
-    def _on_disconnect(client, userdata, rc):
-        print("winctl:winmon: client disconnected ok")
-
-    def _on_message(client : mqtt.Client, userdata, message):
+    def _on_message(message: mqtt.MQTTMessage):
         # read commands and put in local queue for sending to SBE33 data serial port
         payload = message.payload.decode("utf-8")
-        print(f'Ext CTD Command rcvd: {payload}')
+        logger.info('Ext CTD Command rcvd: %s', payload)
+        words = payload.split()
+        if words and words[0].upper() == profiling.PROFILE_CMD:
+            # profile start [secs] | profile stop
+            try:
+                secs = float(words[2]) if len(words) > 2 else None
+            except ValueError:
+                logger.warning('INVALID PROFILE SECS ===>>> %s', words[2])
+                return
+            profiling.command(cfg, daemon, words[1] if len(words) > 1 else profiling.ACTION_START, secs)
+            return
         ext_cmd_q.put(payload)
 
     # set up MQTT subscriber to listen for external commands that need to be sent to the SBE33 data port
-    mqtt_host = cfg['mqtt']['HOST']
-    mqtt_port = cfg['mqtt']['PORT']
-    cmd_t = cfg['mqtt']['CTD_CMD_TOPIC']
-    external_cmd_client = mqtt.Client('ctdmon-ext-cmd')
-    external_cmd_client.on_connect = _on_connect
-    external_cmd_client.on_disconnect = _on_disconnect
-    external_cmd_client.on_message = _on_message
-    external_cmd_client.connect(mqtt_host, mqtt_port)
-    external_cmd_client.subscribe(cmd_t, qos=2)
-    external_cmd_client.loop_start()
+    cmd_t = cfg.mqtt.CTD_CMD_TOPIC
+    bus.subscribe(cmd_t, _on_message, qos=2)
 
 
 
@@ -287,6 +320,8 @@ def main(quit_evt : threading.Event):
         pass
     
     ctd_io.quit()
+    data_relay_thr.join()
+    mqttbus.stop()
 
 
 
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+
+"""Logging set up for the daemons (see [logging] in rift-ox.toml).
+
+Modules log through the standard logging module:
+
+    logger = logging.getLogger(__name__)
+    logger.debug('payout edges %d/%d', p1, p2)    # only formatted if the record is emitted
+
+and each daemon calls log.setup() once at start up, before starting its
+threads. Records are put on a queue and written by a background thread,
+so a slow SD card or serial console never holds up a hot loop. setup()
+adds
+
+    - a rotating file <LOG_DIR>/<daemon>.log with one JSON object per
+      record (ts, level, logger, thread, msg and any `extra` fields)
+    - human readable lines on stdout at CONSOLE_LEVEL and up
+    - a level per module from [logging.LEVELS]
+    - rate limiting: the same message from the same logger is emitted at
+      most once per RATE_LIMIT_SECS, the next one says how many were dropped
+"""
+
+import atexit
+import json
+import logging
+import logging.handlers
+from pathlib import Path
+import queue
+import sys
+import threading
+import time
+from typing import Mapping, Union
+
+# LogRecord attributes, anything else on a record came in through `extra`
+_RECORD_ATTRS = set(logging.LogRecord('', 0, '', 0, '', (), None).__dict__) | {'message', 'asctime'}
+
+
+class JSONFormatter(logging.Formatter):
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'ts': round(record.created, 3),
+            'level': record.levelname,
+            'logger': record.name,
+            'thread': record.threadName,
+            'msg': record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS:
+                entry[key] = value
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class RateLimitFilter(logging.Filter):
+    """Drops a message already seen from the same logger at the same level
+    within `secs`. The first one through after that carries the count."""
+
+    # forget messages not seen for a window once there are this many
+    MAX_TRACKED = 1000
+
+    def __init__(self, secs: float):
+        super().__init__()
+        self.secs = secs
+        self.lock = threading.Lock()
+        self.seen: dict[tuple, list] = {}    # (logger, level, message) -> [window start, dropped]
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        message = record.getMessage()
+        key = (record.name, record.levelno, message)
+        now = time.monotonic()
+        with self.lock:
+            entry = self.seen.get(key)
+            if entry is not None and now - entry[0] < self.secs:
+                entry[1] += 1
+                return False
+            if entry is not None and entry[1]:
+                record.msg = f'{message} (repeated {entry[1]} more times in {now - entry[0]:.0f} secs)'
+                record.args = None
+            self.seen[key] = [now, 0]
+            if len(self.seen) > self.MAX_TRACKED:
+                self.seen = {k: v for k, v in self.seen.items() if now - v[0] < self.secs}
+        return True
+
+
+_listener: Union[None, logging.handlers.QueueListener] = None
+
+
+def _level(name: str) -> int:
+    level = logging.getLevelName(str(name).upper())
+    if not isinstance(level, int):
+        raise ValueError(f'unknown log level {name}')
+    return level
+
+
+def setup(cfg: dict, daemon: str, console: bool = True) -> logging.handlers.QueueListener:
+    """Send every record to <LOG_DIR>/<daemon>.log, and to stdout unless `console` is False"""
+
+    global _listener
+
+    log_cfg: dict = cfg.get('logging', {})
+    log_dir = Path.home().joinpath(cfg['rift-ox-pi']['LOG_DIR'])
+    Path.mkdir(log_dir, parents=True, exist_ok=True)
+
+    handlers: list[logging.Handler] = []
+    file_handler = logging.handlers.RotatingFileHandler(log_dir.joinpath(f'{daemon}.log'),
+                                                        maxBytes=int(log_cfg.get('MAX_BYTES', 5000000)),
+                                                        backupCount=int(log_cfg.get('BACKUP_COUNT', 5)))
+    file_handler.setFormatter(JSONFormatter())
+    handlers.append(file_handler)
+    if console:
+        console_handler = logging.StreamHandler(sys.stdout)
+        console_handler.setLevel(_level(log_cfg.get('CONSOLE_LEVEL', 'INFO')))
+        console_handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)-7s %(name)s: %(message)s'))
+        handlers.append(console_handler)
+
+    if _listener is not None:
+        _listener.stop()
+    _listener = logging.handlers.QueueListener(queue.SimpleQueue(), *handlers, respect_handler_level=True)
+
+    queue_handler = logging.handlers.QueueHandler(_listener.queue)
+    rate_limit_secs = float(log_cfg.get('RATE_LIMIT_SECS', 10))
+    if rate_limit_secs > 0:
+        queue_handler.addFilter(RateLimitFilter(rate_limit_secs))
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    set_levels(cfg)
+
+    _listener.start()
+    atexit.register(shutdown)
+    return _listener
+
+
+_module_levels: set[str] = set()
+
+
+def set_levels(cfg: Mapping):
+    """Root and per module levels from [logging], again whenever the config is reloaded"""
+
+    log_cfg: Mapping = cfg.get('logging', {})
+    levels = {name: _level(level) for name, level in log_cfg.get('LEVELS', {}).items()}
+    logging.getLogger().setLevel(_level(log_cfg.get('LEVEL', 'INFO')))
+    for name in _module_levels - set(levels):
+        logging.getLogger(name).setLevel(logging.NOTSET)
+    for name, level in levels.items():
+        logging.getLogger(name).setLevel(level)
+    _module_levels.clear()
+    _module_levels.update(levels)
+
+
+def shutdown():
+    """Write out whatever is still queued"""
+
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
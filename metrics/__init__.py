@@ -0,0 +1,313 @@
+#!/usr/bin/env python3
+
+"""Process wide counters, gauges and latency histograms for the daemons'
+hot paths, exported every INTERVAL_SECS as JSON to <TOPIC>/<daemon> and
+as a Prometheus text file <PROM_DIR>/<daemon>.prom (see [metrics] in
+rift-ox.toml).
+
+    import metrics
+    metrics.start(cfg, 'ctdmon', quit_evt)     # after mqttbus.start(), before creating the components
+
+    scans = metrics.counter('ctd_scans_total', 'CTD scans decoded')
+    scans.inc()
+
+    decode_time = metrics.histogram('ctd_decode_seconds', 'parse_data time')
+    t0 = decode_time.start()
+    ...
+    decode_time.observe_since(t0)
+
+    # sampled when exported, not on the hot path
+    metrics.gauge('winch_cmd_q_depth', 'commands waiting', fn=cmd_q.qsize)
+
+    # one per winch instance, exported as winch_cmd_q_depth{daemon="winctl",winch="b"}
+    metrics.gauge('winch_cmd_q_depth', 'commands waiting', fn=cmd_q.qsize, labels={'winch': 'b'})
+
+Asking for a name (and labels) that is already registered returns the same metric.
+Unless [metrics] ENABLED is true every metric is a shared stand-in that
+does nothing, so instrumented code pays a method call per update.
+Updates are not locked, update a metric from one thread only.
+"""
+
+import bisect
+import json
+import logging
+import os
+from pathlib import Path
+import threading
+import time
+from typing import Callable, Mapping, Union
+
+import mqttbus
+
+logger = logging.getLogger(__name__)
+
+# latency buckets in secs, from a scan decode to a slow DIO exchange
+DEFAULT_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+                   0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+class Counter:
+
+    def __init__(self, name: str, help: str, labels: str = ''):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.value = 0
+
+    def inc(self, n: int = 1):
+        self.value += n
+
+
+class Gauge:
+    """Set on the hot path, or sampled from `fn` whenever the metrics are exported"""
+
+    def __init__(self, name: str, help: str, fn: Union[None, Callable[[], float]] = None, labels: str = ''):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.value = 0.0
+        self.fn = fn
+
+    def set(self, value: float):
+        self.value = value
+
+    def read(self) -> Union[None, float]:
+        if self.fn is None:
+            return self.value
+        try:
+            return float(self.fn())
+        except Exception as e:
+            logger.error('ERROR reading gauge %s: %s', self.name, e)
+            return None
+
+
+class Histogram:
+    """Observations in secs, counted in fixed buckets. counts[i] holds the
+    observations <= buckets[i] (and > buckets[i-1]), the last one the rest."""
+
+    def __init__(self, name: str, help: str, buckets: tuple = DEFAULT_BUCKETS, labels: str = ''):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    def start(self) -> float:
+        return time.perf_counter()
+
+    def observe_since(self, t0: float):
+        self.observe(time.perf_counter() - t0)
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket holding the q quantile (max for the last bucket)"""
+        rank = q * self.count
+        total = 0
+        for ndx, n in enumerate(self.counts):
+            total += n
+            if n and total >= rank:
+                return self.buckets[ndx] if ndx < len(self.buckets) else self.max
+        return 0.0
+
+
+class _NullMetric:
+    """Stands in for every metric while metrics are disabled"""
+
+    name = ''
+    labels = ''
+    value = 0
+
+    def inc(self, n: int = 1):
+        pass
+
+    def set(self, value: float):
+        pass
+
+    def observe(self, value: float):
+        pass
+
+    def start(self) -> float:
+        return 0.0
+
+    def observe_since(self, t0: float):
+        pass
+
+
+NULL_METRIC = _NullMetric()
+
+_enabled = False
+_lock = threading.Lock()
+_registry: dict[tuple[str, str], Union[Counter, Gauge, Histogram]] = {}
+
+
+def enabled() -> bool:
+    return _enabled
+
+
+def _labels(labels: Union[None, Mapping[str, str]]) -> str:
+    # 'k1="v1",k2="v2"' in key order, '' for none
+    if not labels:
+        return ''
+    return ','.join(f'{key}="{value}"' for key, value in sorted(labels.items()))
+
+
+def _register(cls, name: str, labels: Union[None, Mapping[str, str]], *args):
+    if not _enabled:
+        return NULL_METRIC
+    label_str = _labels(labels)
+    with _lock:
+        metric = _registry.get((name, label_str))
+        if metric is None:
+            metric = cls(name, *args, labels=label_str)
+            _registry[name, label_str] = metric
+        elif not isinstance(metric, cls):
+            raise ValueError(f'metric {name} is already registered as a {type(metric).__name__}')
+        return metric
+
+
+def counter(name: str, help: str = '', labels: Union[None, Mapping[str, str]] = None) -> Counter:
+    return _register(Counter, name, labels, help)
+
+
+def gauge(name: str, help: str = '', fn: Union[None, Callable[[], float]] = None,
+          labels: Union[None, Mapping[str, str]] = None) -> Gauge:
+    return _register(Gauge, name, labels, help, fn)
+
+
+def histogram(name: str, help: str = '', buckets: tuple = DEFAULT_BUCKETS,
+              labels: Union[None, Mapping[str, str]] = None) -> Histogram:
+    return _register(Histogram, name, labels, help, buckets)
+
+
+def _key(metric) -> str:
+    # to_dict() key, the name with any labels
+    return f'{metric.name}{{{metric.labels}}}' if metric.labels else metric.name
+
+
+def configure(cfg: dict) -> bool:
+    """Enable metrics if [metrics] ENABLED is true. Returns whether they are."""
+    global _enabled
+    _enabled = bool(cfg.get('metrics', {}).get('ENABLED', False))
+    return _enabled
+
+
+def to_prometheus(daemon: str) -> str:
+    """Every registered metric in the Prometheus text exposition format"""
+
+    lines = []
+    with _lock:
+        # a name's label sets together, under one HELP and TYPE
+        registered = sorted(_registry.values(), key=lambda metric: metric.name)
+    described = set()
+    for metric in registered:
+        label = f'daemon="{daemon}",{metric.labels}' if metric.labels else f'daemon="{daemon}"'
+        if isinstance(metric, Counter):
+            kind = 'counter'
+            values = [f'{metric.name}{{{label}}} {metric.value}']
+        elif isinstance(metric, Gauge):
+            value = metric.read()
+            if value is None:
+                continue
+            kind = 'gauge'
+            values = [f'{metric.name}{{{label}}} {value}']
+        else:
+            kind = 'histogram'
+            values = []
+            total = 0
+            for bound, n in zip(metric.buckets, metric.counts):
+                total += n
+                values.append(f'{metric.name}_bucket{{{label},le="{bound}"}} {total}')
+            values += [f'{metric.name}_bucket{{{label},le="+Inf"}} {metric.count}',
+                       f'{metric.name}_sum{{{label}}} {metric.sum}',
+                       f'{metric.name}_count{{{label}}} {metric.count}']
+        if metric.name not in described:
+            described.add(metric.name)
+            lines += [f'# HELP {metric.name} {metric.help}', f'# TYPE {metric.name} {kind}']
+        lines += values
+    return '\n'.join(lines) + '\n'
+
+
+def to_dict(daemon: str, last: Union[None, dict] = None) -> dict:
+    """Every registered metric for the MQTT topic. Counters get a per sec rate
+    since `last`, an earlier to_dict() result."""
+
+    now = time.time()
+    res: dict = {'daemon': daemon, 'ts': round(now, 2), 'counters': {}, 'gauges': {}, 'histograms': {}}
+    with _lock:
+        registered = list(_registry.values())
+    for metric in registered:
+        if isinstance(metric, Counter):
+            entry = {'value': metric.value}
+            prev = last['counters'].get(_key(metric)) if last else None
+            if prev is not None and now > last['ts']:
+                entry['rate'] = round((metric.value - prev['value']) / (now - last['ts']), 3)
+            res['counters'][_key(metric)] = entry
+        elif isinstance(metric, Gauge):
+            value = metric.read()
+            if value is not None:
+                res['gauges'][_key(metric)] = value
+        else:
+            res['histograms'][_key(metric)] = {
+                'count': metric.count,
+                'mean': metric.sum / metric.count if metric.count else 0.0,
+                'p50': metric.quantile(0.5),
+                'p95': metric.quantile(0.95),
+                'max': metric.max,
+            }
+    return res
+
+
+def write_prometheus(path: Path, daemon: str):
+    # written next to the target and renamed, so a scraper never reads half a file
+    tmp_path = path.with_suffix('.prom.tmp')
+    with open(tmp_path, 'wt') as fl:
+        fl.write(to_prometheus(daemon))
+    os.replace(tmp_path, path)
+
+
+def export_loop(cfg: dict, daemon: str, quit_evt: threading.Event):
+
+    metrics_cfg: dict = cfg['metrics']
+    interval: float = float(metrics_cfg.get('INTERVAL_SECS', 10))
+    topic: str = f'{metrics_cfg.get("TOPIC", "rift-ox/metrics")}/{daemon}'
+    prom_dir = Path.home().joinpath(metrics_cfg.get('PROM_DIR', 'dev/logs/metrics'))
+    Path.mkdir(prom_dir, parents=True, exist_ok=True)
+    prom_path = prom_dir.joinpath(f'{daemon}.prom')
+
+    # published over the daemon's connection, when it has one
+    pub: Union[None, mqttbus.Connection] = mqttbus.connection() if mqttbus.started() else None
+    if pub is None:
+        logger.info('no MQTT connection, writing %s only', prom_path)
+
+    last = None
+    while True:
+        quitting = quit_evt.wait(interval)
+        last = to_dict(daemon, last)
+        if pub is not None:
+            pub.publish(topic, json.dumps(last).encode(), qos=0)
+        try:
+            write_prometheus(prom_path, daemon)
+        except OSError as e:
+            logger.error('ERROR writing %s: %s', prom_path, e)
+        if quitting:
+            break
+
+
+def start(cfg: dict, daemon: str, quit_evt: threading.Event) -> Union[None, threading.Thread]:
+    """Enable metrics per the config and start exporting them for `daemon`.
+    Returns the export thread, or None when metrics are disabled."""
+
+    if not configure(cfg):
+        return None
+    thr = threading.Thread(target=export_loop, args=(cfg, daemon, quit_evt), name=f'{daemon}:metrics', daemon=True)
+    thr.start()
+    return thr
@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+
+"""One MQTT connection per daemon, shared by all of its threads.
+
+Each thread used to open its own clients, each with its own socket,
+network thread and keepalives, and its own idea of what to do when the
+broker went away. Now the daemon connects once and the threads register
+handlers for the topics they want:
+
+    import mqttbus
+    mqttbus.start(cfg, 'winctl')               # before starting the threads
+
+    bus = mqttbus.connection()
+    bus.subscribe(cfg.mqtt.WINCH_CMD_TOPIC, on_cmd, qos=2)
+    bus.publish(cfg.mqtt.WINCH_PAUSE_TOPIC, b'pause', qos=2)
+    pub_cmd(bus, cfg.mqtt.WINCH_CMD_TOPIC, 'STOP')
+    ...
+    bus.unsubscribe(cfg.mqtt.WINCH_CMD_TOPIC, on_cmd)
+
+Handlers are called with the paho MQTTMessage on the network thread, one
+message at a time, so they should hand the message on (to a queue) rather
+than work on it, and must not wait for a publish to complete. An exception
+in a handler is logged and the other handlers still get the message.
+
+The client id is the daemon name. When the broker goes away paho
+reconnects, backing off from RECONNECT_MIN_SECS to RECONNECT_MAX_SECS,
+and every topic with a handler is subscribed again. Messages published
+at QoS 1 and 2 while disconnected are sent once it is back.
+"""
+
+import logging
+import threading
+from typing import Callable, Tuple, Union
+
+import paho.mqtt.client as mqtt
+
+logger = logging.getLogger(__name__)
+
+Handler = Callable[[mqtt.MQTTMessage], None]
+
+# paho's reconnect back off
+RECONNECT_MIN_SECS = 1
+RECONNECT_MAX_SECS = 30
+KEEPALIVE_SECS = 60
+# start() waits this long for the broker before letting the threads go on without it
+CONNECT_WAIT_SECS = 5.0
+
+
+class Connection:
+    """A paho client and the handlers of the topics subscribed through it"""
+
+    def __init__(self, host: str, port: int, client_id: str):
+        self.host = host
+        self.port = port
+        self.client_id = client_id
+        self.connected = threading.Event()
+
+        self.lock = threading.Lock()
+        # topic filter -> handlers and the highest qos asked for. Replaced, not
+        # changed, under the lock so the network thread reads them without it.
+        self.handlers: dict[str, Tuple[Handler, ...]] = {}
+        self.qos: dict[str, int] = {}
+        self.wildcards: Tuple[str, ...] = ()
+        self.publish_listeners: Tuple[Callable[[int], None], ...] = ()
+
+        self.client = mqtt.Client(client_id)
+        self.client.on_connect = self._on_connect
+        self.client.on_disconnect = self._on_disconnect
+        self.client.on_message = self._on_message
+        self.client.on_publish = self._on_publish
+        self.client.reconnect_delay_set(RECONNECT_MIN_SECS, RECONNECT_MAX_SECS)
+
+    def start(self, wait: float = CONNECT_WAIT_SECS) -> bool:
+        """Connect in the background, waiting up to `wait` secs. Returns whether it is connected,
+        if not it keeps trying."""
+
+        self.client.connect_async(self.host, self.port, KEEPALIVE_SECS)
+        self.client.loop_start()
+        if not self.connected.wait(wait):
+            logger.error('ERROR MQTT broker %s:%s not connected after %gs, still trying', self.host, self.port, wait)
+            return False
+        return True
+
+    def stop(self):
+        self.client.disconnect()
+        self.client.loop_stop()
+
+    def subscribe(self, topic: str, handler: Handler, qos: int = 0):
+        """Call `handler` with each message on `topic`, which may have + and # wildcards"""
+
+        with self.lock:
+            handlers = self.handlers.get(topic, ())
+            self.handlers = {**self.handlers, topic: handlers + (handler,)}
+            self.qos[topic] = max(qos, self.qos.get(topic, 0))
+            if '+' in topic or '#' in topic:
+                self.wildcards = tuple(sorted(set(self.wildcards) | {topic}))
+            qos = self.qos[topic]
+            # otherwise _on_connect() subscribes it
+            connected = self.connected.is_set()
+        if connected:
+            self.client.subscribe(topic, qos)
+
+    def unsubscribe(self, topic: str, handler: Handler):
+        with self.lock:
+            handlers = tuple(fn for fn in self.handlers.get(topic, ()) if fn is not handler)
+            if handlers:
+                self.handlers = {**self.handlers, topic: handlers}
+                return
+            self.handlers = {key: fns for key, fns in self.handlers.items() if key != topic}
+            self.qos.pop(topic, None)
+            self.wildcards = tuple(wildcard for wildcard in self.wildcards if wildcard != topic)
+            connected = self.connected.is_set()
+        if connected:
+            self.client.unsubscribe(topic)
+
+    def publish(self, topic: str, payload: Union[str, bytes], qos: int = 0, retain: bool = False) -> mqtt.MQTTMessageInfo:
+        return self.client.publish(topic, payload, qos=qos, retain=retain)
+
+    def on_publish(self, listener: Callable[[int], None]):
+        """Call `listener` with the message id of each message the broker has taken
+        (PUBACK for qos 1, PUBCOMP for 2, sent for 0), on the network thread"""
+        with self.lock:
+            self.publish_listeners += (listener,)
+
+    def _on_connect(self, client, userdata, flags, rc):
+        if rc != 0:
+            # paho retries after its back off
+            logger.error('ERROR MQTT broker %s:%s refused connection: %s', self.host, self.port, mqtt.connack_string(rc))
+            return
+        with self.lock:
+            # a subscribe() from now on subscribes itself
+            topics = list(self.qos.items())
+            self.connected.set()
+        if topics:
+            client.subscribe(topics)
+        logger.info('MQTT connected to %s:%s as %s, %d topics subscribed', self.host, self.port, self.client_id, len(topics))
+
+    def _on_disconnect(self, client, userdata, rc):
+        self.connected.clear()
+        if rc == mqtt.MQTT_ERR_SUCCESS:
+            logger.info('MQTT disconnected')
+        else:
+            logger.warning('MQTT connection lost (%s), reconnecting', mqtt.error_string(rc))
+
+    def _on_message(self, client, userdata, message: mqtt.MQTTMessage):
+        handlers = self.handlers.get(message.topic, ())
+        for wildcard in self.wildcards:
+            if mqtt.topic_matches_sub(wildcard, message.topic):
+                handlers += self.handlers.get(wildcard, ())
+        if not handlers:
+            logger.debug('no handler for %s', message.topic)
+        for handler in handlers:
+            try:
+                handler(message)
+            except Exception as e:
+                logger.exception('ERROR handling message on %s: %s', message.topic, e)
+
+    def _on_publish(self, client, userdata, mid: int):
+        for listener in self.publish_listeners:
+            listener(mid)
+
+
+_connection: Union[None, Connection] = None
+
+
+def start(cfg: dict, daemon: str) -> Connection:
+    """Connect `daemon` to the [mqtt] HOST and PORT broker, once per process"""
+
+    global _connection
+    if _connection is None:
+        _connection = Connection(cfg['mqtt']['HOST'], cfg['mqtt']['PORT'], daemon)
+        _connection.start()
+    return _connection
+
+
+def connection() -> Connection:
+    """The daemon's connection, start() must have been called"""
+    if _connection is None:
+        raise RuntimeError('mqttbus.start() has not been called')
+    return _connection
+
+
+def started() -> bool:
+    return _connection is not None
+
+
+def stop():
+    global _connection
+    if _connection is not None:
+        _connection.stop()
+        _connection = None
@@ -74,7 +74,8 @@ Notes: 1) commands are case sensitive
             self.cmndr.down_cast(stop_after_ms=int(dur*1000))
 
     def do_stop(self, arg):
-        self.cmndr.stop_winch()
+        if not self.winch.cancel_maneuver():
+            self.cmndr.stop_winch()
 
     def do_unlock(self, arg):
         self.cmndr.latch_hold()
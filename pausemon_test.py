@@ -5,6 +5,7 @@ import sys
 from threading import Thread, Event
 import signal
 import config
+import mqttbus
 
 from winch import pausemon
 
@@ -25,6 +26,7 @@ def main(quit_evt: Event):
         print(f'ctdmon: ERROR unable to read rift-ox.toml config file. Quitting.')
         sys.exit(1)
 
+    mqttbus.start(cfg, 'pausemon-test')
     pthr = Thread(target=pausemon.pause_monitor, args=(cfg, quit_evt), name='pausemon')
     pthr.start()
     
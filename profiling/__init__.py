@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+
+"""On demand profiling of a running daemon (see [profiling] in rift-ox.toml).
+
+A command on the daemon's command topic starts a profile for a bounded
+window:
+
+    mosquitto_pub -t rift-ox/ctdmon/cmd -m 'profile start 60'
+    mosquitto_pub -t rift-ox/winch/cmd -m '{"command": "PROFILE", "action": "start", "secs": 60}'
+
+and 'stop' / "action": "stop" ends it early. While it runs a background
+thread samples the stack of every other thread every INTERVAL_MS and
+tracemalloc records where memory is allocated. When it ends two files are
+written to <DIR>:
+
+    <daemon>-<time>.folded     one 'thread;outer;...;inner count' line per
+                               distinct stack, for flamegraph.pl or speedscope
+    <daemon>-<time>.alloc.txt  the top allocations by size and by growth
+                               over the window
+
+Only one profile runs per process at a time.
+"""
+
+from collections import Counter
+from datetime import datetime
+import linecache
+import logging
+from pathlib import Path
+import sys
+import threading
+import time
+import tracemalloc
+from typing import Union
+
+logger = logging.getLogger(__name__)
+
+PROFILE_CMD = 'PROFILE'
+ACTION_START = 'start'
+ACTION_STOP = 'stop'
+
+
+class Profile:
+    """One profiling window, sampled from its own thread"""
+
+    def __init__(self, cfg: dict, daemon: str, secs: float):
+        prof_cfg: dict = cfg.get('profiling', {})
+        self.interval = float(prof_cfg.get('INTERVAL_MS', 10)) / 1000
+        self.secs = secs
+        self.trace_allocs: bool = bool(prof_cfg.get('TRACEMALLOC', True))
+        self.trace_frames = int(prof_cfg.get('TRACEMALLOC_FRAMES', 10))
+        self.top_n = int(prof_cfg.get('TOP_ALLOCATIONS', 25))
+
+        out_dir = Path.home().joinpath(prof_cfg.get('DIR', 'dev/logs/profiles'))
+        Path.mkdir(out_dir, parents=True, exist_ok=True)
+        self.out_base = out_dir.joinpath(f'{daemon}-{datetime.now().strftime("%Y%m%d-%H%M%S")}')
+
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self.started_tracemalloc = False
+        self.start_snapshot: Union[None, tracemalloc.Snapshot] = None
+        self.stop_evt = threading.Event()
+        self.thr = threading.Thread(target=self.run, name=f'{daemon}:profiler', daemon=True)
+
+    def start(self):
+        if self.trace_allocs:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(self.trace_frames)
+                self.started_tracemalloc = True
+            self.start_snapshot = tracemalloc.take_snapshot()
+        self.thr.start()
+
+    def stop(self):
+        """Ask the profiler to finish, it writes its reports from its own thread"""
+        self.stop_evt.set()
+
+    def sample(self, own_ident: int):
+        names = {thr.ident: thr.name for thr in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == own_ident:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f'{code.co_name} ({Path(code.co_filename).name})')
+                frame = frame.f_back
+            stack.append(names.get(ident, str(ident)))
+            self.stacks[';'.join(reversed(stack))] += 1
+        self.samples += 1
+
+    def run(self):
+        own_ident = threading.get_ident()
+        deadline = time.monotonic() + self.secs
+        while not self.stop_evt.wait(self.interval):
+            self.sample(own_ident)
+            if time.monotonic() >= deadline:
+                break
+
+        try:
+            self.write_stacks()
+            if self.start_snapshot is not None:
+                self.write_allocations()
+        except OSError as e:
+            logger.error('ERROR writing profile %s: %s', self.out_base, e)
+        finally:
+            if self.started_tracemalloc:
+                tracemalloc.stop()
+            _finished(self)
+
+    def write_stacks(self):
+        path = self.out_base.with_suffix('.folded')
+        with open(path, 'wt') as fl:
+            for stack, count in self.stacks.most_common():
+                fl.write(f'{stack} {count}\n')
+        logger.info('profile: %d samples of %d stacks in %s', self.samples, len(self.stacks), path)
+
+    def write_allocations(self):
+        snapshot = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, __file__),
+            tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+        ))
+        current, peak = tracemalloc.get_traced_memory()
+
+        path = self.out_base.with_suffix('.alloc.txt')
+        with open(path, 'wt') as fl:
+            fl.write(f'traced memory: current {current / 1024:.1f} KiB, peak {peak / 1024:.1f} KiB\n')
+
+            fl.write(f'\ntop {self.top_n} allocations by size\n')
+            for stat in snapshot.statistics('lineno')[:self.top_n]:
+                frame = stat.traceback[0]
+                fl.write(f'{stat.size / 1024:10.1f} KiB {stat.count:8d} blocks  {frame.filename}:{frame.lineno}'
+                         f'  {linecache.getline(frame.filename, frame.lineno).strip()}\n')
+
+            fl.write(f'\ntop {self.top_n} allocations by growth over {self.secs:g} secs\n')
+            for stat in snapshot.compare_to(self.start_snapshot, 'lineno')[:self.top_n]:
+                frame = stat.traceback[0]
+                fl.write(f'{stat.size_diff / 1024:+10.1f} KiB {stat.count_diff:+8d} blocks  {frame.filename}:{frame.lineno}'
+                         f'  {linecache.getline(frame.filename, frame.lineno).strip()}\n')
+        logger.info('profile: allocations in %s', path)
+
+
+_lock = threading.Lock()
+_profile: Union[None, Profile] = None
+
+
+def _finished(profile: Profile):
+    global _profile
+    with _lock:
+        if _profile is profile:
+            _profile = None
+
+
+def start(cfg: dict, daemon: str, secs: Union[None, float] = None) -> bool:
+    """Start profiling for `secs` (DEFAULT_SECS, at most MAX_SECS).
+    Returns False if a profile is already running."""
+
+    global _profile
+    prof_cfg: dict = cfg.get('profiling', {})
+    if secs is None:
+        secs = float(prof_cfg.get('DEFAULT_SECS', 60))
+    secs = min(max(float(secs), 1.0), float(prof_cfg.get('MAX_SECS', 600)))
+
+    with _lock:
+        if _profile is not None:
+            logger.warning('profile already running, writing to %s', _profile.out_base)
+            return False
+        _profile = Profile(cfg, daemon, secs)
+        _profile.start()
+    logger.info('profile: started for %g secs', secs)
+    return True
+
+
+def stop() -> bool:
+    """Stop the running profile early. Returns False if none is running."""
+
+    with _lock:
+        if _profile is None:
+            logger.warning('no profile running')
+            return False
+        _profile.stop()
+    return True
+
+
+def command(cfg: dict, daemon: str, action: str, secs: Union[None, float] = None) -> bool:
+    """Run a profiling command received on a command topic"""
+
+    action = action.lower()
+    if action == ACTION_START:
+        return start(cfg, daemon, secs)
+    elif action == ACTION_STOP:
+        return stop()
+    logger.warning('INVALID PROFILE ACTION ===>>> %s', action)
+    return False
@@ -1,52 +1,118 @@
+from datetime import datetime, timedelta
 from enum import Enum 
+import logging
 # from collections import namedtuple
 # from pprint import PrettyPrinter
-# from typing import Union
+from typing import Union
 import xml.etree.ElementTree as ET
 
-
-SBE19v2plusVars = {}
-SBE19v2plusVars["ofmt_1"] = {}
-SBE19v2plusVars["ofmt_1"]["temp"] = {}
-SBE19v2plusVars["ofmt_1"]["temp"]["len"] = 6
-SBE19v2plusVars["ofmt_1"]["cond"] = {}
-SBE19v2plusVars["ofmt_1"]["cond"]["len"] = 6
-SBE19v2plusVars["ofmt_1"]["press"] = {}
-SBE19v2plusVars["ofmt_1"]["press"]["len"] = 6
-SBE19v2plusVars["ofmt_1"]["volt0"] = {}
-SBE19v2plusVars["ofmt_1"]["volt0"]["len"] = 4
-SBE19v2plusVars["ofmt_1"]["volt1"] = {}
-SBE19v2plusVars["ofmt_1"]["volt1"]["len"] = 4
-SBE19v2plusVars["ofmt_1"]["volt2"] = {}
-SBE19v2plusVars["ofmt_1"]["volt2"]["len"] = 4
-SBE19v2plusVars["ofmt_1"]["volt3"] = {}
-SBE19v2plusVars["ofmt_1"]["volt3"]["len"] = 4
-SBE19v2plusVars["ofmt_1"]["volt4"] = {}
-SBE19v2plusVars["ofmt_1"]["volt4"]["len"] = 4
-SBE19v2plusVars["ofmt_1"]["volt5"] = {}
-SBE19v2plusVars["ofmt_1"]["volt5"]["len"] = 4
-SBE19v2plusVars["ofmt_1"]["sbe38"] = {}
-SBE19v2plusVars["ofmt_1"]["sbe38"]["len"] = 5
-SBE19v2plusVars["ofmt_1"]["wetlabs"] = {}
-SBE19v2plusVars["ofmt_1"]["wetlabs"]["len"] = 12
-SBE19v2plusVars["ofmt_1"]["GTD1_press"] = {}
-SBE19v2plusVars["ofmt_1"]["GTD1_press"]["len"] = 8
-SBE19v2plusVars["ofmt_1"]["GTD1_tempc"] = {}
-SBE19v2plusVars["ofmt_1"]["GTD1_tempc"]["len"] = 6
-SBE19v2plusVars["ofmt_1"]["GTD2_press"] = {}
-SBE19v2plusVars["ofmt_1"]["GTD2_press"]["len"] = 8
-SBE19v2plusVars["ofmt_1"]["GTD2_tempc"] = {}
-SBE19v2plusVars["ofmt_1"]["GTD2_tempc"]["len"] = 6
-SBE19v2plusVars["ofmt_1"]["optode"] = {}
-SBE19v2plusVars["ofmt_1"]["optode"]["len"] = 6
-SBE19v2plusVars["ofmt_1"]["sbe63_ox_ph"] = {}
-SBE19v2plusVars["ofmt_1"]["sbe63_ox_ph"]["len"] = 6
-SBE19v2plusVars["ofmt_1"]["sbe63_ox_tempV"] = {}
-SBE19v2plusVars["ofmt_1"]["sbe63_ox_tempV"]["len"] = 6
-# for moored mode only
-SBE19v2plusVars["ofmt_1"]["time"] = {}
-SBE19v2plusVars["ofmt_1"]["time"]["len"] = 8
-    
+logger = logging.getLogger(__name__)
+
+
+class Channel:
+    """One data channel of an SBE19plus V2 scan.
+
+    In converted HEX (output format 1) a channel is `width` hex characters
+    and converts as int(hex, 16) / scale + offset, rounded to `digits`.
+    Channels with scale 1 and offset 0 are raw counts and stay ints.
+    In converted decimal (output format 3) a channel is `fields` comma
+    separated values already in engineering units.
+    The channel is present in a scan when any of the Config attributes
+    named in `flags` is true; channels with no flags are always present.
+    Real-time channels are decoded for every scan, the rest only when a
+    consumer asks for them (see sbe19v2plus.sample.CTDSample)."""
+
+    __slots__ = ('name', 'width', 'key', 'scale', 'offset', 'digits', 'flags', 'fields',
+                 'realtime', 'counts')
+
+    def __init__(self, name: str, width: int, key: str, scale: float = 1, offset: float = 0,
+                 digits: int = 4, flags: tuple = (), fields: int = 1, realtime: bool = False):
+        self.name = name
+        self.width = width
+        self.key = key
+        self.scale = scale
+        self.offset = offset
+        self.digits = digits
+        self.flags = flags
+        self.fields = fields
+        self.realtime = realtime
+        self.counts = scale == 1 and offset == 0
+
+    def __repr__(self):
+        return f'Channel({self.name!r}, width={self.width}, key={self.key!r})'
+
+    def enabled(self, cfg: 'Config') -> bool:
+        if not self.flags:
+            return True
+        for flag in self.flags:
+            if getattr(cfg, flag):
+                return True
+        return False
+
+    def decode_hex(self, field: str) -> Union[int, float]:
+        if self.counts:
+            return int(field, 16)
+        return round(int(field, 16) / self.scale + self.offset, self.digits)
+
+    def encode_hex(self, value: Union[int, float]) -> str:
+        if self.counts:
+            return f'{int(value):0{self.width}X}'
+        return f'{int(round((value - self.offset) * self.scale)):0{self.width}X}'
+
+    def encode_dec(self, value: Union[int, float]) -> str:
+        if self.fields > 1:
+            return (SBE_EPOCH + timedelta(seconds=int(value))).strftime('%d %b %Y, %H:%M:%S')
+        if self.counts:
+            return str(int(value))
+        return f'{value:.{self.digits}f}'
+
+    def decode_dec(self, field: str) -> Union[int, float]:
+        if self.fields > 1:
+            # moored time is output as 'dd mmm yyyy, hh:mm:ss'
+            return int((datetime.strptime(field.strip(), '%d %b %Y, %H:%M:%S') - SBE_EPOCH).total_seconds())
+        if self.counts:
+            return int(field)
+        return float(field)
+
+
+# Scan channels in the order the SBE19plus V2 outputs them
+CHANNELS = (
+    Channel('temp',           6, 't_c',          scale=100000,  offset=-10, realtime=True),
+    Channel('cond',           6, 'cond',         scale=1000000, offset=-1, realtime=True),
+    Channel('press',          6, 'pres',         scale=1000,    offset=-100, realtime=True),
+    # VA500 altimeter
+    Channel('volt0',          4, 'v0',           scale=13107,   flags=('volt0',), realtime=True),
+    Channel('volt1',          4, 'v1',           scale=13107,   flags=('volt1',)),
+    Channel('volt2',          4, 'v2',           scale=13107,   flags=('volt2',)),
+    Channel('volt3',          4, 'v3',           scale=13107,   flags=('volt3',)),
+    Channel('volt4',          4, 'v4',           scale=13107,   flags=('volt4',)),
+    Channel('volt5',          4, 'v5',           scale=13107,   flags=('volt5',)),
+    Channel('sbe38',          6, 'sbe38',        scale=100000,  offset=-10, flags=('sbe38',)),
+    # WET Labs: three 4 char counts
+    Channel('wetlabs0',       4, 'wetlabs0',     flags=('wetlabs',)),
+    Channel('wetlabs1',       4, 'wetlabs1',     flags=('wetlabs',)),
+    Channel('wetlabs2',       4, 'wetlabs2',     flags=('wetlabs',)),
+    Channel('GTD1_press',     8, 'GTD1_press',   scale=100000,  flags=('GTD', 'DualGTD')),
+    Channel('GTD1_tempc',     6, 'GTD1_tempc',   scale=100000,  offset=-10, flags=('GTD', 'DualGTD')),
+    Channel('GTD2_press',     8, 'GTD2_press',   scale=100000,  flags=('DualGTD',)),
+    Channel('GTD2_tempc',     6, 'GTD2_tempc',   scale=100000,  offset=-10, flags=('DualGTD',)),
+    Channel('optode',         6, 'optode',       scale=10000,   offset=-10, flags=('optode',)),
+    Channel('sbe63_ox_ph',    6, 'ox_ph',        scale=100000,  offset=-10, flags=('sbe63',)),
+    Channel('sbe63_ox_tempV', 6, 'ox_temp_vstr', scale=1000000, offset=-1, flags=('sbe63',)),
+    # moored mode only: seconds since 1 Jan 2000
+    Channel('time',           8, 'time2000',     flags=('moored',), fields=2),
+)
+
+SBE_EPOCH = datetime(2000, 1, 1)
+
+# values the CTD computes and appends to converted decimal (format 3) scans
+DERIVED_DEC_FIELDS = (
+    ('output_sal', 'sal'),
+    ('output_sv', 'sv'),
+)
+
+# NMEA lat/lon appended by the SBE33 deck unit: 3 bytes lat, 3 bytes lon, 1 byte flags
+GPS_LEN = 14
 
 
 class SBE19OutputFmt(Enum):
@@ -126,6 +192,18 @@ class Config:
         self.output_sv = output_sv
         self.output_ucsd = output_ucsd
         #
+        self._layout: Union[None, FrameLayout] = None
+
+    @property
+    def moored(self) -> bool:
+        return self.mode == SBE19Mode.MOORED_MODE
+
+    def layout(self) -> 'FrameLayout':
+        """Scan layout for the channels enabled in this config.
+        Built on first use, so call it only once the config is settled."""
+        if self._layout is None:
+            self._layout = FrameLayout(self)
+        return self._layout
 
     def __str__(self):
 
@@ -174,237 +252,256 @@ class Config:
         return res
 
     def update_getcd_info(self, xml_str : str) -> bool:
-
-        #TODO Logging
-        # print(xml_str.strip())
-
-        config_el = ET.fromstring(xml_str)
-        if config_el is None:
-            print('no configurqation') #TODO LOG Error
+        """Update this config from a complete GetCD XML response.
+        Convenience wrapper around GetCDParser for callers that already
+        have the whole document in hand."""
+
+        parser = GetCDParser(self)
+        parser.feed(xml_str.strip())
+        if not parser.done:
+            logger.error('GetCD: incomplete configuration')
             return False
-
-        # Look for Profile Mode tag...
-        # for child in root:
-        profile_el = config_el.find('ProfileMode')
-        if profile_el is not None:
-            # print("In Profile mode") 
-            #TODO Logging
-            self.mode = SBE19Mode.PROFILE_MODE
-            child = profile_el.find('ScansToAverage')
-            if child is not None:
-                self.profile_scans_to_average = int(str(child.text).strip())
-            else:
-                print('no ScansToAverage') #TODO LOG Error
-                #TODO LOG Error
-                return False 
-            child = profile_el.find('MinimumCondFreq')
-            if child is not None:
-                self.profile_min_cond_freq = int(str(child.text).strip())
-            else:
-                print('no mincondfreq') #TODO LOG Error
-                #TODO LOG Error
-                return False 
-            child = profile_el.find('PumpDelay')
-            if child is not None:
-                self.profile_pump_delay = int(str(child.text).strip())
-            else:
-                print('no pumpdelay') #TODO LOG Error
-                #TODO LOG Error
-                return False 
-            child = profile_el.find('AutoRun')
-            if child is not None:
-                self.profile_auto_run = str(child.text).strip().lower() in ['y','yes']
-            else:
-                print('no autorun') #TODO LOG Error
-                #TODO LOG Error
-                return False 
-            child = profile_el.find('IgnoreSwitch')
-            if child is not None:
-                self.profile_ignore_switch = str(child.text).strip().lower() in ['y','yes']
-            else:
-                print('no ignoreswitch') #TODO LOG Error
-                #TODO LOG Error
-                return False 
-
-        moored_el = config_el.find('MooredMode')
-        if moored_el is not None:
-            print("In Moored mode") #TODO Logging
-            self.mode = SBE19Mode.MOORED_MODE
-            child = moored_el.find('SampleInterval')
-            if child is not None:
-                self.moored_sample_interval = int(str(child.text).strip())
-            else:
-                #TODO LOG Error
-                return False 
-            child = moored_el.find('MeasurementsPerSample')
-            if child is not None:
-                self.moored_ncycles = int(str(child.text).strip())
-            else:
-                #TODO LOG Error
-                return False 
-            child = moored_el.find('Pump')
-            if child is not None:
-                self.moored_pump_mode = int(str(child.text).strip())
-            else:
-                #TODO LOG Error
-                return False 
-            child = moored_el.find('SampleInterval')
-            if child is not None:
-                self.moored_delay_before = float(str(child.text).strip())
-            else:
-                #TODO LOG Error
-                return False 
-            child = moored_el.find('SampleInterval')
-            if child is not None:
-                self.moored_delay_after = float(str(child.text).strip())
-            else:
-                #TODO LOG Error
-                return False 
-            child = moored_el.find('SampleInterval')
-            if child is not None:
-                self.moored_transmit_realtime = str(child.text).strip().lower() in ['y','yes']
-            else:
-                #TODO LOG Error
-                return False 
-
-        battery_el = config_el.find('Battery')
-        if battery_el is not None:
-            child = battery_el.find('Type')
-            if child is not None:
-                self.battery_type = str(child.text).strip()
-            else:
-                #TODO LOG Error
-                return False 
-            child = battery_el.find('CutOff')
-            if child is not None:
-                self.battery_cutoff = str(child.text).strip()
-            else:
-                #TODO LOG Error
-                return False 
-        else:
-            #TODO LOG Error
-            print('no battery')
-            return False 
-
-        data_el = config_el.find('DataChannels')
-        if data_el is not None:
-            child = data_el.find('ExtVolt0')
-            if child is not None:
-                self.volt0 = str(child.text).strip().lower() in ['y','yes']
+        return parser.ok
+
+
+class FrameLayout:
+    """Scan layout derived from CHANNELS for one CTD configuration:
+    which channels are present, where each one sits in a converted HEX
+    frame, and the CSV/binary record layouts for the decoded values."""
+
+    __slots__ = ('channels', 'plan', 'frame_len', 'dec_plan', 'dec_joined', 'dec_derived', 'dec_fields',
+                 'realtime_hex', 'realtime_dec', 'aux_hex', 'aux_dec',
+                 'keys', 'csv_header', 'struct_format')
+
+    def __init__(self, cfg: Config):
+        self.channels: tuple = tuple(ch for ch in CHANNELS if ch.enabled(cfg))
+
+        plan = []
+        pos = 0
+        for ch in self.channels:
+            plan.append((ch, pos, pos + ch.width))
+            pos += ch.width
+        self.plan: tuple = tuple(plan)
+        self.frame_len: int = pos
+
+        # converted decimal: (key, converter, field index) per single field value,
+        # (key, converter, first, last) for the few values that contain a comma
+        dec_plan = []
+        dec_joined = []
+        ndx = 0
+        for ch in self.channels:
+            if ch.fields == 1:
+                dec_plan.append((ch.key, ch.decode_dec, ndx))
             else:
-                print('ExtVolt0')
-                #TODO LOG Error
-                return False 
-            child = data_el.find('ExtVolt1')
-            if child is not None:
-                self.volt1 = str(child.text).strip().lower() in ['y','yes']
-            else:
-                print('ExtVolt1')
-                #TODO LOG Error
-                return False 
-            child = data_el.find('ExtVolt2')
-            if child is not None:
-                self.volt2 = str(child.text).strip().lower() in ['y','yes']
-            else:
-                print('ExtVolt2')
-                #TODO LOG Error
-                return False 
-            child = data_el.find('ExtVolt3')
-            if child is not None:
-                self.volt3 = str(child.text).strip().lower() in ['y','yes']
-            else:
-                print('ExtVolt3')
-                #TODO LOG Error
-                return False 
-            child = data_el.find('ExtVolt4')
-            if child is not None:
-                self.volt4 = str(child.text).strip().lower() in ['y','yes']
-            else:
-                print('ExtVolt4')
-                #TODO LOG Error
-                return False 
-            child = data_el.find('ExtVolt5')
-            if child is not None:
-                self.volt5 = str(child.text).strip().lower() in ['y','yes']
-            else:
-                print('ExtVolt5')
-                #TODO LOG Error
-                return False 
+                dec_joined.append((ch.key, ch.decode_dec, ndx, ndx + ch.fields))
+            ndx += ch.fields
+        dec_derived = []
+        for flag, key in DERIVED_DEC_FIELDS:
+            if getattr(cfg, flag):
+                dec_plan.append((key, float, ndx))
+                dec_derived.append(key)
+                ndx += 1
+        self.dec_plan: tuple = tuple(dec_plan)
+        self.dec_joined: tuple = tuple(dec_joined)
+        self.dec_derived: tuple = tuple(dec_derived)
+        self.dec_fields: int = ndx
+
+        # real-time channels are decoded for every scan, the others on demand by key
+        self.realtime_hex: tuple = tuple((ch.key, ch.decode_hex, start, end)
+                                         for ch, start, end in self.plan if ch.realtime)
+        self.aux_hex: dict = {ch.key: (ch.decode_hex, start, end)
+                              for ch, start, end in self.plan if not ch.realtime}
+        realtime_keys = {ch.key for ch in self.channels if ch.realtime}
+        self.realtime_dec: tuple = tuple(entry for entry in self.dec_plan if entry[0] in realtime_keys)
+        aux_dec = {key: (convert, ndx, ndx + 1)
+                   for key, convert, ndx in self.dec_plan if key not in realtime_keys}
+        for key, convert, first, last in self.dec_joined:
+            aux_dec[key] = (convert, first, last)
+        self.aux_dec: dict = aux_dec
+
+        self.keys: tuple = tuple(ch.key for ch in self.channels)
+        self.csv_header: str = ','.join(self.keys)
+        # little endian: uint32 for raw counts, float64 for converted values
+        self.struct_format: str = '<' + ''.join('I' if ch.counts else 'd' for ch in self.channels)
+
+    def decode_hex(self, frame: str) -> dict:
+        """Convert the channel part of a converted HEX frame to a dict keyed by Channel.key"""
+        return {ch.key: ch.decode_hex(frame[start:end]) for ch, start, end in self.plan}
+
+    def encode_hex(self, values: dict) -> str:
+        """Build the channel part of a converted HEX frame, e.g. for emulators and benchmarks"""
+        return ''.join(ch.encode_hex(values[ch.key]) for ch in self.channels)
+
+    def encode_dec(self, values: dict) -> str:
+        """Build a converted decimal scan, e.g. for emulators and benchmarks"""
+        fields = [ch.encode_dec(values[ch.key]) for ch in self.channels]
+        for key in self.dec_derived:
+            fields.append(f'{values[key]:.4f}')
+        return ', '.join(fields)
+
+    def decode_dec(self, fields: list) -> dict:
+        """Convert the comma separated fields of a converted decimal scan, see dec_fields"""
+        res = {key: convert(fields[ndx]) for key, convert, ndx in self.dec_plan}
+        for key, convert, first, last in self.dec_joined:
+            res[key] = convert(','.join(fields[first:last]))
+        return res
 
-            child = data_el.find('SBE38')
-            if child is not None:
-                self.sbe38 = str(child.text).strip().lower() in ['y','yes']
-            else:
-                print('sbe38')
-                #TODO LOG Error
-                return False 
-            child = data_el.find('WETLABS')
-            if child is not None:
-                self.wetlabs = str(child.text).strip().lower() in ['y','yes']
-            else:
-                print('WETLABS')
-                #TODO LOG Error
-                return False 
-            child = data_el.find('OPTODE')
-            if child is not None:
-                self.GTD = str(child.text).strip().lower() in ['y','yes']
-            else:
-                print('optode')
-                #TODO LOG Error
-                return False 
-            child = data_el.find('SBE63')
-            if child is not None:
-                self.DualGTD = str(child.text).strip().lower() in ['y','yes']
-            else:
-                print('optode')
-                #TODO LOG Error
-                return False 
-            child = data_el.find('SBE38')
-            if child is not None:
-                self.optode = str(child.text).strip().lower() in ['y','yes']
-            else:
-                #TODO LOG Error
-                return False 
-            child = data_el.find('SBE38')
-            if child is not None:
-                self.sbe63 = str(child.text).strip().lower() in ['y','yes']
-            else:
-                #TODO LOG Error
-                return False 
-        else:
-            #TODO LOG Error
-            print('error parsing DataChannels')
-            return False 
 
-        
-        child = config_el.find('EchoCharacters')
-        if child is not None:
-            self.echo = str(child.text).strip().lower() in ['y','yes']
-        else:
-            pass #TODO LOG Error
-        child = config_el.find('OutputExecutedTag')
-        if child is not None:
-            self.output_executed_tag = str(child.text).strip().lower() in ['y','yes']
-        else:
-            pass #TODO LOG Error
-
-        child = config_el.find('OutputFormat')
-        if child is not None:
-            self.output_format = self.OUTPUT_FORMATS[str(child.text).strip()]
-        else:
-            pass #TODO LOG Error
-
-        child = config_el.find('OutputSalinity')
-        if child is not None:
-            self.output_sal = str(child.text).strip().lower() in ['y','yes']
-        child = config_el.find('OutputSoundVelocity')
-        if child is not None:
-            self.output_sv = str(child.text).strip().lower() in ['y','yes']
-        child = config_el.find('OutputSigma_T')
-        if child is not None:
-            self.output_ucsd = str(child.text).strip().lower() in ['y','yes']
-
-        # print(f"All done parding") 
-        #TODO Logging
-        return True
+def _yes_no(text: str) -> bool:
+    return text.lower() in ['y', 'yes']
+
+def _pump_mode(text: str) -> Union[int, str]:
+    # numeric on older firmware, descriptive text ("run pump during sample") on newer
+    return int(text) if text.isdigit() else text
+
+
+class GetCDParser:
+    """Incremental parser for the SBE19plus V2 GetCD XML response.
+
+    Feed it the response line by line as it arrives from the serial port.
+    Config fields are set as their elements close and feed() returns True
+    once </ConfigurationData> has been seen (or the XML turned out to be
+    malformed). Check `ok` for the outcome."""
+
+    ROOT_TAG = 'ConfigurationData'
+
+    # element tag -> (Config attribute, converter from stripped element text)
+    FIELDS = {
+        # <ProfileMode>
+        'ScansToAverage':        ('profile_scans_to_average', int),
+        'MinimumCondFreq':       ('profile_min_cond_freq', int),
+        'PumpDelay':             ('profile_pump_delay', int),
+        'AutoRun':               ('profile_auto_run', _yes_no),
+        'IgnoreSwitch':          ('profile_ignore_switch', _yes_no),
+        # <MooredMode>
+        'SampleInterval':        ('moored_sample_interval', int),
+        'MeasurementsPerSample': ('moored_ncycles', int),
+        'Pump':                  ('moored_pump_mode', _pump_mode),
+        'DelayBeforeSampling':   ('moored_delay_before', float),
+        'DelayAfterSampling':    ('moored_delay_after', float),
+        'TransmitRealTime':      ('moored_transmit_realtime', _yes_no),
+        # <Battery>
+        'Type':                  ('battery_type', str),
+        'CutOff':                ('battery_cutoff', float),
+        # <DataChannels>
+        'ExtVolt0':              ('volt0', _yes_no),
+        'ExtVolt1':              ('volt1', _yes_no),
+        'ExtVolt2':              ('volt2', _yes_no),
+        'ExtVolt3':              ('volt3', _yes_no),
+        'ExtVolt4':              ('volt4', _yes_no),
+        'ExtVolt5':              ('volt5', _yes_no),
+        'SBE38':                 ('sbe38', _yes_no),
+        'WETLABS':               ('wetlabs', _yes_no),
+        'GTD':                   ('GTD', _yes_no),
+        'DualGTD':               ('DualGTD', _yes_no),
+        'OPTODE':                ('optode', _yes_no),
+        'SBE63':                 ('sbe63', _yes_no),
+        # top level
+        'EchoCharacters':        ('echo', _yes_no),
+        'OutputExecutedTag':     ('output_executed_tag', _yes_no),
+        'OutputFormat':          ('output_format', Config.OUTPUT_FORMATS.__getitem__),
+        'OutputSalinity':        ('output_sal', _yes_no),
+        'OutputSoundVelocity':   ('output_sv', _yes_no),
+        'OutputSigma_T':         ('output_ucsd', _yes_no),
+    }
+
+    # children that must be present when their section is present
+    SECTIONS = {
+        'ProfileMode': ('ScansToAverage', 'MinimumCondFreq', 'PumpDelay', 'AutoRun', 'IgnoreSwitch'),
+        'MooredMode': ('SampleInterval', 'MeasurementsPerSample', 'Pump',
+                       'DelayBeforeSampling', 'DelayAfterSampling', 'TransmitRealTime'),
+        'Battery': ('Type', 'CutOff'),
+        'DataChannels': ('ExtVolt0', 'ExtVolt1', 'ExtVolt2', 'ExtVolt3', 'ExtVolt4', 'ExtVolt5',
+                         'SBE38', 'WETLABS', 'OPTODE', 'SBE63'),
+    }
+    REQUIRED_SECTIONS = ('Battery', 'DataChannels')
+
+    SECTION_MODES = {
+        'ProfileMode': SBE19Mode.PROFILE_MODE,
+        'MooredMode': SBE19Mode.MOORED_MODE,
+    }
 
+    def __init__(self, config: Config):
+        self.config = config
+        self.done = False
+        self.errors: list[str] = []
+        self._seen: set[str] = set()
+        self._parser = ET.XMLPullParser(events=('end',))
+
+    @property
+    def ok(self) -> bool:
+        return self.done and not self.errors
+
+    def feed(self, data: str) -> bool:
+        """Feed the next chunk (usually one line) of the GetCD response.
+        Returns True once the document is complete."""
+
+        if self.done:
+            return True
+        try:
+            self._parser.feed(data)
+            for _, el in self._parser.read_events():
+                self._element_closed(el)
+        except ET.ParseError as e:
+            self._error(f'malformed XML: {e}')
+            self.done = True
+        return self.done
+
+    def _element_closed(self, el: ET.Element):
+
+        tag = el.tag
+        self._seen.add(tag)
+
+        field = self.FIELDS.get(tag)
+        if field is not None:
+            attr, convert = field
+            try:
+                setattr(self.config, attr, convert(str(el.text).strip()))
+            except (ValueError, KeyError):
+                self._error(f'invalid {tag}: {el.text}')
+            el.clear()
+
+        elif tag in self.SECTIONS:
+            for child in self.SECTIONS[tag]:
+                if child not in self._seen:
+                    self._error(f'no {child} in {tag}')
+            if tag in self.SECTION_MODES:
+                self.config.mode = self.SECTION_MODES[tag]
+            el.clear()
+
+        elif tag == self.ROOT_TAG:
+            for section in self.REQUIRED_SECTIONS:
+                if section not in self._seen:
+                    self._error(f'no {section}')
+            self.config._layout = None
+            self.done = True
+
+    def _error(self, msg: str):
+        logger.error('GetCD: %s', msg)
+        self.errors.append(msg)
+
+
+def _validate_channels(channels: tuple):
+    """Catch schema mistakes at import time instead of mid-cast"""
+
+    names = set()
+    keys = set()
+    reference = Config()
+    for ch in channels:
+        if ch.name in names:
+            raise ValueError(f'sbe19v2plus channel {ch.name}: duplicate name')
+        if ch.key in keys:
+            raise ValueError(f'sbe19v2plus channel {ch.name}: duplicate key {ch.key}')
+        if ch.width <= 0:
+            raise ValueError(f'sbe19v2plus channel {ch.name}: width must be > 0')
+        if ch.scale == 0:
+            raise ValueError(f'sbe19v2plus channel {ch.name}: scale must be non-zero')
+        if ch.fields < 1:
+            raise ValueError(f'sbe19v2plus channel {ch.name}: fields must be >= 1')
+        for flag in ch.flags:
+            if not hasattr(reference, flag):
+                raise ValueError(f'sbe19v2plus channel {ch.name}: unknown config flag {flag}')
+        names.add(ch.name)
+        keys.add(ch.key)
+
+_validate_channels(CHANNELS)
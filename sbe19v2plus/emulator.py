@@ -0,0 +1,444 @@
+#!/usr/bin/env python3
+
+"""SBE33 deck unit + SBE19plus V2 emulator on a pseudo terminal.
+
+Point ctdmon (or SBE33SerialDataPort) at the printed pty path instead of
+the real serial port:
+
+    python -m sbe19v2plus.emulator --rate 24 --link /tmp/ttySBE33
+    ./ctdmon.py --serialport /tmp/ttySBE33
+
+Emulated behaviour:
+  - '@' toggles between the SBE19plus and the SBE33 set up menu
+  - SBE33 menu selections 1-3 set the deck unit mode
+  - SBE19plus commands: getcd/getsd/gethd/ds, mp/mm, outputformat=,
+    voltN=/sbe38=/wetlabs=/gtd=/dualgtd=/optode=/sbe63=, datetime=,
+    autorun=, ignoreswitch=, echo=, outputexecutedtag=, outputsal=,
+    outputsv=, navg=, pumpon/pumpoff, initlogging, startnow, stop, qs, wake
+  - mode changes, voltN= and initlogging must be repeated to confirm
+  - 'time out' and sleep after idle_timeout secs at the S> prompt; any
+    character wakes it
+  - after startnow, output format 1 (with NMEA lat/lon) or format 3 scans
+    at a configurable rate
+"""
+
+import argparse
+import math
+import os
+from pathlib import Path
+import select
+import signal
+import sys
+import threading
+import tty
+from typing import Callable, Union
+
+import clock
+
+from .config import Config, SBE19Mode, SBE19OutputFmt
+
+SBE33_MENU = """\r
+SBE 33/36 Deck Unit set up menu:\r
+  1 = mode 1: SBE 19plus real-time data\r
+  2 = mode 2: SBE 19plus real-time data with NMEA position\r
+  3 = mode 3: SBE 19plus real-time data with NMEA position and time\r
+  7 = show this menu\r
+  @ = exit the set up menu\r
+"""
+
+# commands that must be sent twice in a row before they take effect
+CONFIRM_CMDS = ('mp', 'mm', 'initlogging', 'volt0=', 'volt1=', 'volt2=', 'volt3=', 'volt4=', 'volt5=')
+
+# <command>=yes|no -> Config attribute
+YES_NO_CMDS = {
+    'volt0': 'volt0', 'volt1': 'volt1', 'volt2': 'volt2',
+    'volt3': 'volt3', 'volt4': 'volt4', 'volt5': 'volt5',
+    'sbe38': 'sbe38', 'wetlabs': 'wetlabs', 'gtd': 'GTD', 'dualgtd': 'DualGTD',
+    'optode': 'optode', 'sbe63': 'sbe63',
+    'autorun': 'profile_auto_run', 'ignoreswitch': 'profile_ignore_switch',
+    'echo': 'echo', 'outputexecutedtag': 'output_executed_tag',
+    'outputsal': 'output_sal', 'outputsv': 'output_sv',
+}
+
+
+def encode_gps(lat: float, lon: float) -> str:
+    """NMEA position as appended by the SBE33: 3 bytes lat, 3 bytes lon, flags byte
+    (bit 7 southern latitude, bit 6 western longitude, bit 0 new position)"""
+    flags = 0x01
+    if lat < 0:
+        flags |= 0x80
+    if lon < 0:
+        flags |= 0x40
+    return f'{int(round(abs(lat) * 50000)):06X}{int(round(abs(lon) * 50000)):06X}{flags:02X}'
+
+
+def default_scan_values(t: float) -> dict:
+    """A slow, repeating 0-200m profile with the altimeter (volt0) seeing the bottom at 250m"""
+    depth = 100 - 100 * math.cos(t / 60)
+    return {
+        't_c': round(18 - depth / 20, 4),
+        'cond': round(4.2 - depth / 1000, 5),
+        'pres': round(depth * 1.0076, 3),
+        'v0': round(min(250 - depth, 100) / 20, 4),   # 0-5V for 0-100m
+        'v1': 0.0, 'v2': 1.25, 'v3': 0.0, 'v4': 0.0, 'v5': 0.0,
+        'sbe38': round(18 - depth / 20, 4),
+        'wetlabs0': 100, 'wetlabs1': 200, 'wetlabs2': 300,
+        'GTD1_press': 101.325, 'GTD1_tempc': 18.0, 'GTD2_press': 101.325, 'GTD2_tempc': 18.0,
+        'optode': 250.0, 'ox_ph': 30.0, 'ox_temp_vstr': 0.5,
+        'time2000': int(clock.time()) - 946684800,
+        'sal': 34.5, 'sv': 1510.0,
+    }
+
+
+class SBE33Emulator:
+
+    def __init__(self, config: Union[None, Config] = None, scan_rate: float = 4.0,
+                 gps: bool = True, lat: float = 32.8681, lon: float = -117.2527,
+                 idle_timeout: float = 120.0,
+                 scan_values: Callable[[float], dict] = default_scan_values):
+
+        self.config = config if config is not None else Config(profile_auto_run=False)
+        self.scan_rate = scan_rate
+        self.gps = gps
+        self.lat = lat
+        self.lon = lon
+        self.idle_timeout = idle_timeout
+        self.scan_values = scan_values
+
+        self.device = 'sbe19'          # or 'sbe33'
+        self.ctd_state = 'prompt'      # 'prompt', 'asleep' or 'acquiring'
+        self.sbe33_mode = 1
+        self.last_cmd = ''
+        self.last_activity = clock.monotonic()
+        self.start_time = clock.monotonic()
+
+        # for throughput/latency measurements: scans written, writes lost because the
+        # reader fell behind, and a hook called with every scan generated (lost or not)
+        self.scans_sent = 0
+        self.overruns = 0
+        self.on_scan: Union[None, Callable[[str, float], None]] = None
+
+        self.master_fd = -1
+        self.slave_fd = -1
+        self.port_name = ''
+        self.link: Union[None, Path] = None
+        self.quit_evt = threading.Event()
+        self.write_lock = threading.Lock()
+        self.input_buf = ''
+        self.prev_char = ''
+        self.read_thr = threading.Thread(target=self.read_loop, name='sbe33emu:read_loop', daemon=True)
+        self.scan_thr = threading.Thread(target=self.scan_loop, name='sbe33emu:scan_loop', daemon=True)
+
+    def open(self, link: Union[None, str] = None) -> str:
+        """Create the pty, optionally symlinked to `link`, and return the port name to open"""
+        self.master_fd, self.slave_fd = os.openpty()
+        tty.setraw(self.slave_fd)
+        # like a UART, output the reader does not keep up with is lost rather than blocking us
+        os.set_blocking(self.master_fd, False)
+        self.port_name = os.ttyname(self.slave_fd)
+        if link:
+            self.link = Path(link)
+            if self.link.is_symlink():
+                self.link.unlink()
+            self.link.symlink_to(self.port_name)
+        return str(self.link) if self.link else self.port_name
+
+    def start(self):
+        if self.master_fd < 0:
+            self.open()
+        self.read_thr.start()
+        self.scan_thr.start()
+
+    def stop(self):
+        self.quit_evt.set()
+        self.read_thr.join()
+        self.scan_thr.join()
+        if self.link is not None and self.link.is_symlink():
+            self.link.unlink()
+        os.close(self.master_fd)
+        os.close(self.slave_fd)
+
+    def write(self, text: str) -> bool:
+        data = text.encode()
+        with self.write_lock:
+            try:
+                written = os.write(self.master_fd, data)
+            except BlockingIOError:
+                written = 0
+        if written < len(data):
+            self.overruns += 1
+            return False
+        return True
+
+    def prompt(self):
+        self.write('S>')
+
+    # ------------------------------------------------------------------ input
+
+    def read_loop(self):
+
+        while not self.quit_evt.is_set():
+            ready, _, _ = select.select([self.master_fd], [], [], 0.1)
+            if not ready:
+                self.check_idle()
+                continue
+            try:
+                data = os.read(self.master_fd, 1024)
+            except OSError:
+                continue
+            for ch in data.decode(errors='replace'):
+                self.handle_char(ch)
+
+    def handle_char(self, ch: str):
+
+        self.last_activity = clock.monotonic()
+
+        if ch == '@':
+            self.toggle_device()
+            self.prev_char = ch
+            return
+
+        if self.device == 'sbe19' and self.ctd_state == 'asleep':
+            # any character wakes it, the rest of the line is still a command
+            self.ctd_state = 'prompt'
+
+        if self.device == 'sbe19' and self.config.echo:
+            self.write(ch)
+
+        if (ch == '\n' and self.prev_char == '\r') or (ch in '\r\n' and self.prev_char == '@'):
+            # '\r\n' is one line ending, and the deck unit swallows the one after '@'
+            self.prev_char = ch
+            return
+        self.prev_char = ch
+
+        if ch in '\r\n':
+            line, self.input_buf = self.input_buf.strip(), ''
+            if self.device == 'sbe33':
+                self.sbe33_command(line)
+            else:
+                self.sbe19_command(line)
+        else:
+            self.input_buf += ch
+
+    def check_idle(self):
+        if self.device == 'sbe19' and self.ctd_state == 'prompt' and \
+                clock.monotonic() - self.last_activity > self.idle_timeout:
+            self.ctd_state = 'asleep'
+            self.write('time out\r\n')
+
+    def toggle_device(self):
+        self.input_buf = ''
+        if self.device == 'sbe19':
+            self.device = 'sbe33'
+            self.write(SBE33_MENU + 'selection = ')
+        else:
+            self.device = 'sbe19'
+            self.write('\r\nexiting the set up menu\r\n')
+            if self.ctd_state != 'acquiring':
+                self.ctd_state = 'prompt'
+                self.prompt()
+
+    # ------------------------------------------------------------------ SBE33
+
+    def sbe33_command(self, line: str):
+        if line in ('1', '2', '3'):
+            self.sbe33_mode = int(line)
+            self.write(f'\r\nthe current mode = {self.sbe33_mode}\r\n')
+        elif line == '7':
+            self.write(SBE33_MENU)
+        self.write('selection = ')
+
+    # ------------------------------------------------------------------ SBE19plus
+
+    def sbe19_command(self, line: str):
+
+        cmd = line.lower()
+        confirmed = cmd == self.last_cmd
+        self.last_cmd = cmd
+
+        if cmd == '':
+            if self.ctd_state != 'acquiring':
+                self.prompt()
+            return
+
+        if self.ctd_state == 'acquiring':
+            # only stop is honoured while sampling
+            if cmd == 'stop':
+                self.ctd_state = 'prompt'
+                self.write('\r\n')
+                self.prompt()
+            return
+
+        if cmd.startswith(CONFIRM_CMDS):
+            if not confirmed:
+                self.write(f'\r\nrepeat the command to confirm: {line}\r\n')
+                self.prompt()
+                return
+            self.last_cmd = ''
+
+        if cmd == 'startnow':
+            self.ctd_state = 'acquiring'
+            self.write('\r\nstart now\r\n')
+            return
+        elif cmd == 'stop':
+            pass
+        elif cmd == 'wake':
+            self.write("\r\n<ERROR type='INVALID COMMAND' msg='RCVD:wake'/>\r\n")
+        elif cmd == 'qs':
+            self.ctd_state = 'asleep'
+            return
+        elif cmd == 'getcd':
+            self.write('\r\n' + self.getcd_xml())
+        elif cmd in ('getsd', 'gethd'):
+            self.write(f"\r\n<{cmd[3:].upper()} DeviceType = 'SBE19plus' SerialNumber = '01906001'/>\r\n")
+        elif cmd == 'ds':
+            self.write('\r\nSBE 19plus\r\n' + str(self.config))
+        elif cmd == 'mp':
+            self.config.mode = SBE19Mode.PROFILE_MODE
+        elif cmd == 'mm':
+            self.config.mode = SBE19Mode.MOORED_MODE
+        elif cmd in ('pumpon', 'pumpoff', 'initlogging', 'tt'):
+            pass
+        elif '=' in cmd:
+            if not self.set_param(*cmd.split('=', 1)):
+                self.write(f"\r\n<ERROR type='INVALID COMMAND' msg='RCVD:{line}'/>\r\n")
+        else:
+            self.write(f"\r\n<ERROR type='INVALID COMMAND' msg='RCVD:{line}'/>\r\n")
+
+        self.write('\r\n')
+        self.prompt()
+
+    def set_param(self, name: str, value: str) -> bool:
+        if name in YES_NO_CMDS:
+            setattr(self.config, YES_NO_CMDS[name], value in ('y', 'yes'))
+        elif name == 'outputformat' and value in ('1', '3'):
+            self.config.output_format = SBE19OutputFmt(int(value))
+        elif name == 'navg' and value.isdigit():
+            self.config.profile_scans_to_average = int(value)
+        elif name != 'datetime':
+            return False
+        self.config._layout = None
+        return True
+
+    def getcd_xml(self) -> str:
+
+        def yes_no(val: bool) -> str:
+            return 'yes' if val else 'no'
+
+        cfg = self.config
+        output_format = [name for name, fmt in Config.OUTPUT_FORMATS.items() if fmt == cfg.output_format][0]
+        lines = ["<ConfigurationData DeviceType = 'SBE19plus' SerialNumber = '01906001'>"]
+        if cfg.mode == SBE19Mode.PROFILE_MODE:
+            lines += [
+                '<ProfileMode>',
+                f'<ScansToAverage>{cfg.profile_scans_to_average}</ScansToAverage>',
+                f'<MinimumCondFreq>{cfg.profile_min_cond_freq}</MinimumCondFreq>',
+                f'<PumpDelay>{cfg.profile_pump_delay}</PumpDelay>',
+                f'<AutoRun>{yes_no(cfg.profile_auto_run)}</AutoRun>',
+                f'<IgnoreSwitch>{yes_no(cfg.profile_ignore_switch)}</IgnoreSwitch>',
+                '</ProfileMode>',
+            ]
+        else:
+            lines += [
+                '<MooredMode>',
+                f'<SampleInterval>{cfg.moored_sample_interval}</SampleInterval>',
+                f'<MeasurementsPerSample>{cfg.moored_ncycles}</MeasurementsPerSample>',
+                f'<Pump>{cfg.moored_pump_mode}</Pump>',
+                f'<DelayBeforeSampling>{cfg.moored_delay_before}</DelayBeforeSampling>',
+                f'<DelayAfterSampling>{cfg.moored_delay_after}</DelayAfterSampling>',
+                f'<TransmitRealTime>{yes_no(cfg.moored_transmit_realtime)}</TransmitRealTime>',
+                '</MooredMode>',
+            ]
+        lines += [
+            '<Battery>',
+            f'<Type>{cfg.battery_type or "alkaline"}</Type>',
+            f'<CutOff>{cfg.battery_cutoff}</CutOff>',
+            '</Battery>',
+            '<DataChannels>',
+        ]
+        for n in range(6):
+            lines.append(f'<ExtVolt{n}>{yes_no(getattr(cfg, f"volt{n}"))}</ExtVolt{n}>')
+        lines += [
+            f'<SBE38>{yes_no(cfg.sbe38)}</SBE38>',
+            f'<WETLABS>{yes_no(cfg.wetlabs)}</WETLABS>',
+            f'<OPTODE>{yes_no(cfg.optode)}</OPTODE>',
+            f'<SBE63>{yes_no(cfg.sbe63)}</SBE63>',
+            f'<GTD>{yes_no(cfg.GTD)}</GTD>',
+            f'<DualGTD>{yes_no(cfg.DualGTD)}</DualGTD>',
+            '</DataChannels>',
+            f'<EchoCharacters>{yes_no(cfg.echo)}</EchoCharacters>',
+            f'<OutputExecutedTag>{yes_no(cfg.output_executed_tag)}</OutputExecutedTag>',
+            f'<OutputFormat>{output_format}</OutputFormat>',
+            f'<OutputSalinity>{yes_no(cfg.output_sal)}</OutputSalinity>',
+            f'<OutputSoundVelocity>{yes_no(cfg.output_sv)}</OutputSoundVelocity>',
+            '</ConfigurationData>',
+        ]
+        return '\r\n'.join(lines) + '\r\n'
+
+    # ------------------------------------------------------------------ data
+
+    def scan_line(self, t: float) -> str:
+        values = self.scan_values(t)
+        layout = self.config.layout()
+        if self.config.output_format == SBE19OutputFmt.OUTPUT_FORMAT_3:
+            return layout.encode_dec(values)
+        line = layout.encode_hex(values)
+        if self.gps:
+            line += encode_gps(values.get('lat', self.lat), values.get('lon', self.lon))
+        return line
+
+    def scan_loop(self):
+
+        next_scan = clock.monotonic()
+        while not self.quit_evt.is_set():
+
+            if self.ctd_state != 'acquiring' or self.device != 'sbe19':
+                clock.sleep(0.05)
+                next_scan = clock.monotonic()
+                continue
+
+            now = clock.monotonic()
+            if now < next_scan:
+                clock.sleep(min(next_scan - now, 0.05))
+                continue
+            next_scan += 1 / self.scan_rate
+
+            line = self.scan_line(now - self.start_time)
+            sent = clock.monotonic()
+            if self.write(line + '\r\n'):
+                self.scans_sent += 1
+            if self.on_scan is not None:
+                self.on_scan(line, sent)
+
+
+def main():
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rate', help="scans per second once started", default=4.0, type=float)
+    parser.add_argument('--format', help="initial output format", default=1, type=int, choices=[1, 3])
+    parser.add_argument('--no-gps', help="do not append NMEA position to format 1 scans", action='store_true')
+    parser.add_argument('--idle-timeout', help="secs at the S> prompt before 'time out'", default=120.0, type=float)
+    parser.add_argument('--link', help="also make this symlink to the pty", default=None, type=str)
+    parser.add_argument('--autostart', help="start sampling immediately", action='store_true')
+    args = parser.parse_args()
+
+    emu = SBE33Emulator(config=Config(output_format=SBE19OutputFmt(args.format)),
+                        scan_rate=args.rate, gps=not args.no_gps, idle_timeout=args.idle_timeout)
+    port = emu.open(args.link)
+    if args.autostart:
+        emu.ctd_state = 'acquiring'
+    emu.start()
+    print(f'SBE33/SBE19plus V2 emulator on {port} ({emu.port_name}), {args.rate} scans/s')
+
+    def interrupt_handler(signum, frame):
+        emu.quit_evt.set()
+
+    signal.signal(signal.SIGINT, interrupt_handler)
+    emu.quit_evt.wait()
+    emu.stop()
+    print(f'emulator sent {emu.scans_sent} scans, {emu.overruns} overruns')
+    sys.exit(0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,142 @@
+import json
+import struct
+from typing import Union
+
+from .config import FrameLayout
+
+
+class CTDSample:
+    """One decoded CTD scan.
+
+    The real-time channels (temperature, conductivity, pressure and the
+    altimeter voltage) are decoded when the sample is created, along with
+    the derived altitude, depth and position that ctdmon fills in. Every
+    other channel is decoded from the retained raw frame the first time it
+    is asked for, via sample[key] or sample.get(key), and then cached.
+
+    The serialized forms (JSON with every configured channel for the log
+    and MQTT, packed binary of the real-time values) are built once on
+    first use and shared by every consumer, so set ts, c_id and wsta
+    before handing the sample on."""
+
+    __slots__ = ('raw', 'layout', 'is_hex', 't_c', 'cond', 'pres', 'v0',
+                 'alt_m', 'dep_m', 'lat', 'lon', 'ts', 'type', 'c_id', 'wsta',
+                 '_aux', '_fields', '_json', '_json_bytes', '_binary')
+
+    REALTIME_KEYS = ('t_c', 'cond', 'pres', 'v0', 'alt_m', 'dep_m', 'lat', 'lon')
+    META_KEYS = ('ts', 'type', 'c_id', 'wsta')
+
+    # ts then the real-time values, NaN where a channel is not enabled
+    BINARY_STRUCT = struct.Struct('<' + 'd' * (1 + len(REALTIME_KEYS)))
+
+    def __init__(self, raw: str, layout: FrameLayout, is_hex: bool = True):
+        self.raw = raw
+        self.layout = layout
+        self.is_hex = is_hex
+        self.t_c = self.cond = self.pres = self.v0 = None
+        self.alt_m = self.dep_m = self.lat = self.lon = None
+        self.ts: Union[None, float] = None
+        self.type: str = 'ctd'
+        self.c_id: Union[None, str] = None
+        self.wsta: Union[None, str] = None
+        self._aux: Union[None, dict] = None
+        self._fields: Union[None, list] = None
+        self._json: Union[None, str] = None
+        self._json_bytes: Union[None, bytes] = None
+        self._binary: Union[None, bytes] = None
+
+    @classmethod
+    def from_hex(cls, line: str, layout: FrameLayout) -> 'CTDSample':
+        """Decode the real-time channels of a converted HEX (format 1) frame"""
+        sample = cls(line, layout, True)
+        for key, decode, start, end in layout.realtime_hex:
+            setattr(sample, key, decode(line[start:end]))
+        return sample
+
+    @classmethod
+    def from_dec(cls, line: str, fields: list, layout: FrameLayout) -> 'CTDSample':
+        """Decode the real-time channels of an already split converted decimal (format 3) scan"""
+        sample = cls(line, layout, False)
+        sample._fields = fields
+        for key, convert, ndx in layout.realtime_dec:
+            setattr(sample, key, convert(fields[ndx]))
+        return sample
+
+    def aux_keys(self) -> tuple:
+        return tuple(self.layout.aux_hex if self.is_hex else self.layout.aux_dec)
+
+    def keys(self) -> tuple:
+        return tuple(key for key in self.REALTIME_KEYS + self.META_KEYS
+                     if getattr(self, key) is not None) + self.aux_keys()
+
+    def _decode_aux(self, key: str) -> Union[int, float]:
+        if self._aux is None:
+            self._aux = {}
+        elif key in self._aux:
+            return self._aux[key]
+
+        if self.is_hex:
+            decode, start, end = self.layout.aux_hex[key]
+            value = decode(self.raw[start:end])
+        else:
+            if self._fields is None:
+                self._fields = self.raw.split(',')
+            convert, first, last = self.layout.aux_dec[key]
+            value = convert(','.join(self._fields[first:last]))
+        self._aux[key] = value
+        return value
+
+    def __getitem__(self, key: str) -> Union[int, float]:
+        if key in self.REALTIME_KEYS or key in self.META_KEYS:
+            value = getattr(self, key)
+            if value is None:
+                raise KeyError(key)
+            return value
+        try:
+            return self._decode_aux(key)
+        except KeyError:
+            raise KeyError(key) from None
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.keys()
+
+    def get(self, key: str, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def to_dict(self, full: bool = False) -> dict:
+        """Real-time values and metadata, plus every channel when full is True (decoding any not yet seen)"""
+        res = {key: getattr(self, key) for key in self.REALTIME_KEYS if getattr(self, key) is not None}
+        if full:
+            for key in self.aux_keys():
+                res[key] = self._decode_aux(key)
+        for key in self.META_KEYS:
+            value = getattr(self, key)
+            if value is not None:
+                res[key] = value
+        return res
+
+    def to_json(self) -> str:
+        if self._json is None:
+            self._json = json.dumps(self.to_dict(full=True))
+        return self._json
+
+    def to_json_bytes(self) -> bytes:
+        if self._json_bytes is None:
+            self._json_bytes = self.to_json().encode('utf-8')
+        return self._json_bytes
+
+    def to_binary(self) -> bytes:
+        if self._binary is None:
+            nan = float('nan')
+            values = [nan if self.ts is None else self.ts]
+            for key in self.REALTIME_KEYS:
+                value = getattr(self, key)
+                values.append(nan if value is None else value)
+            self._binary = self.BINARY_STRUCT.pack(*values)
+        return self._binary
+
+    def __repr__(self):
+        return f'CTDSample({self.to_dict()})'
@@ -4,6 +4,7 @@
 import argparse
 from datetime import datetime
 import json
+import logging
 import os
 import queue
 import re
@@ -12,14 +13,18 @@ import serial
 import signal
 import sys
 import threading
-import time
 from typing import Union, List
 
 import paho.mqtt.client as mqtt
 import gsw
 
+import clock
 import config
+import metrics
 import sbe19v2plus.config
+from sbe19v2plus.sample import CTDSample
+
+logger = logging.getLogger(__name__)
 
 class SBE33SerialDataPort():
 
@@ -55,11 +60,14 @@ class SBE33SerialDataPort():
         CTD_CMD_STARTNOW,
         CTD_CMD_STOP,
     ]
+    # scan lines: converted HEX (outputformat=1) and converted decimal (outputformat=3)
+    DATA_LINE_HEX_RE = re.compile("^[A-Z0-9]{18}[A-Z0-9]+$")
+    DATA_LINE_DEC_RE = re.compile(r"^\s*-?\d+\.\d+\s*,")
 
     
     def __init__(self, logfile : str, quit_evt : threading.Event, 
                  data_q, ext_cmd_q : queue.Queue, serialport: str, baud: int, 
-                 alt_volt_range: int):
+                 alt_volt_range: int, output_format: int = 1, client_id: str = ''):
 
         # this config will reflect the state of the CTD via the getcd/getsd command responses
         self.ctd_config = sbe19v2plus.config.Config()
@@ -71,7 +79,8 @@ class SBE33SerialDataPort():
 
         self.sbe33_mode = 0  # init val, needs ot be set to '2'
 
-        self.GetCD_str = ''
+        # fed line by line while a GetCD response is arriving
+        self.getcd_parser: Union[None, sbe19v2plus.config.GetCDParser] = None
 
         self.quit_evt = quit_evt
         self.serial_port_cmd_q = queue.Queue(maxsize=1)
@@ -80,6 +89,8 @@ class SBE33SerialDataPort():
         self.ser_port = serial.serial_for_url(serialport, baud, timeout=0.5, 
                                               write_timeout=1, parity=serial.PARITY_EVEN, bytesize=7)
         self.altimeter_max_volts = alt_volt_range
+        self.output_format = output_format  # requested of the CTD in ctd_configure()
+        self.client_id = client_id  # stamped on every sample
         
         self.read_thr = threading.Thread(target=self.read_loop, name="ctdmon:read_loop")
         self.write_thr = threading.Thread(target=self.write_loop, name="ctdmon:write_loop")
@@ -91,20 +102,25 @@ class SBE33SerialDataPort():
         self.getcd_read_event = threading.Event()
         self.confirmation_request_event = threading.Event()
 
+        self.lines_read = metrics.counter('ctd_lines_read_total', 'lines read from the SBE33 serial port')
+        self.scans_decoded = metrics.counter('ctd_scans_total', 'CTD scans decoded')
+        self.bad_scans = metrics.counter('ctd_bad_scans_total', 'lines that failed to decode while acquiring data')
+        self.decode_time = metrics.histogram('ctd_decode_seconds', 'parse_data time per scan')
+
         self.logfile = os.path.normpath(logfile)
-        print(f'Initializing CTD Reader with path {self.logfile}')  
+        logger.info('Initializing CTD Reader with path %s', self.logfile)
 
 
     def toggle_sbe33_menu(self):
 
         if self.ctd_status[self.CTD_ACTIVE_DEVICE] != self.CTD_ACTIVE_DEVICE_SBE33:
             self.enqueue_command('@', eol='\r')
-            print('activating sbe33 menu...')
+            logger.info('activating sbe33 menu...')
             self.sbe33_active_event.wait()
             self.sbe33_active_event.clear()
 
         elif self.ctd_status[self.CTD_ACTIVE_DEVICE] == self.CTD_ACTIVE_DEVICE_SBE33:
-            print('de-activating sbe33 menu...')
+            logger.info('de-activating sbe33 menu...')
             self.enqueue_command('@', eol='\n')
             self.sbe19_active_event.wait()
             self.sbe19_active_event.clear()
@@ -114,50 +130,50 @@ class SBE33SerialDataPort():
     def ctd_configure(self):
 
         self.enqueue_command('mp', '\r')
-        time.sleep(2)
+        clock.sleep(2)
         self.enqueue_command('mp', '\r')
-        self.enqueue_command('outputformat=1', '\r')
+        self.enqueue_command(f'outputformat={self.output_format}', '\r')
         self.enqueue_command('autorun=no', '\r')
         self.enqueue_command('ignoreswitch=yes', '\r')
         self.enqueue_command('echo=no', '\r')
         self.enqueue_command('outputexecutedtag=no', '\r')
-        t = datetime.utcnow()
+        t = datetime.utcfromtimestamp(clock.time())
         self.enqueue_command(f'DateTime={t.strftime("%m%d%Y%H%M%S")}', '\r')
 
         # these commands need to be confirmed with a second issuance
-        time.sleep(2)
+        clock.sleep(2)
         self.enqueue_command('volt0=yes', '\r')
-        time.sleep(2)
+        clock.sleep(2)
         self.enqueue_command('volt0=yes', '\r')
         self.enqueue_command('volt1=no', '\r')
-        time.sleep(2)
+        clock.sleep(2)
         self.enqueue_command('volt1=no', '\r')
         self.enqueue_command('volt2=yes', '\r')
-        time.sleep(2)
+        clock.sleep(2)
         self.enqueue_command('volt2=yes', '\r')
         self.enqueue_command('volt3=no', '\r')
-        time.sleep(2)
+        clock.sleep(2)
         self.enqueue_command('volt3=no', '\r')
         self.enqueue_command('volt4=no', '\r')
-        time.sleep(2)
+        clock.sleep(2)
         self.enqueue_command('volt4=no', '\r')
         self.enqueue_command('volt5=no', '\r')
-        time.sleep(2)
+        clock.sleep(2)
         self.enqueue_command('volt5=no', '\r')
 
         # now read config from device
         self.enqueue_command('getcd', '\r')
         self.getcd_read_event.wait()
         # wait until config commands all been issued
-        time.sleep(1)
-        self.enqueue_command('startnow', 'r')
+        clock.sleep(1)
+        self.enqueue_command('startnow', '\r')
         self.serial_port_cmd_q.join()
 
     
     def init_state(self):
 
         # let's tkae a few secs to see if we can discern the current STATE and DEVICE
-        time.sleep(2)
+        clock.sleep(2)
         # if self.ctd_status[self.CTD_STATE] == self.CTD_STATE_UNKNOWN:
         #     time.sleep(5)
                             # figure out the current STATE and ACTIVE DEVICE
@@ -173,33 +189,33 @@ class SBE33SerialDataPort():
                 self.enqueue_command('', '\r\n')
 
                 while not self.sbe19_active_event.is_set() and not self.sbe33_active_event.is_set():
-                    time.sleep(1)
+                    clock.sleep(1)
 
             # if not acquiring data and active device is the CTD then toggle to SBE33 menu mode
             if self.ctd_status[self.CTD_ACTIVE_DEVICE] == self.CTD_ACTIVE_DEVICE_SBE19PlusV2:
                 self.toggle_sbe33_menu()
                 while self.ctd_status[self.CTD_ACTIVE_DEVICE] != self.CTD_ACTIVE_DEVICE_SBE33:
-                    print('init_state: waiting for sbe33...')
-                    time.sleep(0.5)
+                    logger.info('init_state: waiting for sbe33...')
+                    clock.sleep(0.5)
                 self.sbe33_active_event.clear()
                 self.enqueue_command('2', eol='\n')
                 self.enqueue_command('7', eol='\n')
                 self.sbe33_active_event.wait()
             elif self.ctd_status[self.CTD_ACTIVE_DEVICE] == self.CTD_ACTIVE_DEVICE_SBE33:
                 self.enqueue_command('2', eol='\n')
-                time.sleep(2)
+                clock.sleep(2)
             else:
-                print(f'init_state: what the heck device is active? {self.ctd_status[self.CTD_ACTIVE_DEVICE]}')
+                logger.warning('init_state: what the heck device is active? %s', self.ctd_status[self.CTD_ACTIVE_DEVICE])
             
             if self.sbe33_mode != 2:
                 while self.sbe33_mode != 2:
-                    time.sleep(0.25)
+                    clock.sleep(0.25)
 
             # now go ack top CTD to set config
             self.toggle_sbe33_menu() # go back to CTD
             while self.ctd_status[self.CTD_ACTIVE_DEVICE] != self.CTD_ACTIVE_DEVICE_SBE19PlusV2:
-                print('init_state: waiting for sbe19...')
-                time.sleep(0.5)
+                logger.info('init_state: waiting for sbe19...')
+                clock.sleep(0.5)
 
             self.ctd_configure()
         
@@ -208,7 +224,7 @@ class SBE33SerialDataPort():
             # for some reason ctdmon was restarted after starting the CTD
             # now read config from device
             self.enqueue_command('stop', '\r')
-            time.sleep(0.5)
+            clock.sleep(0.5)
             self.enqueue_command('getcd', '\r')
             self.getcd_read_event.wait()
             self.enqueue_command('startnow', '\r')
@@ -217,11 +233,11 @@ class SBE33SerialDataPort():
 
     def start(self):
         self.read_thr.start()
-        time.sleep(0.5)
+        clock.sleep(0.5)
         self.write_thr.start()
-        time.sleep(0.5)
+        clock.sleep(0.5)
         self.ext_cmd_thr.start()
-        time.sleep(0.5)
+        clock.sleep(0.5)
         self.threads_started = True
         
         self.init_state()
@@ -229,33 +245,29 @@ class SBE33SerialDataPort():
 
     def process_getcd_response(self) -> bool:
 
-        self.GetCD_str = self.GetCD_str.strip()
-        if self.ctd_config:
-            del self.ctd_config
-
-        self.ctd_config = sbe19v2plus.config.Config()
-        res = self.ctd_config.update_getcd_info(self.GetCD_str) 
-        if not res:
-            print('ERROR PARSING GETC XML')
-        print(self.ctd_config) #TODO Log
-        #TODO debug or Log
+        # the parser has been filling in a fresh Config as the XML arrived,
+        # swap it in only if the whole document parsed cleanly
+        res = self.getcd_parser is not None and self.getcd_parser.ok
+        if res:
+            self.ctd_config = self.getcd_parser.config
+        else:
+            logger.error('ERROR PARSING GETCD XML')
+        self.getcd_parser = None
+        logger.info('CTD config: %s', self.ctd_config)
         return res
 
 
     def update_state(self, line : str):
 
-        #TODO Log
-        # print(f'Check state change for line: {line}')
+        # logger.debug('Check state change for line: %s', line)
 
         if self.ctd_status[self.CTD_STATE] == self.CTD_STATE_READING_GETCD_CONFIG:
             self.ctd_status[self.CTD_ACTIVE_DEVICE] = self.CTD_ACTIVE_DEVICE_SBE19PlusV2
             self.sbe33_active_event.clear()
             self.sbe19_active_event.set()
-            self.GetCD_str += f"{line}\n"
-            if line.startswith(self.GETCD_CONFIG_XML_END):
+            if self.getcd_parser is None or self.getcd_parser.feed(f"{line}\n"):
+                # </ConfigurationData> seen (or the XML was malformed)
                 self.ctd_status[self.CTD_STATE] = self.CTD_STATE_COMMAND_PROMPT
-                # print('Parsing (GetCD) CTD configuration...')
-                #TODO Parse config info with elemTree
                 self.process_getcd_response()
                 self.getcd_read_event.set()
 
@@ -284,7 +296,8 @@ class SBE33SerialDataPort():
         elif line.startswith(self.GETCD_CONFIG_XML_START):
             self.ctd_status[self.CTD_STATE] = self.CTD_STATE_READING_GETCD_CONFIG
             self.ctd_status[self.CTD_ACTIVE_DEVICE] = self.CTD_ACTIVE_DEVICE_SBE19PlusV2
-            self.GetCD_str = line + '\n'
+            self.getcd_parser = sbe19v2plus.config.GetCDParser(sbe19v2plus.config.Config())
+            self.getcd_parser.feed(line + '\n')
             self.sbe33_active_event.clear()
             self.sbe19_active_event.set()
             # print('Reading (GetCD) CTD configuration...')
@@ -329,27 +342,35 @@ class SBE33SerialDataPort():
             line = ''
             while not self.quit_evt.is_set():
                 # print(f'CTD_STATUS: {self.ctd_status[self.CTD_STATE]}')
-                time.sleep(0.05)
-                # try:
-                self.lock.acquire()
+                # blocks for the next line, up to the port timeout. pyserial reads and
+                # writes from separate threads, so the lock is only for the writers
                 line = self.ser_port.readline()
-                self.lock.release()
                 if line:
-                    timestamp = round(datetime.utcnow().timestamp(), 2)
+                    self.lines_read.inc()
+                    timestamp = round(clock.time(), 2)
                     line_utf8 = line.decode(encoding='utf-8').strip()
 
                     self.update_state(line_utf8.strip())
-                    if re.search("^[A-Z0-9]{18}[A-Z0-9]+$", line_utf8) is not None:
+                    if self.is_data_line(line_utf8):
                         self.ctd_status[self.CTD_STATE] = self.CTD_STATE_ACQUIRING_DATA
                     # else:
                     #     print(f'not data rec: {line_utf8} {len(line_utf8)})')
 
+                    sample = None
                     if self.ctd_status[self.CTD_STATE] == self.CTD_STATE_ACQUIRING_DATA:
-                        sample_dict = self.parse_data(line_utf8)
-                        sample_dict["ts"] = timestamp
-                        sample_dict["type"] = 'ctd'
-                        of.write(f"{line_utf8} {sample_dict}\n")
-                        self.data_q.put(sample_dict)
+                        t0 = self.decode_time.start()
+                        sample = self.parse_data(line_utf8)
+                        self.decode_time.observe_since(t0)
+                        if sample is None:
+                            self.bad_scans.inc()
+
+                    if sample is not None:
+                        self.scans_decoded.inc()
+                        sample.ts = timestamp
+                        sample.c_id = self.client_id
+                        sample.wsta = "NYI"  # winch state
+                        of.write(f"{line_utf8} {sample.to_json()}\n")
+                        self.data_q.put(sample)
 
                     else:
                         of.write(f"{line_utf8}\n")
@@ -358,7 +379,7 @@ class SBE33SerialDataPort():
                 else:
                     pass
 
-        print('serial port read thread shutting down...')
+        logger.info('serial port read thread shutting down...')
         return
     
     def write_loop(self):
@@ -375,7 +396,7 @@ class SBE33SerialDataPort():
             finally:
                 cmd = ''
 
-        print('serial port write thread shutting down...')
+        logger.info('serial port write thread shutting down...')
 
     def external_command_monitor(self):
 
@@ -388,7 +409,7 @@ class SBE33SerialDataPort():
 
             cmd = cmd.lower()
             if cmd in self.CTD_CMD_LIST:
-                print(f'SBE33SerialPort: sending ext cmd: {cmd}')
+                logger.info('sending ext cmd: %s', cmd)
                 self.enqueue_command(cmd, '\r')
 
 
@@ -396,16 +417,15 @@ class SBE33SerialDataPort():
     def send_command(self, cmd : bytes):
 
         try:
-            self.lock.acquire()
-            self.ser_port.write(cmd)
-            self.ser_port.flush()
-            self.lock.release()
-            print(f'Command sent                   : [{cmd}]')
+            with self.lock:
+                self.ser_port.write(cmd)
+                self.ser_port.flush()
+            logger.info('Command sent: [%s]', cmd)
             self.last_command = cmd
         except serial.SerialTimeoutException as e:
-            print(e)
+            logger.error('timeout sending command [%s]: %s', cmd, e)
         except serial.SerialException as e:
-            print(e)
+            logger.error('ERROR sending command [%s]: %s', cmd, e)
         else:
             pass
 
@@ -414,7 +434,7 @@ class SBE33SerialDataPort():
         self.read_thr.join()
         self.write_thr.join()
         self.ext_cmd_thr.join()
-        print('closing serial port...')
+        logger.info('closing serial port...')
         self.ser_port.close()
 
     def expected_sample_line_length(self, has_gps : bool) -> int:
@@ -424,38 +444,11 @@ class SBE33SerialDataPort():
         if self.ctd_config.output_format == sbe19v2plus.config.SBE19OutputFmt.OUTPUT_FORMAT_1:
         # note: this is a HEX mode and will have 14 chars (7 bytes) of lat/lon info, if available
 
-            llen += 6  # temp
-            llen += 6  # conductivity
-            llen += 6  # pressure
-
-            if self.ctd_config.volt0: 
-                # print('expected_sample_line_;ength: Volt0: True')
-                # print(f'expected_sample_line_;ength: Volt0-len: {sbe19v2plus.config.SBE19v2plusVars["ofmt_1"]["volt0"]["len"]}')
-                llen += sbe19v2plus.config.SBE19v2plusVars["ofmt_1"]["volt0"]["len"]
-            if self.ctd_config.volt1: llen += sbe19v2plus.config.SBE19v2plusVars["ofmt_1"]["volt1"]["len"]
-            if self.ctd_config.volt2: llen += sbe19v2plus.config.SBE19v2plusVars["ofmt_1"]["volt2"]["len"]
-            if self.ctd_config.volt3: llen += sbe19v2plus.config.SBE19v2plusVars["ofmt_1"]["volt3"]["len"]
-            if self.ctd_config.volt4: llen += sbe19v2plus.config.SBE19v2plusVars["ofmt_1"]["volt4"]["len"]
-            if self.ctd_config.volt5: llen += sbe19v2plus.config.SBE19v2plusVars["ofmt_1"]["volt5"]["len"]
-            if self.ctd_config.sbe38: llen += sbe19v2plus.config.SBE19v2plusVars["ofmt_1"]["sbe38"]["len"]
-            if self.ctd_config.wetlabs: llen += sbe19v2plus.config.SBE19v2plusVars["ofmt_1"]["wetlabns"]["len"]
-            if self.ctd_config.GTD or self.ctd_config.DualGTD: 
-                llen += sbe19v2plus.config.SBE19v2plusVars["ofmt_1"]["GTD1_press"]["len"] + \
-                        sbe19v2plus.config.SBE19v2plusVars["ofmt_1"]["GTD1_tempc"]["len"]
-            if self.ctd_config.DualGTD:
-                llen += sbe19v2plus.config.SBE19v2plusVars["ofmt_1"]["GTD2_press"]["len"] + \
-                        sbe19v2plus.config.SBE19v2plusVars["ofmt_1"]["GTD2_tempc"]["len"]
-            if self.ctd_config.optode:  llen += sbe19v2plus.config.SBE19v2plusVars["ofmt_1"]["optode"]["len"]
-            if self.ctd_config.sbe63:
-                llen += sbe19v2plus.config.SBE19v2plusVars["ofmt_1"]["sbe_ox_ph"]["len"] + \
-                        sbe19v2plus.config.SBE19v2plusVars["ofmt_1"]["sbe63_ox_tempV"]["len"]
-            if self.ctd_config.mode == sbe19v2plus.config.SBE19Mode.MOORED_MODE:
-                # for exatr time stamp filed
-                llen += 8
+            llen = self.ctd_config.layout().frame_len
 
             # llen += 6 # for surface PAR depth: RIFT_OX NOT USING
             if has_gps:
-                llen += 14 # for gps
+                llen += sbe19v2plus.config.GPS_LEN
 
             # print(f'expecting line length: {llen}/ {has_gps}')
         return llen
@@ -465,113 +458,65 @@ class SBE33SerialDataPort():
         return len(line) == self.expected_sample_line_length(has_gps)
         
 
-    def parse_data(self, line : str) -> dict:
+    def is_data_line(self, line : str) -> bool:
+
+        if self.ctd_config.output_format == sbe19v2plus.config.SBE19OutputFmt.OUTPUT_FORMAT_3:
+            return self.DATA_LINE_DEC_RE.search(line) is not None
+        return self.DATA_LINE_HEX_RE.search(line) is not None
+
+    def parse_data(self, line : str) -> Union[CTDSample, None]:
         """Parse raw data line based on current output format.
-        Output a dict with parsed values in proper type: int or float
+        Returns a CTDSample with the real-time channels decoded (other
+        channels decode on first access), or None for a bad record.
         """
 
         line_str = line.strip()
 
         # print(f'line len: {len(line_str)}')
 
-        has_gps : bool = len(line_str) == 40  # OUTPUTFORMAT == 1 ONLY - it's 26 without gps
-        if self.data_len_correct(line, has_gps):
+        output_format = self.ctd_config.output_format
+        if output_format == sbe19v2plus.config.SBE19OutputFmt.OUTPUT_FORMAT_1:
 
-            if self.ctd_config.output_format == self.ctd_config.output_format.OUTPUT_FORMAT_1:
+            # GPS adds 14 chars to the channel data
+            has_gps : bool = len(line_str) == self.expected_sample_line_length(True)
+            if self.data_len_correct(line_str, has_gps):
                 # str_val_dict = self.extract_strings(line_str)
                 # print(f'parsing {line} for format 1')
                 return self._convert_output_format_1(line_str, has_gps)
-            else:  # unsupport format
-                #TODO log and send error msg/mqtt
-                # perhaps return the same dict but with raw input...?
 
-                print(f'parsing {line} UNSUPPORTED FORMAT')
-                return {}
-            
-        else:  # BAD DATA RECORD
-            #TODO log and send error msg/mqtt
+        elif output_format == sbe19v2plus.config.SBE19OutputFmt.OUTPUT_FORMAT_3:
+
+            fields = line_str.split(',')
+            if len(fields) == self.ctd_config.layout().dec_fields:
+                return self._convert_output_format_3(line_str, fields)
+
+        else:  # unsupport format
+            #TODO send error msg/mqtt
             # perhaps return the same dict but with raw input...?
-            print(f'parsing {line} UNEXPECTED LEN: {len(line)}')
-            return {}
+
+            logger.warning('parsing %s UNSUPPORTED FORMAT', line)
+            return None
+
+        # BAD DATA RECORD
+        #TODO send error msg/mqtt
+        # perhaps return the same dict but with raw input...?
+        logger.warning('parsing %s UNEXPECTED LEN: %d', line.strip(), len(line))
+        return None
 
 
-    
     def altimeter_meters(self, volts, minV=0, maxV=10):
         # VA500 100m range
         # votlages may be set to 0-5 or 0-10 range in configuration.
         volts_m = (100)/(maxV - minV) * volts
         return volts_m
 
-    def _convert_output_format_1(self, line : str, has_gps : bool) -> dict:
+    def _convert_output_format_1(self, line : str, has_gps : bool) -> CTDSample:
 
-        cfg = self.ctd_config
-        res = {}
+        layout = self.ctd_config.layout()
 
         # 2BC30D 103CA5 018861 A67E ACBD 19138B5974E941
-        pos = 0
-        tempstr = line[pos:pos+6]; pos += 6
-        res["t_c"] = round((int(tempstr, 16) / 100000) - 10, 4)
-        condstr = line[pos:pos+6]; pos += 6
-        res["cond"] = round((int(condstr, 16) / 1000000) - 1, 4)
-        presstr = line[pos:pos+6]; pos += 6
-        res["pres"] = round((int(presstr, 16) / 1000) - 100, 4)
-
-
-        if cfg.volt0:
-            strval = line[pos:pos+4]; pos += 4
-            res["v0"] = round(int(strval, 16) / 13107, 4)
-            res["alt_m"] = round(self.altimeter_meters(res["volt0"], 
-                                                            minV=0, 
-                                                            maxV=self.altimeter_max_volts), 2)
-        if cfg.volt1:
-            strval = line[pos:pos+4]; pos += 4
-            res["v1"] = round(int(strval, 16) / 13107, 4)
-        if cfg.volt2:
-            strval = line[pos:pos+4]; pos += 4
-            res["v2"] = round(int(strval, 16) / 13107, 4)
-        if cfg.volt3:
-            strval = line[pos:pos+4]; pos += 4
-            res["v3"] = round(int(strval, 16) / 13107, 4)
-        if cfg.volt4:
-            strval = line[pos:pos+4]; pos += 4
-            res["v4"] = round(int(strval, 16) / 13107, 4)
-        if cfg.volt5:
-            strval = line[pos:pos+4]; pos += 4
-            res["v5"] = round(int(strval, 16) / 13107, 4)
-
-        if cfg.sbe38:
-            strval = line[pos:pos+5]; pos += 5
-            res["sbe38"] = round((int(strval, 16) / 100000) - 10, 4)
-
-        if cfg.wetlabs:
-            strval = line[pos:pos+12]; pos += 12
-            res["wetlabs"] = round(int(strval, 16), 4)
-
-        if cfg.GTD or cfg.DualGTD:
-            strval = line[pos:pos+8]; pos += 8
-            res["GTD1_press"] = round(int(strval, 16) / 100000, 4)
-            strval = line[pos:pos+6]; pos += 6
-            res["GTD1_tempc"] = round((int(strval, 16) / 100000) -10, 4)
-
-        if cfg.DualGTD:
-            strval = line[pos:pos+8]; pos += 8
-            res["GTD2_press"] = round(int(strval, 16) / 100000, 4)
-            strval = line[pos:pos+6]; pos += 6
-            res["GTD2_tempc"] = round((int(strval, 16) / 100000) -10, 4)
-
-        if cfg.optode:
-            strval = line[pos:pos+6]; pos += 6
-            res["optode"] = round((int(strval, 16) / 10000) - 10, 4)
-
-        if cfg.sbe63:  
-            strval = line[pos:pos+6]; pos += 6
-            res["ox_ph"] = round((int(strval, 16) / 100000) - 10, 4)
-            strval = line[pos:pos+6]; pos += 6
-            res["ox_temp_vstr"] = round((int(strval, 16) / 1000000) - 1, 4)
-
-        if cfg.mode == sbe19v2plus.config.SBE19Mode.MOORED_MODE:
-            strval = line[pos:pos+8]; pos += 8
-            res["time2000"] = round(int(strval, 16), 4)
+        sample = CTDSample.from_hex(line, layout)
+        pos = layout.frame_len
 
         if has_gps:
             # assuming NMEA from GPS data is here
@@ -584,18 +529,36 @@ class SBE33SerialDataPort():
             lon2 = line[pos:pos+2]; pos += 2
             lon3 = line[pos:pos+2]; pos += 2
             lon = ( int(lon1, 16) * 2**16 + int(lon2, 16) * 2**8 + int(lon3, 16) ) / 50000
-            hemispheres_byte = int(line[pos:pos+1], 16); pos += 1
+            # bit 7: southern latitude, bit 6: western longitude
+            hemispheres_byte = int(line[pos:pos+2], 16); pos += 2
             if ((hemispheres_byte >> 6) & 1) == 1:
                 lon = -lon
-            if ((hemispheres_byte >> 6) & 1) == 1:
+            if ((hemispheres_byte >> 7) & 1) == 1:
                 lat = -lat
         else:
             # assuming at SIO, approx
             lat = 32
             lon = -117
 
-        res["dep_m"] = round(-gsw.z_from_p(res["pres"], lat), 2)  # make positive depth down from surface
-        res["lat"] = lat
-        res["lon"] = lon
+        return self._add_derived(sample, lat, lon)
 
-        return res
+    def _convert_output_format_3(self, line : str, fields : list) -> CTDSample:
+
+        #   23.7658,  0.00019,    0.062, 3.2519, 3.3738
+        sample = CTDSample.from_dec(line, fields, self.ctd_config.layout())
+
+        # no NMEA position in converted decimal output, assuming at SIO, approx
+        return self._add_derived(sample, 32, -117)
+
+    def _add_derived(self, sample : CTDSample, lat : float, lon : float) -> CTDSample:
+
+        if sample.v0 is not None:
+            sample.alt_m = round(self.altimeter_meters(sample.v0, 
+                                                            minV=0, 
+                                                            maxV=self.altimeter_max_volts), 2)
+
+        sample.dep_m = round(float(-gsw.z_from_p(sample.pres, lat)), 2)  # make positive depth down from surface
+        sample.lat = lat
+        sample.lon = lon
+
+        return sample
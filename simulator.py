@@ -1,179 +1,363 @@
 #!/usr/bin/env python3
 
+"""Closed-loop RIFT-OX cast simulator.
+
+Runs the real winctl threads (pausemon, wincmd, winmon) and the real CTD
+reader (SBE33SerialDataPort) against the DIO MCU and SBE33/SBE19plus
+emulators, with the emulated CTD's depth and altitude following the
+emulated winch's payout over a seafloor profile. It publishes START and
+follows the cast through STAGING, DOWNCAST, MAXDEPTH, UPCAST with bottle
+pauses and UPSTAGED back to PARKED, then reports phase timings and how far
+from each target depth the winch actually stopped.
+
+The MQTT broker from the config file must be running, as for the daemons.
+
+    ./simulator.py --simulation cast --time-scale 5 --seafloor 0:250,1800:200 \\
+        --max-depth 300 --min-altitude 20 --pause-depths 150,100,50
+
+--time-scale N runs everything on a clock.ScaledClock, N times faster
+than real time. Timings in the report are in that clock's seconds. Python
+thread scheduling and pty round trips are not scaled, so at large N they
+start to show up as extra stop error.
+"""
+
 import argparse
 import json
-import logging
+from pathlib import Path
 import queue
 import signal
 import sys
+import tempfile
 import threading
 import time
+from typing import Union
 
+import gsw
 import paho.mqtt.client as mqtt
 
+import clock
 import config
-
-SIMULATION_DOWNCAST = 'downcast'
+import log
+import mqttbus
+from sbe19v2plus.emulator import SBE33Emulator, default_scan_values
+from sbe19v2plus.sample import CTDSample
+from sbe19v2plus.sbe33_serialport import SBE33SerialDataPort
+import winch.pausemon
+import winch.winmon
+import winch.wincmd
+from winch import WinchCmd, WinchStateName, pub_cmd
+from winch.dio_emulator import DIOEmulator, WinchModel
+from winch.latest_value import LatestValue
+
+SIMULATION_CAST = 'cast'
+
+CTD_SCANS_PER_SEC = 4       # SBE19plus V2 profiling rate
+# the winctl threads' shared connection, sim-ctdmon and sim-mon stand in for other daemons
+WINCTL_CLIENT_ID = 'sim-winctl'
+ALT_VOLT_RANGE = 5          # VA500 0-5V for 0-100m
 
 parser = argparse.ArgumentParser()
 
-parser.add_argument("--simulation", help="simulate RIFT-OX actions using MQTT messages",  
-                    choices=['downcast'], type=str)
-
-args = parser.parse_args()
-
-
-def client_loop(client, broker, port, keepalive):
-    t = threading.Thread(target = client_loop, args=(client,broker,port,60), name='simul:client')
-    t.start()
-
-def simulate_downcast(cfg: dict, ctd_simul : mqtt.Client, monitor_client : mqtt.Client, cmd_q : queue.Queue, start_evt : threading.Event):
-    """send CTD data and altimeter messages that 
-    will simulate a downcast. Simulation leaves carousel 
-    at simulated sea floor.
-    
-    Both CTD and Alimeter msgs will be generated at 
-    DEPTH_DATA_RECS_PER_SEC times per second. The depth 
-    will be increased at the rate of PAYOUT_RATE meters per second.
-    
-    If winch publishes 'WINCH_STOP' command has been received, 
-    break out of downcast loop"""
-
-    SEA_FLOOR_DEPTH = 30         # meters. Once at this depth, This will trigger altimeter proximity
-    DEPTH_DATA_RECS_PER_SEC = 4  # CTD and Altimeter data sent per second 
-    PAYOUT_RATE = .3             # m/s. Probably shouldn't try it with values > 1.0
-
-    print('simulator: waiting for GOSTART command')
-    direction = 'stop'
-    start_evt.wait()
-
-
-    cur_depth : float = 0  # current depth in meters
-    while (cur_depth < SEA_FLOOR_DEPTH) and cur_depth >= 0:
-
-        try:
-            cmd_msg = cmd_q.get(block=False)
-        except queue.Empty:
-            pass
+parser.add_argument("--simulation", help="simulate a full RIFT-OX cast against emulated CTD and winch hardware",
+                    choices=[SIMULATION_CAST], default=SIMULATION_CAST, type=str)
+parser.add_argument("--time-scale", help="run the cast this many times faster than real time", default=1.0, type=float)
+parser.add_argument("--seafloor", help="seafloor depth profile, comma separated <cast secs>:<depth m>",
+                    default="0:250", type=str)
+parser.add_argument("--max-depth", help="override [winch] MAX_DEPTH", default=None, type=float)
+parser.add_argument("--min-altitude", help="override [winch] MIN_ALTITUDE", default=None, type=float)
+parser.add_argument("--pause-depths", help="comma separated bottle pause depths, overrides PAUSE_DEPTHS_FN",
+                    default=None, type=str)
+parser.add_argument("--pause-secs", help="override [winch] PAUSE_DURATION_SECS and BOTTLE_PAUSE_DURATION_SECS",
+                    default=None, type=float)
+parser.add_argument("--timeout", help="give up after this many real secs", default=3600, type=float)
+
+
+class SeafloorProfile:
+    """Seafloor depth under the ship, linear between (cast secs, depth m) points
+    and constant before the first and after the last"""
+
+    def __init__(self, points: list[tuple[float, float]]):
+        self.points = sorted(points)
+
+    @classmethod
+    def from_arg(cls, arg: str) -> 'SeafloorProfile':
+        points = []
+        for point in arg.split(','):
+            t, depth = point.split(':')
+            points.append((float(t), float(depth)))
+        return cls(points)
+
+    def depth(self, t: float) -> float:
+        if t <= self.points[0][0]:
+            return self.points[0][1]
+        for (t0, d0), (t1, d1) in zip(self.points, self.points[1:]):
+            if t <= t1:
+                return d0 + (d1 - d0) * (t - t0) / (t1 - t0)
+        return self.points[-1][1]
+
+
+class RecordingStatus(LatestValue):
+    """Latest winch status that also keeps (time, state, payout depth) for every state change"""
+
+    def __init__(self):
+        super().__init__()
+        self.timeline: list[tuple[float, str, float]] = []
+
+    def set(self, value) -> int:
+        if value and (not self.timeline or self.timeline[-1][1] != value["state"]):
+            self.timeline.append((clock.monotonic(), value["state"], value["depth_m"]))
+        return super().set(value)
+
+
+class CastSimulator:
+
+    def __init__(self, cfg: config.Config, time_scale: float, seafloor: SeafloorProfile,
+                 pause_depths: Union[None, list[float]] = None, lat: float = 32.87):
+
+        self.cfg = cfg
+        self.time_scale = time_scale
+        self.seafloor = seafloor
+        self.lat = lat
+        self.quit_evt = threading.Event()
+        self.winch_status = RecordingStatus()
+        self.commands: list[tuple[float, str]] = []
+        self.threads: list[threading.Thread] = []
+        self.winctl_threads: list[threading.Thread] = []
+        self.winctl_quit_evt = threading.Event()
+        self.monitor_client: Union[None, mqtt.Client] = None
+        self.start_t = clock.monotonic()
+        self.tmp_dir = Path(tempfile.mkdtemp(prefix='rift-ox-sim-'))
+
+        if pause_depths is not None:
+            # winmon reads pause depths from ~/config/<PAUSE_DEPTHS_FN>; an absolute path overrides ~/config
+            depths_fn = self.tmp_dir.joinpath('pause_depths.toml')
+            depths_fn.write_text(f'DEPTHS = {json.dumps(pause_depths)}\n')
+            self.cfg = self.cfg.replace('bottles', PAUSE_DEPTHS_FN=str(depths_fn))
+
+        self.model = WinchModel(sheave_radius_inch=self.cfg.winch.SHEAVE_RADIUS_INCH,
+                                cable_diameter_inch=self.cfg.winch.SEA_CABLE_DIAMETER_INCH,
+                                payout_rate_mps=0.67, inertia_s=0.25)
+        self.dio = DIOEmulator(self.cfg, model=self.model)
+        self.cfg = self.cfg.replace('rift-ox-pi', LOG_DIR=str(self.tmp_dir), DIO_PORT=self.dio.open(), SIMULATION=False)
+
+        self.ctd = SBE33Emulator(scan_rate=CTD_SCANS_PER_SEC,
+                                 scan_values=self.scan_values, lat=lat)
+        self.ctd_port_name = self.ctd.open()
+
+        self.data_q: queue.Queue = queue.Queue()
+        self.ext_cmd_q: queue.Queue = queue.Queue()
+        self.ctd_io = SBE33SerialDataPort(str(self.tmp_dir.joinpath('serialport.log')), self.quit_evt,
+                                          self.data_q, self.ext_cmd_q, self.ctd_port_name, 9600, ALT_VOLT_RANGE,
+                                          client_id='sim-ctd')
+
+    def cast_secs(self) -> float:
+        return clock.monotonic() - self.start_t
+
+    def true_depth(self) -> float:
+        # payout is measured from the bullet resting on the latch, at the surface
+        return max(self.model.payout_m, 0.0)
+
+    def scan_values(self, t: float) -> dict:
+        depth = self.true_depth()
+        altitude = self.seafloor.depth(self.cast_secs()) - depth
+        values = default_scan_values(t)
+        values['pres'] = round(float(gsw.p_from_z(-depth, self.lat)), 3)
+        values['v0'] = round(max(min(altitude, 100), 0) * ALT_VOLT_RANGE / 100, 4)
+        return values
+
+    def data_relay_loop(self):
+
+        client = mqtt.Client('sim-ctdmon')
+        client.connect(self.cfg["mqtt"]["HOST"], self.cfg["mqtt"]["PORT"])
+        client.loop_start()
+        while not self.quit_evt.is_set():
+            try:
+                sample: CTDSample = self.data_q.get(block=True, timeout=0.5)
+                self.data_q.task_done()
+            except queue.Empty:
+                continue
+            client.publish(self.cfg["mqtt"]["CTD_DATA_TOPIC"], sample.to_json_bytes(), qos=2)
+        client.loop_stop()
+        client.disconnect()
+
+    def on_cmd_msg(self, client, userdata, message):
+
+        msg_json = json.loads(message.payload.decode("utf-8"))
+        if message.topic == self.cfg["mqtt"]["CTD_CMD_TOPIC"]:
+            # what ctdmon does with CTD commands from winmon
+            self.ext_cmd_q.put(msg_json['command'])
         else:
-            cmd = cmd_msg['command']
-            print(f'simulator:downcast {round(time.time(), 2)} received command: {cmd}')
-            if cmd == 'reverse':
-                direction = 'reverse'
-            elif cmd == 'forward':
-                direction = 'forward'
-            else:
-                direction = 'stop'
-
-        if direction == 'forward':
-            cur_depth += PAYOUT_RATE / DEPTH_DATA_RECS_PER_SEC
-        elif direction == 'reverse':
-            cur_depth -= PAYOUT_RATE / DEPTH_DATA_RECS_PER_SEC
-
-        time.sleep(1/DEPTH_DATA_RECS_PER_SEC)
-        payload = {
-            'client_id': 'sim-pusher',
-            'timestamp': round(time.time(), 2),
-            'record_type': 'ctddata',
-            'depth_m': round(cur_depth, 2),
-            'altitude': round(SEA_FLOOR_DEPTH - cur_depth, 2)
-        }
-        ctd_simul.publish(cfg["mqtt"]["CTD_DATA_TOPIC"], json.dumps(payload), qos=2)
-        print(f'DOWNCAST SIMULATOR: Depth: {round(cur_depth, 2)}, Altitude: {round(SEA_FLOOR_DEPTH - cur_depth, 2)}')
-
-            
-def create_pubber_client(client_name : str, broker : str = 'localhost', port : int = 1883) -> mqtt.Client:
-
-    client_id = client_name
-    client = mqtt.Client(client_id)
-    client.on_connect = on_connect
-    client.on_disconnect = on_disconnect
-
-    return client
-
-def on_connect(client : mqtt.Client, userdata, flags, rc):
-
-    if rc==0:
-        print(f"connected OK: {client}")          
-    else:
-        print("Bad connection Returned code=",rc)
-        client.loop_stop()  
-
-def on_disconnect(client, userdata, rc):
-   client.connected_flag=False #set flag
-   print("client disconnected ok")
-
-def on_publish(client, userdata, mid):
-   print("In on_pub callback mid= "  ,mid)
-
-def on_subscribe(client, userdata, mid, granted_qos):
-    print("Subscribed: "+str(mid)+" "+str(granted_qos))
-
-def interrupt_handler(signum, frame):
-
-    # print(f'Handling signal {signum} ({signal.Signals(signum).name}).')
-    monitor_client.loop_stop()
-    simulator_client.loop_stop()
+            cmd = msg_json['command'].upper()
+            if not self.commands or self.commands[-1][1] != cmd:
+                print(f'simulator: {self.cast_secs():8.1f}s depth {self.true_depth():7.2f}m command: {cmd}')
+            self.commands.append((clock.monotonic(), cmd))
+
+    def start(self):
+        """Start the emulators, the CTD reader, the data relay and the winctl threads"""
+
+        self.dio.start()
+        self.ctd.start()
+
+        self.threads = [
+            threading.Thread(target=self.ctd_io.start, name='sim:ctd_io'),
+            threading.Thread(target=self.data_relay_loop, name='sim:datarelay'),
+        ]
+        for thr in self.threads:
+            thr.start()
+        mqttbus.start(self.cfg, WINCTL_CLIENT_ID)
+        self.start_winctl()
+
+        self.monitor_client = mqtt.Client('sim-mon')
+        self.monitor_client.on_message = self.on_cmd_msg
+        self.monitor_client.connect(self.cfg["mqtt"]["HOST"], self.cfg["mqtt"]["PORT"])
+        self.monitor_client.subscribe([(self.cfg["mqtt"]["WINCH_CMD_TOPIC"], 2), (self.cfg["mqtt"]["CTD_CMD_TOPIC"], 2)])
+        self.monitor_client.loop_start()
+
+    def start_winctl(self):
+        """Start pausemon, wincmd and winmon, with a new Winch that starts out PARKED"""
+
+        self.winctl_quit_evt = threading.Event()
+        self.winctl_threads = [
+            threading.Thread(target=winch.pausemon.pause_monitor, args=(self.cfg, self.winctl_quit_evt), name="pausemon"),
+            threading.Thread(target=winch.wincmd.wincmd_loop, args=(self.cfg, self.winch_status, self.winctl_quit_evt), name="wincmd"),
+            threading.Thread(target=winch.winmon.winmon_loop, args=(self.cfg, self.winch_status, self.winctl_quit_evt), name="winmon"),
+        ]
+        for thr in self.winctl_threads:
+            thr.start()
+
+    def stop_winctl(self):
+        self.winctl_quit_evt.set()
+        for thr in self.winctl_threads:
+            thr.join()
+
+    def wait_for_ctd(self, timeout: float) -> bool:
+        """Wait up to timeout real secs for the CTD reader to start up and the first scan to go out"""
+
+        print('simulator: waiting for CTD data...')
+        deadline = time.monotonic() + timeout
+        while self.ctd.scans_sent == 0 and time.monotonic() < deadline and not self.quit_evt.is_set():
+            time.sleep(0.5)
+        return self.ctd.scans_sent > 0
+
+    def run_cast(self, timeout: float) -> bool:
+        """Publish START and wait up to timeout real secs for the winch to get back to PARKED"""
+
+        self.start_t = clock.monotonic()
+        first = len(self.winch_status.timeline)
+        pub_cmd(self.monitor_client, self.cfg["mqtt"]["WINCH_CMD_TOPIC"], WinchCmd.WINCH_CMD_START.value)
+
+        finished = False
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline and not self.quit_evt.is_set():
+            states = [state for _, state, _ in self.winch_status.timeline[first:]]
+            if WinchStateName.PARKED.value in states:
+                finished = True
+                break
+            time.sleep(0.5)
+        # let the winch settle on the latch
+        clock.sleep(2)
+        return finished
+
+    def stop(self):
+
+        self.quit_evt.set()
+        self.stop_winctl()
+        mqttbus.stop()
+        self.monitor_client.loop_stop()
+        self.threads[1].join()
+        self.ctd_io.quit()
+        self.threads[0].join()
+        self.ctd.stop()
+        self.dio.stop()
+
+    def run(self, timeout: float) -> bool:
+        """Run one cast from PARKED back to PARKED. Returns False on timeout."""
+
+        deadline = time.monotonic() + timeout
+        self.start()
+        finished = self.wait_for_ctd(timeout) and self.run_cast(deadline - time.monotonic())
+        self.stop()
+        return finished
+
+    def report(self):
+
+        MIN_ALTITUDE = float(self.cfg["winch"]["MIN_ALTITUDE"])
+        MAX_DEPTH = float(self.cfg["winch"]["MAX_DEPTH"])
+        STAGING_DEPTH = float(self.cfg["winch"]["STAGING_DEPTH"])
+
+        timeline = [entry for entry in self.winch_status.timeline if entry[0] >= self.start_t]
+        pause_depths = []
+        depths_fn = Path(self.cfg['bottles']['PAUSE_DEPTHS_FN'])
+        if depths_fn.is_absolute():
+            pause_depths = sorted(json.loads(depths_fn.read_text().split('=', 1)[1]), reverse=True)
+
+        print()
+        print(f'time scale {self.time_scale}x, logs in {self.tmp_dir}')
+        print(f'{"state":<12} {"cast secs":>9} {"secs in state":>13} {"target m":>9} {"stopped m":>9} '
+              f'{"error m":>8} {"payout m":>9} {"payout err":>10}')
+
+        max_depth = max((depth for _, _, depth in timeline), default=0.0)
+        bottle_targets = [d for d in pause_depths if STAGING_DEPTH < d < max_depth]
+        for i, (t, state, payout_depth) in enumerate(timeline):
+
+            secs_in_state = (timeline[i + 1][0] if i + 1 < len(timeline) else clock.monotonic()) - t
+            target: Union[None, float] = None
+            if state in (WinchStateName.DOWN_STAGED.value, WinchStateName.UP_STAGED.value):
+                target = STAGING_DEPTH
+            elif state == WinchStateName.MAXDEPTH.value:
+                target = MAX_DEPTH
+                if MIN_ALTITUDE >= 0:
+                    target = min(target, self.seafloor.depth(t - self.start_t) - MIN_ALTITUDE)
+            elif state == WinchStateName.UP_PAUSED.value and bottle_targets:
+                target = bottle_targets.pop(0)
+            elif state == WinchStateName.PARKED.value:
+                target = 0.0
+
+            # where the winch came to rest after the stop that led to this state
+            stops = [rest for stop_t, _, rest in self.model.stops if stop_t <= t]
+            cells = f'{state:<12} {t - self.start_t:>9.1f} {secs_in_state:>13.1f}'
+            if target is not None and stops:
+                stopped = max(stops[-1], 0.0)
+                cells += (f' {target:>9.2f} {stopped:>9.2f} {stopped - target:>+8.2f}'
+                          f' {payout_depth:>9.2f} {payout_depth - stopped:>+10.2f}')
+            print(cells)
+
+        total = timeline[-1][0] - self.start_t if timeline else 0.0
+        print(f'cast took {total:.0f} cast secs ({total / self.time_scale:.0f} real secs), '
+              f'{len(self.model.stops)} winch stops, {self.dio.commands} DIO commands, {self.ctd.scans_sent} CTD scans')
 
-    # do whatever...
-    time.sleep(1)
-    sys.exit(0)
 
-
-def on_cmd_msg(client, userdata, message):
-
-    # print(f"CMD Message on topic {message.topic}: ",str(message.payload.decode("utf-8")))
-    msg_str = message.payload.decode("utf-8")
-    print(f'simulation:on_cmd_msg: {round(time.time(), 2)} received msg: {msg_str}')
-    msg_json = json.loads(msg_str)
-    if msg_json['command'] in ['start', 'stop', 'forward', 'reverse']:
-        cmd = {
-            "command": msg_json['command']
-        }
-        if msg_json["command"] == 'gostart':
-            start_evt.set()
-        else:
-            cmd_q.put(cmd)
-        # elif msg_json['command'] == 'stop':
-        # elif msg_json['command'] == 'forward':
-        # elif msg_json['command'] == 'reverse':
+def interrupt_handler(signum, frame):
+    sim.quit_evt.set()
 
 
 if __name__ == "__main__":
 
-    signal.signal(signal.SIGINT, interrupt_handler)
+    args = parser.parse_args()
 
     cfg = config.read()
     if cfg == None:
         print(f'simulator: ERROR unable to read rift-ox.toml config file. Quitting.')
         sys.exit(1)
 
-    if args.simulation == SIMULATION_DOWNCAST:
-
-        print("Simulating DOWNCAST...")
-
-        print('Constructing internal message Queue...')
-
-        start_evt = threading.Event()
-
-        monitor_client = mqtt.Client('sim-mon')
-        monitor_client.on_message = on_cmd_msg
-        monitor_client.connect('localhost', 1883)
-        monitor_client.subscribe([(cfg["mqtt"]["WINCH_CMD_TOPIC"], 2)], qos=2)
-        monitor_client.loop_start()
-        cmd_q = queue.Queue()
-
-
-        # create simlutor publish client
-        simulator_client = create_pubber_client('sim-pusher', 'localhost', 1883)
-        simulator_client.connect('localhost', 1883)
-        simulator_client.loop_start()
-
-        res = simulate_downcast(cfg, simulator_client, monitor_client, cmd_q, start_evt)
-
-        monitor_client.loop_stop()
-        simulator_client.loop_stop()
-
-
+    if args.max_depth is not None:
+        cfg = cfg.replace('winch', MAX_DEPTH=args.max_depth)
+    if args.min_altitude is not None:
+        cfg = cfg.replace('winch', MIN_ALTITUDE=args.min_altitude)
+    if args.pause_secs is not None:
+        cfg = cfg.replace('winch', PAUSE_DURATION_SECS=args.pause_secs, BOTTLE_PAUSE_DURATION_SECS=args.pause_secs)
+    pause_depths = None
+    if args.pause_depths is not None:
+        pause_depths = [float(depth) for depth in args.pause_depths.split(',') if depth]
+
+    clock.use(clock.ScaledClock(args.time_scale))
+    sim = CastSimulator(cfg, args.time_scale, SeafloorProfile.from_arg(args.seafloor), pause_depths)
+    log.setup(sim.cfg, 'simulator')
+    signal.signal(signal.SIGINT, interrupt_handler)
 
-    
\ No newline at end of file
+    print(f'Simulating a full cast at {args.time_scale}x...')
+    finished = sim.run(args.timeout)
+    sim.report()
+    if not finished:
+        print('simulator: cast did not finish (timeout or interrupted)')
+        sys.exit(1)
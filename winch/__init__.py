@@ -3,10 +3,17 @@
 from collections import namedtuple
 from enum import Enum
 import json
+import logging
 from pathlib import Path
+from typing import Union
 
 import paho.mqtt.client as mqtt
 
+import metrics
+import mqttbus
+
+logger = logging.getLogger(__name__)
+
 home_dir = str(Path.home())
 
 class WinchDir(Enum):
@@ -89,7 +96,7 @@ WINCH_CMD_LIST = {
 # DIO_VALID_MODES               = [DIO_MODE_DRAIN,
 #                                  DIO_MODE_SOURCE]
 
-def pub_cmd(pubber: mqtt.Client, topic: str, command: str, **kwargs) -> bool:
+def pub_cmd(pubber: Union[mqtt.Client, mqttbus.Connection], topic: str, command: str, **kwargs) -> bool:
 
     if command.upper() == 'GOSCIENCE':
         command = 'START'
@@ -99,8 +106,17 @@ def pub_cmd(pubber: mqtt.Client, topic: str, command: str, **kwargs) -> bool:
     }
     for key, val in kwargs.items():
         cmd[key] = val
+    publish_time = metrics.histogram('winch_cmd_publish_seconds', 'winch command publish to PUBCOMP')
+    t0 = publish_time.start()
     msg_info = pubber.publish(topic, json.dumps(cmd).encode(), qos=2)
-    msg_info.wait_for_publish(1)
+    try:
+        msg_info.wait_for_publish(1)
+    except (RuntimeError, ValueError) as e:
+        # not connected, or too much queued already
+        logger.error('ERROR publishing msg %s to topic %s: %s', cmd, topic, e)
+        return False
+    if msg_info.is_published():
+        publish_time.observe_since(t0)
     if not msg_info.is_published():
-        print(f'ERROR publishing msg {cmd} to topic {topic}')
+        logger.error('ERROR publishing msg %s to topic %s', cmd, topic)
     return msg_info.is_published()
@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+
+from bisect import bisect_left
+from dataclasses import asdict, dataclass
+import logging
+from math import inf
+from typing import Union
+
+from config import Config
+
+from . import WinchCmd, WinchDir
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Waypoint:
+    depth_m: float
+    leg: str            # WinchDir value, the direction the winch arrives from
+    action: str         # WinchCmd value sent on arriving
+    dwell_secs: float   # time spent there before moving on
+    eta: Union[None, float] = 0.0   # clock time of arrival, None when skipped
+    done: bool = False
+    skipped: bool = False   # passed before it was planned, never reached
+
+
+class CastPlan:
+    """The stops of one cast, worked out once at START from the pause depths,
+    MAX_DEPTH, STAGING_DEPTH, MIN_ALTITUDE and BATHYMETRY_DEPTH_M (0 when
+    unknown), in the order the winch gets to them:
+
+        STAGING_DEPTH  down  PAUSE
+        bottom         down  STOP-AT-MAX-DEPTH
+        pause depths   up    BOTTLE-PAUSE, deepest first
+        STAGING_DEPTH  up    UP-STAGE
+        0              up    PARK
+
+    Each has an ETA from PAYOUT_RATE_MPS and the pause durations. The ETAs
+    after a waypoint are redone from the time it is reached, and the whole
+    up leg when revise_bottom() learns where the bottom really is.
+
+    Bottle pauses added by revise_pauses() below the winch on its way up are
+    kept in the plan as skipped, with no ETA.
+
+    The up leg bottle pauses are kept sorted by depth, so the next one is a
+    bisect below the last one reached rather than a scan:
+
+        stop = plan.next_up_stop()
+        if stop and cur_depth < stop.depth_m + DEPTH_OFFSET_M:
+            ...
+            plan.reached(stop, clock.time())
+    """
+
+    def __init__(self, cfg: Config, pause_depths: list[float], start_ts: float):
+        winch_cfg = cfg.winch
+        self.staging_m = winch_cfg.STAGING_DEPTH
+        self.max_depth_m = winch_cfg.MAX_DEPTH
+        self.min_altitude_m = winch_cfg.MIN_ALTITUDE
+        self.rate_mps = winch_cfg.PAYOUT_RATE_MPS
+        self.pause_secs = winch_cfg.PAUSE_DURATION_SECS
+        self.bottle_pause_secs = winch_cfg.BOTTLE_PAUSE_DURATION_SECS
+
+        self.start_ts = start_ts
+        self.revision = 0
+        self.pause_depths = sorted(set(float(depth) for depth in pause_depths))
+
+        self.bottom_m = self.max_depth_m
+        if winch_cfg.BATHYMETRY_DEPTH_M > 0:
+            self.bottom_m = self.bottom_from(winch_cfg.BATHYMETRY_DEPTH_M)
+
+        self._down_leg: list[Waypoint] = [
+            Waypoint(self.staging_m, WinchDir.DIRECTION_DOWN.value, WinchCmd.WINCH_CMD_PAUSE.value, self.pause_secs),
+            Waypoint(self.bottom_m, WinchDir.DIRECTION_DOWN.value, WinchCmd.WINCH_CMD_STOP_AT_MAX_DEPTH.value, self.pause_secs),
+        ]
+        self._surfacing: list[Waypoint] = [
+            Waypoint(self.staging_m, WinchDir.DIRECTION_UP.value, WinchCmd.WINCH_CMD_UPSTAGE.value, self.pause_secs),
+            Waypoint(0.0, WinchDir.DIRECTION_UP.value, WinchCmd.WINCH_CMD_PARK.value, 0.0),
+        ]
+        self.waypoints: list[Waypoint] = []
+        # up leg bottle pauses, ascending depth, and their depths to bisect
+        self._up_stops: list[Waypoint] = []
+        self._up_keys: list[float] = []
+        # depth of the last bottle pause reached, those below it are behind us
+        self._up_limit: float = inf
+        self._build_up_leg()
+        self._retime(start_ts, 0.0, 0)
+
+    def bottom_from(self, seafloor_m: float) -> float:
+        """Where the winch will stop over seafloor at `seafloor_m`"""
+        return min(self.max_depth_m, seafloor_m - max(self.min_altitude_m, 0.0))
+
+    def _build_up_leg(self):
+        # bottle pauses reached keep their arrival time, the others at or below
+        # the last one reached (or the winch) are behind it and skipped
+        reached = {stop.depth_m: stop for stop in self._up_stops if stop.done}
+        depths = set(depth for depth in self.pause_depths if self.staging_m < depth < self.bottom_m)
+        self._up_stops = [reached.get(depth) or self._bottle_pause(depth) for depth in sorted(depths | set(reached))]
+        self._up_keys = [stop.depth_m for stop in self._up_stops]
+        self.waypoints = self._down_leg + list(reversed(self._up_stops)) + self._surfacing
+
+    def _bottle_pause(self, depth: float) -> Waypoint:
+        if depth >= self._up_limit:
+            return Waypoint(depth, WinchDir.DIRECTION_UP.value, WinchCmd.WINCH_CMD_BOTTLE_PAUSE.value,
+                            self.bottle_pause_secs, eta=None, skipped=True)
+        return Waypoint(depth, WinchDir.DIRECTION_UP.value, WinchCmd.WINCH_CMD_BOTTLE_PAUSE.value,
+                        self.bottle_pause_secs)
+
+    def _retime(self, ts: float, depth_m: float, ndx: int):
+        # ETAs of waypoints[ndx:] leaving depth_m at ts
+        for waypoint in self.waypoints[ndx:]:
+            if waypoint.skipped:
+                continue
+            ts += abs(waypoint.depth_m - depth_m) / self.rate_mps
+            waypoint.eta = ts
+            ts += waypoint.dwell_secs
+            depth_m = waypoint.depth_m
+
+    def next_up_stop(self) -> Union[None, Waypoint]:
+        """The deepest bottle pause not reached yet, if any"""
+        ndx = bisect_left(self._up_keys, self._up_limit)
+        return self._up_stops[ndx - 1] if ndx > 0 else None
+
+    def waypoint(self, action: str) -> Union[None, Waypoint]:
+        """The next waypoint, not yet reached, with `action`"""
+        for waypoint in self.waypoints:
+            if waypoint.action == action and not (waypoint.done or waypoint.skipped):
+                return waypoint
+        return None
+
+    def reached(self, waypoint: Waypoint, ts: float):
+        """Mark `waypoint` reached at `ts`, the ETAs of those after it start from there"""
+        waypoint.done = True
+        if waypoint.leg == WinchDir.DIRECTION_UP.value and waypoint.action == WinchCmd.WINCH_CMD_BOTTLE_PAUSE.value:
+            self._up_limit = waypoint.depth_m
+        ndx = self.waypoints.index(waypoint)
+        self._retime(ts + waypoint.dwell_secs, waypoint.depth_m, ndx + 1)
+
+    @property
+    def finished(self) -> bool:
+        return self.waypoints[-1].done
+
+    def revise_bottom(self, bottom_m: float, ts: float, depth_m: float,
+                      pause_depths: Union[None, list[float]] = None):
+        """Move the bottom to `bottom_m`, optionally with new pause depths,
+        and redo the ETAs from `depth_m` at `ts`"""
+
+        self._down_leg[1].depth_m = bottom_m
+        self.bottom_m = bottom_m
+        self._revise(ts, depth_m, pause_depths)
+        logger.info('cast plan revised, bottom at %.1fm: %s', bottom_m, self)
+
+    def revise_pauses(self, pause_depths: list[float], ts: float, depth_m: float):
+        """Take new pause depths, those already passed on the way up are skipped"""
+        if self._down_leg[1].done:
+            self._up_limit = min(self._up_limit, depth_m)
+        self._revise(ts, depth_m, pause_depths)
+        logger.info('cast plan revised, pause depths %s: %s', self.pause_depths, self)
+
+    def _revise(self, ts: float, depth_m: float, pause_depths: Union[None, list[float]]):
+        if pause_depths is not None:
+            self.pause_depths = sorted(set(float(depth) for depth in pause_depths))
+        self._build_up_leg()
+        self.revision += 1
+        ndx = next((ndx for ndx, waypoint in enumerate(self.waypoints) if not (waypoint.done or waypoint.skipped)),
+                   len(self.waypoints))
+        self._retime(ts, depth_m, ndx)
+
+    def __str__(self) -> str:
+        return f'r{self.revision}: ' + ', '.join(
+            f'{waypoint.action} {waypoint.depth_m:g}m skipped' if waypoint.eta is None else
+            f'{waypoint.action} {waypoint.depth_m:g}m at +{waypoint.eta - self.start_ts:.0f}s' for waypoint in self.waypoints)
+
+    def to_dict(self) -> dict:
+        return {
+            'start_ts': round(self.start_ts, 2),
+            'revision': self.revision,
+            'bottom_m': round(self.bottom_m, 2),
+            'waypoints': [{**asdict(waypoint), 'eta': None if waypoint.eta is None else round(waypoint.eta, 2)}
+                          for waypoint in self.waypoints],
+        }
@@ -1,300 +1,404 @@
 #!/usr/bin/env python3
 
+import contextlib
+import functools
+import logging
 from pathlib import Path
 import serial
+import threading
 import time
-from typing import Tuple, Union
+from types import MappingProxyType
+from typing import Callable, Iterator, Mapping, NamedTuple, Tuple, Union
+
+import clock
+from config import Config
+from config.schema import InputPin, OutputPin
+import metrics
 
 from . import  WinchDir
 
+logger = logging.getLogger(__name__)
+
+
+def _locked(method):
+    # one exchange with the MCU at a time, and shadow register updates with it
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self.lock:
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
+class DIOCommand(NamedTuple):
+    """One or more MCU commands, sent in a single write"""
+
+    data: bytes                      # the commands, '\r' terminated, encoded and concatenated
+    lines: Tuple[str, ...]           # each command as the MCU echoes it
+    answers: Tuple[bool, ...]        # False for those answered with only the prompt ('set', 'mode')
+    pins: Tuple[Tuple[str, bool], ...] = ()   # output pin levels it sets, for the shadow register
+
+
+def dio_command(*cmds: str, pins: Tuple[Tuple[str, bool], ...] = ()) -> DIOCommand:
+    lines = tuple(cmd.strip() for cmd in cmds)
+    return DIOCommand(data=''.join(f'{line}\r' for line in lines).encode(),
+                      lines=lines,
+                      answers=tuple(line.split()[1:2] not in (['set'], ['mode']) for line in lines),
+                      pins=pins)
+
+
+def command_table(output_pins: Mapping[str, OutputPin], input_pins: Mapping[str, InputPin]) -> Mapping:
+    """Every command DIOCommander sends, built once:
+
+        (pin, level)        set output pin 'stop', 'up', 'down' or 'latch' (release)
+        '<pin>_output'      read an output pin back
+        '<pin>_input'       input pin 'payout1', 'payout2' or 'latch' (sensor) level
+        '<pin>_edges'       input pin edge count
+        'init', 'stop_winch', 'down_cast', 'up_cast'
+                            the pins a winch action sets, in order, as one write
+        'snapshot', 'snapshot_verify', 'verify_shadow', 'latch_poll', 'payout_edges'
+                            queries made together, as one write
+    """
+
+    def set_pins(*levels: Tuple[str, bool]) -> DIOCommand:
+        return dio_command(*(output_pins[pin].high if high else output_pins[pin].low for pin, high in levels),
+                           pins=levels)
+
+    table: dict = {}
+    for pin in output_pins:
+        table[(pin, True)] = set_pins((pin, True))
+        table[(pin, False)] = set_pins((pin, False))
+        table[f'{pin}_output'] = dio_command(output_pins[pin].get)
+    for pin in input_pins:
+        table[f'{pin}_input'] = dio_command(input_pins[pin].get)
+        table[f'{pin}_edges'] = dio_command(input_pins[pin].edge)
+
+    # the motor is stopped before either direction line changes, and started after
+    table['stop_winch'] = set_pins(('stop', True), ('down', False), ('up', False))
+    table['down_cast'] = set_pins(('up', False), ('down', True), ('stop', False))
+    table['up_cast'] = set_pins(('up', True), ('down', False), ('stop', False))
+    table['init'] = dio_command(*(f'dio mode DO_G{group} source' for group in range(4)),
+                                *(output_pins[pin].low for pin in ('up', 'down', 'stop', 'latch')),
+                                pins=(('up', False), ('down', False), ('stop', False), ('latch', False)))
+
+    verify = [output_pins[pin].get for pin in ('stop', 'up', 'down')]
+    table['verify_shadow'] = dio_command(*verify)
+    snapshot = [input_pins['payout1'].edge, input_pins['payout2'].edge, input_pins['latch'].get]
+    table['snapshot'] = dio_command(*snapshot)
+    table['snapshot_verify'] = dio_command(*snapshot, *verify)
+    table['latch_poll'] = dio_command(input_pins['latch'].edge, input_pins['payout1'].edge)
+    table['payout_edges'] = dio_command(input_pins['payout1'].edge, input_pins['payout2'].edge)
+    return MappingProxyType(table)
+
 
 class DIOCommander():
 
-    def __init__(self, cfg: dict):
-        self.cfg: dict = cfg
-        self.dio_tty_port: str = cfg["rift-ox-pi"]["DIO_PORT"]
+    def __init__(self, cfg: Config):
+        self.cfg: Config = cfg
+        self.dio_tty_port: str = cfg.rift_ox_pi.DIO_PORT
         self.dio_tty_port_exists = Path.exists(Path(self.dio_tty_port))
-        self.simulation: bool = cfg["rift-ox-pi"]["SIMULATION"]
-
-        print(f"SIMULATION: {self.simulation}")
-
-        self.MOTOR_STOP_PIN = {
-            "group": cfg["rift-ox-pi"]["DIO_MOTOR_STOP_GROUP"],
-            "pin": cfg["rift-ox-pi"]["DIO_MOTOR_STOP_PIN"],
-        }
-        self.DOWNCAST_PIN = {
-            "group": cfg["rift-ox-pi"]["DIO_DOWNCAST_GROUP"],
-            "pin": cfg["rift-ox-pi"]["DIO_DOWNCAST_PIN"],
-        }
-        self.UPCAST_PIN = {
-            "group": cfg["rift-ox-pi"]["DIO_UPCAST_GROUP"],
-            "pin": cfg["rift-ox-pi"]["DIO_UPCAST_PIN"],
-        }
-        self.LATCH_RELEASE_PIN = {
-            "group": cfg["rift-ox-pi"]["DIO_LATCH_RELEASE_GROUP"],
-            "pin": cfg["rift-ox-pi"]["DIO_LATCH_RELEASE_PIN"]
-        }
-        # self.KILL33_PIN = {
-        #     "group": cfg["rift-ox-pi"]["DIO_KILL33_GROUP"],
-        #     "pin": cfg["rift-ox-pi"]["DIO_KILL33_PIN"]
-        # }
-        self.PAYOUT1_PIN = {
-            "group": cfg["rift-ox-pi"]["DIO_PAYOUT1_SENSOR_GROUP"],
-            "pin": cfg["rift-ox-pi"]["DIO_PAYOUT1_SENSOR_PIN"],
-        }
-        self.PAYOUT2_PIN = {
-            "group": cfg["rift-ox-pi"]["DIO_PAYOUT2_SENSOR_GROUP"],
-            "pin": cfg["rift-ox-pi"]["DIO_PAYOUT2_SENSOR_PIN"],
-        }
-        self.LATCH_SENSOR_PIN = {
-            "group": cfg["rift-ox-pi"]["DIO_LATCH_SENSOR_GROUP"],
-            "pin": cfg["rift-ox-pi"]["DIO_LATCH_SENSOR_PIN"],
-        }
+        self.simulation: bool = cfg.rift_ox_pi.SIMULATION
+
+        logger.info('SIMULATION: %s', self.simulation)
+
+        self.lock = threading.RLock()
+        # MCU port kept open by session(), None between sessions
+        self._mcu: Union[None, serial.Serial] = None
+        # called before every exchange, lets a cancelled maneuver stop issuing commands
+        self.cancel_check: Union[None, Callable[[], None]] = None
+
+        labels = cfg.metric_labels
+        self.round_trip_time = metrics.histogram('dio_round_trip_seconds', 'DIO MCU command write to response read',
+                                                 labels=labels)
+        self.errors = metrics.counter('dio_errors_total', 'DIO MCU commands with no or no parsable response', labels=labels)
+        self.shadow_mismatches = metrics.counter('dio_shadow_mismatches_total', 'output pins found not matching the shadow register',
+                                                 labels=labels)
+
+        self.OUTPUT_PINS: Mapping[str, OutputPin] = cfg.rift_ox_pi.output_pins
+        self.INPUT_PINS: Mapping[str, InputPin] = cfg.rift_ox_pi.input_pins
+        # self.KILL33_PIN = OutputPin(cfg["rift-ox-pi"]["DIO_KILL33_GROUP"], cfg["rift-ox-pi"]["DIO_KILL33_PIN"])
+        # each winch action and query is a lookup here and one write
+        self.CMDS: Mapping = command_table(self.OUTPUT_PINS, self.INPUT_PINS)
+
+        # last level set on each output pin, None until a set succeeds or
+        # after one fails. Checked against the MCU every DIO_SHADOW_VERIFY_SECS.
+        self.shadow: dict[str, Union[None, bool]] = dict.fromkeys(self.OUTPUT_PINS)
+        self.shadow_verify_secs: float = cfg.rift_ox_pi.DIO_SHADOW_VERIFY_SECS
+        self.shadow_verified_t: float = 0.0
 
         self.init_dio_pins()
 
     def init_dio_pins(self):
-        cmds = [
-            f'dio mode DO_G0 source\r',
-            f'dio mode DO_G1 source\r',
-            f'dio mode DO_G2 source\r',
-            f'dio mode DO_G3 source\r',
-            f'dio set DO_G{self.UPCAST_PIN["group"]} {self.UPCAST_PIN["pin"]} low\r',
-            f'dio set DO_G{self.DOWNCAST_PIN["group"]} {self.DOWNCAST_PIN["pin"]} low\r',
-            f'dio set DO_G{self.MOTOR_STOP_PIN["group"]} {self.MOTOR_STOP_PIN["pin"]} low\r',
-            f'dio set DO_G{self.LATCH_RELEASE_PIN["group"]} {self.LATCH_RELEASE_PIN["pin"]} low\r'
-        ]
-        for command in cmds:
-            self.issue_command(cmd=command)
-            # time.sleep(0.01)
+        self.issue(self.CMDS['init'])
+
+    def set_pin(self, pin: str, high: bool) -> bool:
+        """Set an output pin ('stop', 'up', 'down' or 'latch') and record it
+        in the shadow register. Returns the error flag."""
+        return self.issue(self.CMDS[(pin, high)])[1]
 
     def pin_low(self, pin: str):
-        cmd: str = ''
-        if pin == 'stop':
-            cmd = f'dio set DO_G{self.MOTOR_STOP_PIN["group"]} {self.MOTOR_STOP_PIN["pin"]} low\r'
-        elif pin == 'up':
-            cmd = f'dio set DO_G{self.UPCAST_PIN["group"]} {self.UPCAST_PIN["pin"]} low\r'
-        elif pin == 'down':
-            cmd = f'dio set DO_G{self.DOWNCAST_PIN["group"]} {self.DOWNCAST_PIN["pin"]} low\r'
-        elif pin == 'latch':
-            cmd = f'dio set DO_G{self.LATCH_RELEASE_PIN["group"]} {self.LATCH_RELEASE_PIN["pin"]} low\r'
-
-        self.issue_command(cmd)
+        if pin not in self.OUTPUT_PINS:
+            logger.error('pin_low: unknown pin %s', pin)
+            return
+        self.set_pin(pin, False)
 
     def pin_hi(self, pin: str):
-        cmd: str = ''
-        if pin == 'stop':
-            cmd = f'dio set DO_G{self.MOTOR_STOP_PIN["group"]} {self.MOTOR_STOP_PIN["pin"]} high\r'
-        elif pin == 'up':
-            cmd = f'dio set DO_G{self.UPCAST_PIN["group"]} {self.UPCAST_PIN["pin"]} high\r'
-        elif pin == 'down':
-            cmd = f'dio set DO_G{self.DOWNCAST_PIN["group"]} {self.DOWNCAST_PIN["pin"]} high\r'
-        elif pin == 'latch':
-            cmd = f'dio set DO_G{self.LATCH_RELEASE_PIN["group"]} {self.LATCH_RELEASE_PIN["pin"]} high\r'
-
-        self.issue_command(cmd=cmd)
+        if pin not in self.OUTPUT_PINS:
+            logger.error('pin_hi: unknown pin %s', pin)
+            return
+        self.set_pin(pin, True)
 
     def stop_winch(self):
-        cmds = [
-            f'dio set DO_G{self.MOTOR_STOP_PIN["group"]} {self.MOTOR_STOP_PIN["pin"]} high\r',
-            f'dio set DO_G{self.DOWNCAST_PIN["group"]} {self.DOWNCAST_PIN["pin"]} low\r',
-            f'dio set DO_G{self.UPCAST_PIN["group"]} {self.UPCAST_PIN["pin"]} low\r',
-        ]
-        for cmd in cmds:
-            self.issue_command(cmd=cmd)
-            time.sleep(0.01)
+        self.issue(self.CMDS['stop_winch'])
 
     def latch_release(self):
-        cmd = f'dio set DO_G{self.LATCH_RELEASE_PIN["group"]} {self.LATCH_RELEASE_PIN["pin"]} low\r'
-        self.issue_command(cmd=cmd)
+        self.set_pin('latch', False)
 
     def latch_hold(self):
-        cmd = f'dio set DO_G{self.LATCH_RELEASE_PIN["group"]} {self.LATCH_RELEASE_PIN["pin"]} high\r'
-        self.issue_command(cmd=cmd)
+        self.set_pin('latch', True)
 
     def stage(self):
         # fdist let's make sure latch pin is being held...
-        cmds = [
-            f'dio set DO_G{self.UPCAST_PIN["group"]} {self.UPCAST_PIN["pin"]} low\r',
-            f'dio set DO_G{self.DOWNCAST_PIN["group"]} {self.DOWNCAST_PIN["pin"]} high\r',
-            f'dio set DO_G{self.MOTOR_STOP_PIN["group"]} {self.MOTOR_STOP_PIN["pin"]} low\r',
-        ]
-        for cmd in cmds:
-            self.issue_command(cmd=cmd)
-            time.sleep(0.01)
+        self.issue(self.CMDS['down_cast'])
 
     def down_cast(self, stop_after_ms: int =0):
-        cmds = [
-            f'dio set DO_G{self.UPCAST_PIN["group"]} {self.UPCAST_PIN["pin"]} low\r',
-            f'dio set DO_G{self.DOWNCAST_PIN["group"]} {self.DOWNCAST_PIN["pin"]} high\r',
-            f'dio set DO_G{self.MOTOR_STOP_PIN["group"]} {self.MOTOR_STOP_PIN["pin"]} low\r',
-        ]
-        for cmd in cmds:
-            self.issue_command(cmd=cmd)
-            time.sleep(0.01)
+        self.issue(self.CMDS['down_cast'])
         if stop_after_ms > 0:
-            time.sleep(stop_after_ms / 1000)
+            clock.sleep(stop_after_ms / 1000)
             self.stop_winch()
 
     def up_cast(self, stop_after_ms: int =0):
-        cmds = [
-            f'dio set DO_G{self.UPCAST_PIN["group"]} {self.UPCAST_PIN["pin"]} high\r',
-            f'dio set DO_G{self.DOWNCAST_PIN["group"]} {self.DOWNCAST_PIN["pin"]} low\r',
-            f'dio set DO_G{self.MOTOR_STOP_PIN["group"]} {self.MOTOR_STOP_PIN["pin"]} low\r',
-        ]
-        for cmd in cmds:
-            self.issue_command(cmd=cmd)
-            time.sleep(0.01)
+        self.issue(self.CMDS['up_cast'])
         if stop_after_ms > 0:
-            time.sleep(stop_after_ms / 1000)
+            clock.sleep(stop_after_ms / 1000)
             self.stop_winch()
 
     # def kill33(self):
-    #     cmd: str = f'dio set DO_G{self.KILL33_PIN["group"]} {self.KILL33_PIN["pin"]} high\r'
-    #     self.issue_command(cmd=cmd)
+    #     self.issue_command(cmd=self.KILL33_PIN.high)
 
     def get_latch_sensor_state(self) -> Tuple[int, bool]:
 
-        cmd = f'dio get DI_G{self.LATCH_SENSOR_PIN["group"]} input {self.LATCH_SENSOR_PIN["pin"]}\r'
-        result, err = self.issue_command(cmd=cmd)
+        results, err = self.issue(self.CMDS['latch_input'])
         if self.simulation:  # SIMULATION: fake latch LOW signal
-            result = 0
-            err = False
-        else:
-            if err:
-                return 0, err
+            return 0, False
+        if err:
+            return 0, err
 
-        return int(result), err
+        return int(results[0]), err
     
     def get_latch_edge_count(self) -> Tuple[str, bool]:
-        edge_cnt_str: str
-        cmd = f'dio edge DI_G{self.LATCH_SENSOR_PIN["group"]} {self.LATCH_SENSOR_PIN["pin"]}\r'
-        edge_cnt_str, err = self.issue_command(cmd=cmd)
+        results, err = self.issue(self.CMDS['latch_edges'])
         if err:
             return "0", True
-        return edge_cnt_str, False
+        return results[0], False
+
+    def latch_poll(self) -> Tuple[int, int, bool]:
+        """Latch and payout1 edge counts in one exchange, for watching for the
+        latch while the winch is moving. Returns (latch edges, payout edges, err)."""
+
+        results, err = self.issue(self.CMDS['latch_poll'])
+        if self.simulation:
+            return 0, 0, False
+        if err or not all(res.isdigit() for res in results):
+            return 0, 0, True
+        return int(results[0]), int(results[1]), False
 
     def get_payout_edge_count(self) -> Tuple[list[int], bool]:
-        payout_1: str = ''
-        payout_2: str = ''
-        p1: int = 0
-        p2: int = 0
-
-        cmd = f'dio edge DI_G{self.PAYOUT1_PIN["group"]} {self.PAYOUT1_PIN["pin"]}\r'
-        payout_1, err = self.issue_command(cmd=cmd)
-        print(f'payout1: {payout_1}, err: {err}')
-        if not err and payout_1.isdigit():
-            p1 = int(payout_1)
-        else:
-            return [0, 0], True
 
-        cmd = f'dio edge DI_G{self.PAYOUT2_PIN["group"]} {self.PAYOUT2_PIN["pin"]}\r'
-        payout_2, err = self.issue_command(cmd=cmd)
-        print(f'payout2: {payout_2}, err: {err}')
-        if not err and payout_2.isdigit():
-            p2 = int(payout_2)
-        else:
+        results, err = self.issue(self.CMDS['payout_edges'])
+        logger.debug('payouts: %s, err: %s', results, err)
+        if err or not all(res.isdigit() for res in results):
             return [0, 0], True
+        return [int(results[0]), int(results[1])], False
 
-        return [p1, p2], False
+    @staticmethod
+    def direction_from_pins(stop: bool, up: bool, down: bool) -> str:
+        if stop: return WinchDir.DIRECTION_NONE.value
+        if up and not down: return WinchDir.DIRECTION_UP.value
+        if not up and down: return WinchDir.DIRECTION_DOWN.value
+        # either both direction lines HIGH or both LOW, either way winch not moving.
+        return WinchDir.DIRECTION_NONE.value
+
+    def _shadow_stale(self) -> bool:
+        return (None in (self.shadow['stop'], self.shadow['up'], self.shadow['down']) or
+                clock.monotonic() - self.shadow_verified_t >= self.shadow_verify_secs)
+
+    def _update_shadow(self, readings: dict[str, str]) -> bool:
+        """Correct the shadow register from the MCU's output pin readings. Returns the error flag."""
+
+        for pin, reading in readings.items():
+            if not reading.isdigit():
+                logger.error('ERROR querying %s_pin state: %s', pin, reading)
+                self.shadow[pin] = None
+                return True
+            level = bool(int(reading))
+            if self.shadow[pin] is not None and self.shadow[pin] != level:
+                logger.warning('%s pin is %s, shadow register had %s', pin, level, self.shadow[pin])
+                self.shadow_mismatches.inc()
+            self.shadow[pin] = level
+        self.shadow_verified_t = clock.monotonic()
+        return False
+
+    @_locked
+    def verify_shadow(self) -> bool:
+        """Read stop, up and down output pins back from the MCU in one exchange. Returns the error flag."""
+
+        pins = ['stop', 'up', 'down']
+        results, err = self.issue(self.CMDS['verify_shadow'])
+        if err:
+            for pin in pins:
+                self.shadow[pin] = None
+            return True
+        return self._update_shadow(dict(zip(pins, results)))
 
+    @_locked
     def get_winch_direction(self) -> Tuple[str, bool]:
-        err: bool = False
-        res: bool = False
-        up_active: bool = False
-        down_active: bool = False
-        stop_active: bool = False
-        up_pin_query = f'dio get DO_G{self.UPCAST_PIN["group"]} output {self.UPCAST_PIN["pin"]}\r'
-        down_pin_query = f'dio get DO_G{self.DOWNCAST_PIN["group"]} output {self.DOWNCAST_PIN["pin"]}\r'
-        stop_pin_query = f'dio get DO_G{self.MOTOR_STOP_PIN["group"]} output {self.MOTOR_STOP_PIN["pin"]}\r'
-        # stop_active = stop_pin_state == "1"
-        # down_active = down_pin_state == "1"
-        # up_active = up_pin_state == "1"
-
-        stop_pin_state, err = self.issue_command(stop_pin_query)
-        print(f'stop_pin_state: {stop_pin_state}')
-        if not err and stop_pin_state.isdigit():
-            stop_active = bool(int(stop_pin_state))
-        else:
-            print(f'dio_mnds:get-winch_dir: ERROR querying stop_pin state')
-            return WinchDir.DIRECTION_NONE.value, True
-
-        if stop_active:
-            return WinchDir.DIRECTION_NONE.value, False
-
-        up_pin_state, err = self.issue_command(up_pin_query)
-        print(f'up_pin_state: {up_pin_state}')
-        if not err and up_pin_state.isdigit():
-            up_active = bool(int(up_pin_state))
-        else:
-            print(f'dio_mnds:get-winch_dir: ERROR querying up_pin state')
-            return WinchDir.DIRECTION_NONE.value, True
+        """Direction from the shadow register, read back from the MCU only when it is due a check"""
 
-        down_pin_state, err = self.issue_command(down_pin_query)
-        print(f'down_pin_state: {down_pin_state}')
-        if not err and down_pin_state.isdigit():
-            down_active = bool(int(down_pin_state))
-        else:
-            print(f'dio_mnds:get-winch_dir: ERROR querying down_pin state')
+        if self._shadow_stale() and self.verify_shadow():
+            logger.error('get_winch_direction: ERROR querying output pin states')
             return WinchDir.DIRECTION_NONE.value, True
-
-        # stop not active...
-        if up_active and not down_active: return WinchDir.DIRECTION_UP.value, False
-        if not up_active and down_active: return WinchDir.DIRECTION_DOWN.value, False
-        
-        # either both direction lines HIGH or both LOW, either way winch not moving.
-        return WinchDir.DIRECTION_NONE.value, False
+        return self.direction_from_pins(self.shadow['stop'], self.shadow['up'], self.shadow['down']), False
+
+    @_locked
+    def snapshot(self) -> Tuple[dict, bool]:
+        """Payout edge counts, latch sensor level and winch direction in one
+        exchange with the MCU: {'payout': [p1, p2], 'latch': 0|1, 'dir': ...}.
+        The output pins are read back in the same exchange when the shadow
+        register is due a check."""
+
+        snap = {'payout': [0, 0], 'latch': 0, 'dir': WinchDir.DIRECTION_NONE.value}
+        if self.simulation:
+            snap['dir'] = self.direction_from_pins(*(bool(self.shadow[pin]) for pin in ['stop', 'up', 'down']))
+            return snap, False
+
+        verify = self._shadow_stale()
+        results, err = self.issue(self.CMDS['snapshot_verify' if verify else 'snapshot'])
+        logger.debug('snapshot: %s, err: %s', results, err)
+        if err or not all(res.isdigit() for res in results[:3]):
+            return snap, True
+
+        snap['payout'] = [int(results[0]), int(results[1])]
+        snap['latch'] = int(results[2])
+        if verify and self._update_shadow(dict(zip(['stop', 'up', 'down'], results[3:]))):
+            return snap, True
+        snap['dir'] = self.direction_from_pins(self.shadow['stop'], self.shadow['up'], self.shadow['down'])
+        return snap, False
 
     def issue_command(self, cmd : str) -> Tuple[str, bool]:
-
-        # cmd_bytes: bytes = self._dio_command_ddbytes(cmd)
-        cmd_bytes: bytes = cmd.encode()
-        if cmd_bytes == None:
-            print(f'ERROR converting command info {cmd.strip()} to bytes')
-            return "", True
-
-        return self._send_bytes(cmd_bytes)
-
-
-    def _send_bytes(self, cmd_bytes: bytes) -> Tuple[str, bool]:
-           
-        result: str = ""
-        err: bool = False
-
-        if not self.simulation:
-
-            if self.dio_tty_port_exists:
-
-                with serial.Serial(self.dio_tty_port) as mcu:
-
-                    # print(f'_send_bytes issuing: "{cmd_bytes.decode().strip()}"')
-                    mcu.write(b"\r\n")
-                    time.sleep(0.05)
-                    # print(f'{mcu.read(mcu.inWaiting())}')  #get anything waiting in buffer and discard
-                    mcu.read(mcu.in_waiting) #get anything waiting in buffer and discard
-
-                    written = mcu.write(cmd_bytes)
-                    mcu.flush()
-
-                    time.sleep(0.03)
-                    res = mcu.read(mcu.in_waiting)
-                    res_array = res.split(b'\r\n')
-                    #TODO LOG INFO
-                    # print(f"RESPONSE: {res_array}")
-                    try:
-                        result = res_array[1].decode()
-                        #TODO LOG INFO
-                    except:
-                        result = ""
-                        err = True
-                        #TODO log error
-                        print(f'DIO: ERROR PARSING RESPONSE: {res}')
-
-                return result, err
-            else:
-                print(f'NO SERIAL PORT ({self.dio_tty_port}) for cmd: {cmd_bytes.decode()}')
-                return "", True
-
+        """Send a command that is not in CMDS, e.g. typed at opctl, and return its result line"""
+        results, err = self.issue(dio_command(cmd))
+        return results[0], err
+
+    def issue_commands(self, cmds: list[str]) -> Tuple[list[str], bool]:
+        """Send several commands in one exchange with the MCU and return their result lines"""
+        return self.issue(dio_command(*cmds))
+
+    @_locked
+    def issue(self, cmd: DIOCommand) -> Tuple[list[str], bool]:
+        """Write `cmd`, usually from CMDS, to the MCU and return a result line for
+        each of its commands ('' for a 'set' or 'mode'). The output pins it sets
+        go in the shadow register, or None if the exchange failed."""
+
+        if self.cancel_check is not None:
+            self.cancel_check()
+
+        err = False
+        results = [""] * len(cmd.lines)
+        if self.simulation:
+            pass
+        elif not self.dio_tty_port_exists:
+            logger.error('NO SERIAL PORT (%s) for cmds: %s', self.dio_tty_port, cmd.lines)
+            err = True
+        else:
+            results, err = self._send(cmd)
+
+        for pin, high in cmd.pins:
+            self.shadow[pin] = None if err else high
+        return results, err
+
+    @contextlib.contextmanager
+    def session(self) -> Iterator['DIOCommander']:
+        """Keep the MCU port open, and woken, for every exchange until the
+        block ends. Saves the port open and 50ms wake per exchange when
+        polling at a high rate, e.g. for the latch while parking:
+
+            with cmndr.session():
+                while not latch_found():
+                    ...
+        """
+
+        with self.lock:
+            opened = self._mcu is None and not self.simulation and self.dio_tty_port_exists
+            if opened:
+                self._mcu = serial.Serial(self.dio_tty_port)
+                self._wake(self._mcu)
+        try:
+            yield self
+        finally:
+            if opened:
+                with self.lock:
+                    self._mcu.close()
+                    self._mcu = None
+
+    # the MCU and its serial port answer in real time whatever the clock,
+    # so waits on the port use time, not clock
+    @staticmethod
+    def _wake(mcu: serial.Serial):
+        mcu.write(b"\r\n")
+        time.sleep(0.05)
+        mcu.read(mcu.in_waiting) #get anything waiting in buffer and discard
+
+    def _send(self, cmd: DIOCommand) -> Tuple[list[str], bool]:
+
+        t0 = self.round_trip_time.start()
+        if self._mcu is not None:
+            results, res = self._exchange(self._mcu, cmd)
         else:
-            # print(f'_send_bytes: logging: "{cmd_bytes.decode().strip()}"')
-            return "", False
+            with serial.Serial(self.dio_tty_port) as mcu:
+                self._wake(mcu)
+                results, res = self._exchange(mcu, cmd)
+        self.round_trip_time.observe_since(t0)
+        logger.debug('RESPONSE: %s', res)
+        if len(results) != len(cmd.lines):
+            logger.error('ERROR PARSING RESPONSE: got %d of %d results: %s', len(results), len(cmd.lines), res)
+            self.errors.inc()
+            return results + [""] * (len(cmd.lines) - len(results)), True
+        return results, False
+
+    def _exchange(self, mcu: serial.Serial, cmd: DIOCommand) -> Tuple[list[str], bytes]:
+        results: list[str] = []
+        res = b''
+
+        mcu.read(mcu.in_waiting) # anything left over from an earlier exchange
+        mcu.write(cmd.data)
+        mcu.flush()
+
+        # as long as a single command would wait for its response, plus 10ms for each after it.
+        # A session is there for low latency, so it looks more often.
+        poll_secs = 0.002 if mcu is self._mcu else 0.01
+        deadline = time.monotonic() + 0.03 + 0.01 * (len(cmd.lines) - 1)
+        while True:
+            time.sleep(poll_secs)
+            res += mcu.read(mcu.in_waiting)
+            results = self._results(res, cmd)
+            if len(results) == len(cmd.lines) or time.monotonic() >= deadline:
+                break
+        return results, res
+
+    @staticmethod
+    def _results(res: bytes, cmd: DIOCommand) -> list[str]:
+        # every command is echoed, then its result line if it has one, then
+        # the prompt. A line is complete once the line after it has started.
+        results: list[str] = []
+        lines = [line.decode(errors='replace') for line in res.split(b'\r\n')]
+        for ndx in range(len(lines) - 1):
+            if len(results) == len(cmd.lines):
+                break
+            if lines[ndx].endswith(cmd.lines[len(results)]):
+                if not cmd.answers[len(results)]:
+                    results.append("")
+                elif ndx + 2 < len(lines):
+                    results.append(lines[ndx + 1])
+                else:
+                    break
+        return results
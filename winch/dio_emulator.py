@@ -0,0 +1,340 @@
+#!/usr/bin/env python3
+
+"""OnLogic DIO MCU emulator on a pseudo terminal, driving a physical model
+of the winch so winctl.py can run unmodified casts without hardware.
+
+    python -m winch.dio_emulator --link /tmp/ttyDIO
+    # with DIO_PORT = '/tmp/ttyDIO' and SIMULATION = false in the config file
+    ./winctl.py
+
+Text protocol, one command per '\\r' terminated line, echoed back followed
+by any result line and the prompt:
+    dio mode DO_G<group> source|open-drain
+    dio set DO_G<group> <pin> high|low
+    dio get DO_G<group> output <pin>    -> 0|1
+    dio get DI_G<group> input <pin>     -> 0|1
+    dio edge DI_G<group> <pin>          -> rising + falling edges since power up
+
+The outputs (stop, up, down and latch release pins from the [rift-ox-pi]
+config section) drive WinchModel; its payout and latch sensors drive the
+inputs.
+"""
+
+import argparse
+from math import floor, pi
+import os
+from pathlib import Path
+import select
+import signal
+import sys
+import threading
+import time
+import tty
+from typing import Union
+
+import clock
+import config
+
+PROMPT = '> '
+
+
+class WinchModel:
+    """Winch, cable and latch, in metres of cable paid out from the parked
+    position (bullet resting on the latch). Negative payout is above the latch.
+
+    The motor runs at payout_rate_mps down or up while exactly one direction
+    line is high and stop is low, and approaches that speed with time
+    constant inertia_s, so it coasts on after a stop. Two payout sensors in
+    quadrature each give edges_per_rev edges per sheave revolution. The latch
+    sensor is active within latch_window_m of latch_sensor_m. Going down, the
+    bullet comes to rest on the latch unless the latch is held open."""
+
+    def __init__(self, sheave_radius_inch: float = 2.5, cable_diameter_inch: float = 0.123,
+                 payout_rate_mps: float = 0.67, inertia_s: float = 0.25,
+                 edges_per_rev: int = 12, latch_sensor_m: float = -0.15,
+                 latch_window_m: float = 0.03, top_limit_m: float = -1.0,
+                 payout_m: float = 0.0):
+
+        circumference_m = 2 * pi * (sheave_radius_inch + cable_diameter_inch / 2) / 39.37008
+        self.edges_per_m = edges_per_rev / circumference_m
+        self.payout_rate_mps = payout_rate_mps
+        self.inertia_s = inertia_s
+        self.latch_sensor_m = latch_sensor_m
+        self.latch_window_m = latch_window_m
+        self.top_limit_m = top_limit_m
+
+        self.payout_m = payout_m
+        self.velocity_mps = 0.0
+
+        # output lines
+        self.stop_pin = False
+        self.up_pin = False
+        self.down_pin = False
+        self.latch_hold_pin = False
+
+        # input lines and their edge counters
+        self.payout1 = self.payout2 = self.latch = False
+        self.payout1_edges = self.payout2_edges = self.latch_edges = 0
+        self._update_inputs()
+
+        # (time stop pin went high, payout then, payout at rest) per stop, for stop accuracy
+        self.stops: list[tuple[float, float, float]] = []
+        self._stopping: Union[None, tuple[float, float]] = None
+
+    def target_velocity(self) -> float:
+        if self.stop_pin or self.up_pin == self.down_pin:
+            return 0.0
+        return self.payout_rate_mps if self.down_pin else -self.payout_rate_mps
+
+    def set_output(self, name: str, level: bool, now: float):
+        if name == 'stop' and level and not self.stop_pin:
+            self._stopping = (now, self.payout_m)
+        setattr(self, f'{name}_pin', level)
+
+    def move_to(self, payout_m: float):
+        """Put the bullet at payout_m without generating any sensor edges"""
+        self.payout_m = payout_m
+        self.velocity_mps = 0.0
+        self._update_inputs()
+
+    def step(self, dt: float, now: float):
+
+        target = self.target_velocity()
+        if self.inertia_s > 0:
+            self.velocity_mps += (target - self.velocity_mps) * min(dt / self.inertia_s, 1.0)
+        else:
+            self.velocity_mps = target
+
+        new_payout = self.payout_m + self.velocity_mps * dt
+        if self.payout_m <= 0 < new_payout and not self.latch_hold_pin:
+            # comes down onto the latch
+            new_payout = 0.0
+            self.velocity_mps = 0.0
+        if new_payout < self.top_limit_m:
+            new_payout = self.top_limit_m
+            self.velocity_mps = 0.0
+
+        old_phase = self.payout_m * self.edges_per_m
+        new_phase = new_payout * self.edges_per_m
+        self.payout1_edges += abs(floor(new_phase) - floor(old_phase))
+        self.payout2_edges += abs(floor(new_phase + 0.5) - floor(old_phase + 0.5))
+        self.payout_m = new_payout
+
+        latch = abs(self.payout_m - self.latch_sensor_m) <= self.latch_window_m
+        if latch != self.latch:
+            self.latch_edges += 1
+        self._update_inputs()
+
+        if self._stopping is not None and target == 0.0 and abs(self.velocity_mps) < 0.01:
+            self.velocity_mps = 0.0
+            self.stops.append((self._stopping[0], self._stopping[1], self.payout_m))
+            self._stopping = None
+
+    def _update_inputs(self):
+        phase = self.payout_m * self.edges_per_m
+        self.payout1 = floor(phase) % 2 == 1
+        self.payout2 = floor(phase + 0.5) % 2 == 1
+        self.latch = abs(self.payout_m - self.latch_sensor_m) <= self.latch_window_m
+
+
+class DIOEmulator:
+
+    def __init__(self, cfg: dict, model: Union[None, WinchModel] = None,
+                 latency: float = 0.005, step_secs: float = 0.002):
+
+        pi_cfg = cfg["rift-ox-pi"]
+        if model is None:
+            model = WinchModel(sheave_radius_inch=cfg["winch"]["SHEAVE_RADIUS_INCH"],
+                               cable_diameter_inch=cfg["winch"]["SEA_CABLE_DIAMETER_INCH"])
+        self.model = model
+        self.latency = latency    # secs between a command arriving and its response
+        self.step_secs = step_secs
+
+        # (group, pin) -> model line
+        self.outputs = {
+            (pi_cfg["DIO_MOTOR_STOP_GROUP"], pi_cfg["DIO_MOTOR_STOP_PIN"]): 'stop',
+            (pi_cfg["DIO_UPCAST_GROUP"], pi_cfg["DIO_UPCAST_PIN"]): 'up',
+            (pi_cfg["DIO_DOWNCAST_GROUP"], pi_cfg["DIO_DOWNCAST_PIN"]): 'down',
+            (pi_cfg["DIO_LATCH_RELEASE_GROUP"], pi_cfg["DIO_LATCH_RELEASE_PIN"]): 'latch_hold',
+        }
+        self.inputs = {
+            (pi_cfg["DIO_PAYOUT1_SENSOR_GROUP"], pi_cfg["DIO_PAYOUT1_SENSOR_PIN"]): 'payout1',
+            (pi_cfg["DIO_PAYOUT2_SENSOR_GROUP"], pi_cfg["DIO_PAYOUT2_SENSOR_PIN"]): 'payout2',
+            (pi_cfg["DIO_LATCH_SENSOR_GROUP"], pi_cfg["DIO_LATCH_SENSOR_PIN"]): 'latch',
+        }
+        # levels of output pins not wired to the winch
+        self.spare_outputs: dict[tuple[int, int], bool] = {}
+
+        self.commands = 0
+        self.lock = threading.Lock()
+        self.quit_evt = threading.Event()
+        self.master_fd = -1
+        self.slave_fd = -1
+        self.port_name = ''
+        self.link: Union[None, Path] = None
+        self.input_buf = ''
+        self.prev_char = ''
+        self.read_thr = threading.Thread(target=self.read_loop, name='dioemu:read_loop', daemon=True)
+        self.model_thr = threading.Thread(target=self.model_loop, name='dioemu:model_loop', daemon=True)
+
+    def open(self, link: Union[None, str] = None) -> str:
+        """Create the pty, optionally symlinked to `link`, and return the port name to open"""
+        self.master_fd, self.slave_fd = os.openpty()
+        tty.setraw(self.slave_fd)
+        self.port_name = os.ttyname(self.slave_fd)
+        if link:
+            self.link = Path(link)
+            if self.link.is_symlink():
+                self.link.unlink()
+            self.link.symlink_to(self.port_name)
+        return str(self.link) if self.link else self.port_name
+
+    def start(self):
+        if self.master_fd < 0:
+            self.open()
+        self.read_thr.start()
+        self.model_thr.start()
+
+    def stop(self):
+        self.quit_evt.set()
+        self.read_thr.join()
+        self.model_thr.join()
+        if self.link is not None and self.link.is_symlink():
+            self.link.unlink()
+        os.close(self.master_fd)
+        os.close(self.slave_fd)
+
+    def write(self, text: str):
+        os.write(self.master_fd, text.encode())
+
+    def model_loop(self):
+        # steps are step_secs of real time, so a faster clock takes bigger steps
+        last = clock.monotonic()
+        while not self.quit_evt.is_set():
+            time.sleep(self.step_secs)
+            now = clock.monotonic()
+            with self.lock:
+                self.model.step(now - last, now)
+            last = now
+
+    def read_loop(self):
+
+        while not self.quit_evt.is_set():
+            ready, _, _ = select.select([self.master_fd], [], [], 0.1)
+            if not ready:
+                continue
+            try:
+                data = os.read(self.master_fd, 1024)
+            except OSError:
+                continue
+            for ch in data.decode(errors='replace'):
+                self.handle_char(ch)
+
+    def handle_char(self, ch: str):
+
+        if ch == '\n' and self.prev_char == '\r':
+            self.prev_char = ch
+            return
+        self.prev_char = ch
+
+        if ch not in '\r\n':
+            self.input_buf += ch
+            self.write(ch)
+            return
+
+        line, self.input_buf = self.input_buf.strip(), ''
+        self.write('\r\n')
+        if line:
+            if self.latency > 0:
+                clock.sleep(self.latency)
+            result = self.command(line)
+            if result is not None:
+                self.write(result + '\r\n')
+        self.write(PROMPT)
+
+    def command(self, line: str) -> Union[None, str]:
+        """Run one command, returning its result line if it has one"""
+
+        self.commands += 1
+        words = line.split()
+        if len(words) < 3 or words[0] != 'dio':
+            return 'Invalid command'
+        action, bank = words[1], words[2]
+        try:
+            group = int(bank[4:]) if bank[:4] in ('DO_G', 'DI_G') else -1
+            if group < 0:
+                return 'Invalid bank'
+
+            if action == 'mode' and bank.startswith('DO_G'):
+                return None
+
+            if action == 'set' and bank.startswith('DO_G') and len(words) == 5:
+                level = words[4] == 'high'
+                key = (group, int(words[3]))
+                with self.lock:
+                    if key in self.outputs:
+                        self.model.set_output(self.outputs[key], level, clock.monotonic())
+                    else:
+                        self.spare_outputs[key] = level
+                return None
+
+            if action == 'get' and len(words) == 5:
+                key = (group, int(words[4]))
+                with self.lock:
+                    if bank.startswith('DO_G') and words[3] == 'output':
+                        if key in self.outputs:
+                            level = getattr(self.model, f'{self.outputs[key]}_pin')
+                        else:
+                            level = self.spare_outputs.get(key, False)
+                        return str(int(level))
+                    if bank.startswith('DI_G') and words[3] == 'input':
+                        return str(int(getattr(self.model, self.inputs[key]) if key in self.inputs else 0))
+
+            if action == 'edge' and bank.startswith('DI_G') and len(words) == 4:
+                key = (group, int(words[3]))
+                with self.lock:
+                    return str(getattr(self.model, f'{self.inputs[key]}_edges') if key in self.inputs else 0)
+
+        except ValueError:
+            pass
+        return 'Invalid command'
+
+
+def main():
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--link', help="also make this symlink to the pty, e.g. the config DIO_PORT", default=None, type=str)
+    parser.add_argument('--latency', help="response latency in secs", default=0.005, type=float)
+    parser.add_argument('--payout-rate', help="winch speed in m/s", default=0.67, type=float)
+    parser.add_argument('--inertia', help="motor time constant in secs", default=0.25, type=float)
+    args = parser.parse_args()
+
+    cfg = config.read()
+    if cfg == None:
+        print(f'dio_emulator: ERROR unable to read rift-ox.toml config file. Quitting.')
+        sys.exit(1)
+
+    model = WinchModel(sheave_radius_inch=cfg["winch"]["SHEAVE_RADIUS_INCH"],
+                       cable_diameter_inch=cfg["winch"]["SEA_CABLE_DIAMETER_INCH"],
+                       payout_rate_mps=args.payout_rate, inertia_s=args.inertia)
+    emu = DIOEmulator(cfg, model=model, latency=args.latency)
+    port = emu.open(args.link)
+    emu.start()
+    print(f'DIO MCU emulator on {port} ({emu.port_name})')
+
+    def interrupt_handler(signum, frame):
+        emu.quit_evt.set()
+
+    signal.signal(signal.SIGINT, interrupt_handler)
+    while not emu.quit_evt.wait(1):
+        m = emu.model
+        print(f'payout: {m.payout_m:8.2f}m  speed: {m.velocity_mps:5.2f}m/s  '
+              f'edges: {m.payout1_edges}/{m.payout2_edges}  latch: {int(m.latch)} ({m.latch_edges})')
+    emu.stop()
+    for t, commanded, rest in emu.model.stops:
+        print(f'stop at {commanded:.3f}m came to rest at {rest:.3f}m ({rest - commanded:+.3f}m)')
+    sys.exit(0)
+
+
+if __name__ == '__main__':
+    main()
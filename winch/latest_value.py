@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+
+import threading
+from typing import Any, Tuple, Union
+
+
+class LatestValue:
+    """Single slot holding the most recent value and a version number that
+    goes up with every set(). Readers never see a backlog, only the freshest
+    value, and can wait for one newer than the version they last saw.
+
+        status, version = latest.wait_newer(version, timeout=0.1)
+    """
+
+    def __init__(self, value: Any = None):
+        self._cond = threading.Condition()
+        self._value = value
+        self._version = 0
+
+    def set(self, value: Any) -> int:
+        with self._cond:
+            self._value = value
+            self._version += 1
+            self._cond.notify_all()
+            return self._version
+
+    def get(self) -> Tuple[Any, int]:
+        with self._cond:
+            return self._value, self._version
+
+    @property
+    def version(self) -> int:
+        return self._version
+
+    def wait_newer(self, version: int, timeout: Union[None, float] = None) -> Tuple[Any, int]:
+        """Wait up to `timeout` secs for a value newer than `version`, then
+        return the latest value and version, whether newer or not"""
+        with self._cond:
+            self._cond.wait_for(lambda: self._version > version, timeout)
+            return self._value, self._version
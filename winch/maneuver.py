@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+
+"""Compound winch maneuvers (unparking, parking) run on their own thread so
+wincmd keeps reading commands, and a STOP can cut them short.
+
+A maneuver is a generator of steps. It makes its DIOCommander calls
+directly and yields the secs to wait before its next step:
+
+    def unpark_steps(self):
+        self.cmndr.up_cast()
+        yield 0.5
+        self.cmndr.stop_winch()
+        ...
+
+Waits end early on cancel(). The maneuver thread then makes no further DIO
+commands: DIOCommander calls check() before every exchange, so the one in
+flight is the last.
+"""
+
+import logging
+import threading
+from typing import Callable, Iterator, Union
+
+import clock
+
+logger = logging.getLogger(__name__)
+
+
+class ManeuverCancelled(Exception):
+    pass
+
+
+class ManeuverExecutor:
+
+    def __init__(self, on_error: Union[None, Callable[[], None]] = None):
+        # called on the maneuver thread if a step raises, e.g. to stop the winch
+        self.on_error = on_error
+        self.cancel_evt = threading.Event()
+        self.lock = threading.Lock()
+        self.thr: Union[None, threading.Thread] = None
+        self.name = ''
+
+    def busy(self) -> bool:
+        thr = self.thr
+        return thr is not None and thr.is_alive()
+
+    def run(self, name: str, steps: Iterator[float]) -> bool:
+        """Start a maneuver. Returns False if one is already running."""
+
+        with self.lock:
+            if self.busy():
+                logger.warning('Can not start %s while %s is running', name, self.name)
+                return False
+            self.cancel_evt.clear()
+            self.name = name
+            self.thr = threading.Thread(target=self._run, args=(name, steps), name=f'maneuver:{name}', daemon=True)
+            self.thr.start()
+        return True
+
+    def cancel(self) -> bool:
+        """Cut the running maneuver short, without waiting for its thread.
+        Returns False if none was running."""
+
+        with self.lock:
+            if not self.busy():
+                return False
+            self.cancel_evt.set()
+        return True
+
+    def join(self, timeout: Union[None, float] = 5):
+        thr = self.thr
+        if thr is not None and thr is not threading.current_thread():
+            thr.join(timeout)
+
+    def check(self):
+        """Raise ManeuverCancelled on the maneuver thread once it is cancelled"""
+        if self.cancel_evt.is_set() and threading.current_thread() is self.thr:
+            raise ManeuverCancelled(self.name)
+
+    def _wait(self, secs: float) -> bool:
+        # cancellable sleep in clock time, True if cancelled
+        deadline = clock.monotonic() + secs
+        while True:
+            remaining = deadline - clock.monotonic()
+            if remaining <= 0:
+                return self.cancel_evt.is_set()
+            if self.cancel_evt.wait(clock.timeout(remaining)):
+                return True
+
+    def _run(self, name: str, steps: Iterator[float]):
+
+        logger.info('%s: STARTING', name)
+        t0 = clock.monotonic()
+        try:
+            for secs in steps:
+                if self._wait(secs or 0):
+                    raise ManeuverCancelled(name)
+        except ManeuverCancelled:
+            logger.warning('%s: CANCELLED after %.1f secs', name, clock.monotonic() - t0)
+        except Exception as e:
+            logger.exception('%s: ERROR %s', name, e)
+            if self.on_error is not None:
+                self.on_error()
+        else:
+            logger.info('%s: DONE in %.1f secs', name, clock.monotonic() - t0)
+        finally:
+            if hasattr(steps, 'close'):
+                steps.close()
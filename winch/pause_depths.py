@@ -1,59 +1,57 @@
 #!/usr/bin/env python3
 
+import logging
 from pathlib import Path
 from typing import Tuple, Union
 
 import toml
 
+logger = logging.getLogger(__name__)
+
 
 class PauseDepths:
 
     def __init__(self, depths_fn: Path):
-        self._depths = sorted(self._read_pause_depths(depths_fn), reverse=True)
-        self._depths_completed = []
+        self._depths = sorted(self._read_pause_depths(depths_fn) or [], reverse=True)
         self._filepath = depths_fn
 
-    def _read_pause_depths(self, pause_depth_path : Path) -> list[float]:
+    def _read_pause_depths(self, pause_depth_path : Path) -> Union[None, list[float]]:
+        """Depths from the file, None if it is missing or not a list of numbers"""
 
         depths: list[float] = []
         if not pause_depth_path.exists():
-            print(f'CONFIG ERROR: Config file {pause_depth_path} does not exist.')
-            return []
+            logger.error('CONFIG ERROR: Config file %s does not exist.', pause_depth_path)
+            return None
 
         depths_cfg: Union[dict, None] = None
-        with pause_depth_path.open(mode="rt") as cfg_fl:
-            depths_cfg = toml.load(cfg_fl)
-            if depths_cfg:
-                depths = depths_cfg['DEPTHS']
-                if not isinstance(depths, list):
-                    print(f'ERROR reading depths file {pause_depth_path}')
-                    depths = []
+        try:
+            with pause_depth_path.open(mode="rt") as cfg_fl:
+                depths_cfg = toml.load(cfg_fl)
+        except (OSError, toml.TomlDecodeError) as e:
+            logger.error('ERROR reading depths file %s: %s', pause_depth_path, e)
+            return None
+        if depths_cfg:
+            depths = depths_cfg.get('DEPTHS')
+            if not isinstance(depths, list) or not all(isinstance(depth, (int, float)) and not isinstance(depth, bool)
+                                                      for depth in depths):
+                logger.error('ERROR reading depths file %s', pause_depth_path)
+                return None
 
         return depths
     
-    def refresh(self):
-        self._depths = sorted(self._read_pause_depths(self._filepath), reverse=True)
-
-    def get_next_depth(self, max_depth: Union[float, None]) -> Union[float, None]:
-
-        while len(self._depths) > 0:
-            if max_depth:
-                if self._depths[0] < max_depth:
-                    return self._depths[0]
-                else:
-                    del self._depths[0]
-                    continue
-
-            if len(self._depths) > 0:
-                return self._depths[0]
-            else:
-                return None
-
-    def use_next_depth(self) -> None:
-
-        if len(self._depths) > 0:
-            next: float = self._depths[0]
-            self._depths_completed.append(next)
-            del self._depths[0]
-
-        return
+    def refresh(self) -> bool:
+        """Re-read the file, keeping the depths there are if it is no good. Returns False if so."""
+        depths = self._read_pause_depths(self._filepath)
+        if depths is None:
+            return False
+        self._depths = sorted(depths, reverse=True)
+        return True
+
+    @property
+    def path(self) -> Path:
+        return self._filepath
+
+    @property
+    def depths(self) -> list[float]:
+        """Pause depths, deepest first"""
+        return list(self._depths)
@@ -1,38 +1,31 @@
 #!/usr/bin/env python3
 
 import json
+import logging
 from os.path import getmtime
 from pathlib import Path
 import queue
 from threading import Thread, Event
-import time
+from typing import Union
 
 import paho.mqtt.client as mqtt
 
+import clock
+from config import Config
+from config.watch import LiveConfig
+import metrics
+import mqttbus
 from winch import WinchCmd
 
+logger = logging.getLogger(__name__)
 
-def pause_monitor(cfg: dict, quit_evt: Event):
+
+def pause_monitor(cfg: Config, quit_evt: Event, live_cfg: Union[None, LiveConfig] = None):
     """waits the later of PAUSE_DURATION_SECS.
     Repeated PAUSE commands while pause already active
     adds another PAUSE_DUR to the pause end time"""
 
-    def _on_connect(client, userdata, flags, rc):
-        if rc==0:
-            # print("winctl:pausemon: connected OK: {client}")
-            pass
-        else:
-            print("winctl:pausemon: Bad connection for {client} Returned code: ", rc)
-            client.loop_stop()
-
-    def _on_disconnect(client, userdata, rc):
-        pass
-        # print("winctl:pausemon: client disconnected ok")
-
-    def _on_cmd_publish(client, userdata, mid):
-        print("winctl:pausemon: {client} mid= "  ,mid)
-
-    def _on_pause_message(client : mqtt.Client, userdata, message):
+    def _on_pause_message(message: mqtt.MQTTMessage):
         payload = message.payload.decode("utf-8")
         pause_q.put(payload)
 
@@ -43,46 +36,46 @@ def pause_monitor(cfg: dict, quit_evt: Event):
 
     pause_q: queue.Queue = queue.Queue()
 
-    mqtt_host : str = cfg["mqtt"]["HOST"]
-    mqtt_port : int = cfg["mqtt"]["PORT"]
-    pause_t = cfg["mqtt"]["WINCH_PAUSE_TOPIC"]
-    pausemon_sub : mqtt.Client = mqtt.Client('pausemon-data-sub')
-    pausemon_sub.on_connect = _on_connect
-    pausemon_sub.on_disconnect = _on_disconnect
-    pausemon_sub.on_message = _on_pause_message
-    pausemon_sub.connect(mqtt_host, mqtt_port)
-    pausemon_sub.subscribe(pause_t, qos=2)
-    pausemon_sub.loop_start()
-
-    wincmd_pub : mqtt.Client = mqtt.Client('pausemon-cmd-pub')
-    wincmd_pub.on_connect = _on_connect
-    wincmd_pub.on_disconnect = _on_disconnect
-    wincmd_pub.on_publish = _on_cmd_publish
-    wincmd_pub.connect(mqtt_host, mqtt_port)
-    wincmd_pub.loop_start()
-
-    default_pause_dur: float = float(cfg["winch"]["PAUSE_DURATION_SECS"])
-    bottle_pause_dur = float(cfg["winch"]["BOTTLE_PAUSE_DURATION_SECS"])
+    pause_t = cfg.mqtt.WINCH_PAUSE_TOPIC
+    bus = mqttbus.connection()
+    bus.subscribe(pause_t, _on_pause_message, qos=2)
+
+    default_pause_dur: float = cfg.winch.PAUSE_DURATION_SECS
+    bottle_pause_dur: float = cfg.winch.BOTTLE_PAUSE_DURATION_SECS
+    cfg_version: int = 0
     pause_dur: float = 0.0
     pause_active: bool = False
     pause_msg: str = ""
     pause_start: float = 0
     pause_end: float = 0
 
+    labels = cfg.metric_labels
+    pauses = metrics.counter('pauses_total', 'pauses started', labels=labels)
+    pause_extensions = metrics.counter('pause_extensions_total', 'pauses extended by another PAUSE', labels=labels)
+    metrics.gauge('pause_active', '1 while a pause is running', fn=lambda: int(pause_active), labels=labels)
+    metrics.gauge('pause_remaining_seconds', 'secs until the running pause ends',
+                  fn=lambda: max(0.0, pause_end - clock.time()) if pause_active else 0.0, labels=labels)
+
     while not quit_evt.is_set():
 
+        if live_cfg is not None and live_cfg.version != cfg_version:
+            # new durations apply from the next pause
+            cfg, cfg_version = live_cfg.get(cfg.name)
+            default_pause_dur = cfg.winch.PAUSE_DURATION_SECS
+            bottle_pause_dur = cfg.winch.BOTTLE_PAUSE_DURATION_SECS
+
         try:
             pause_msg = ''
-            pause_msg = pause_q.get(block=True, timeout= 0.15)
+            pause_msg = pause_q.get(block=True, timeout=clock.timeout(0.15))
             pause_q.task_done()
         except queue.Empty as e:
             pass
         except Exception as e:
-            print(f'winctl:pausemon: ERROR receiving data msg: {e}')
+            logger.error('ERROR receiving data msg: %s', e)
             continue
 
         # ignore pause if pause already active
-        t = time.time()
+        t = clock.time()
         pause_msg = pause_msg.lower()
         if (pause_msg in ["pause", "bottle-pause"]):
             
@@ -95,18 +88,22 @@ def pause_monitor(cfg: dict, quit_evt: Event):
                 pause_active = True
                 pause_start = t
                 pause_end = pause_start + pause_dur
-                print(f'winctl:pausemon: PAUSE starting  t:{time.time()} dur={pause_dur} secs at={pause_start} ending={pause_end}')
+                pauses.inc()
+                logger.info('PAUSE starting  t:%s dur=%s secs at=%s ending=%s', clock.time(), pause_dur, pause_start, pause_end)
             else:
                 # extend pause_end by another pause_dur
-                print(f'winctl:pausemon: PAUSE extending t:{time.time()} dur={pause_dur} secs at={pause_start} ending={pause_end}')
+                logger.info('PAUSE extending t:%s dur=%s secs at=%s ending=%s', clock.time(), pause_dur, pause_start, pause_end)
                 pause_end += pause_dur
+                pause_extensions.inc()
 
         if pause_active:
             # check modified date on pause flag file and add another pause_dur secs
-            # print(f'winctl:pausemon: PAUSE active    t:{time.time()} dur={pause_dur} secs at={pause_start} ending={pause_end}')
+            # print(f'winctl:pausemon: PAUSE active    t:{clock.time()} dur={pause_dur} secs at={pause_start} ending={pause_end}')
 
             if t > pause_end:
-                print(f'winctl:pausemon: PAUSE ending t:{time.time()} over after {pause_end - pause_start} secs')
+                logger.info('PAUSE ending t:%s over after %s secs', clock.time(), pause_end - pause_start)
                 pause_active = False
-                wincmd_pub.publish(cfg["mqtt"]["WINCH_CMD_TOPIC"],  json.dumps(CMD_START).encode(), qos=2)
+                bus.publish(cfg.mqtt.WINCH_CMD_TOPIC,  json.dumps(CMD_START).encode(), qos=2)
                 
+
+    bus.unsubscribe(pause_t, _on_pause_message)
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+
+from datetime import datetime
+import logging
+from pathlib import Path
+from typing import IO, Union
+
+import clock
+from config import Config
+
+from . import WinchStateName
+
+logger = logging.getLogger(__name__)
+
+HEADER = 'ts,edges1,edges2,depth_m,state\n'
+
+
+class PayoutRecorder:
+    """Payout log, one CSV file per cast: <LOG_DIR>/<PAYOUT_FN>-<start time>.csv
+
+    The file is kept open and buffered. It is flushed every
+    PAYOUT_FLUSH_SECS and whenever the winch state changes, and a new file
+    is started when the winch leaves PARKED."""
+
+    def __init__(self, cfg: Config):
+        log_dir = Path(cfg.rift_ox_pi.LOG_DIR)
+        if str(Path.home()).startswith('/Users/'):   # hack because dev dir path on Dan's computer is not th same as ~/dev on productionb Pi's
+            self.dir = Path.home().joinpath('dev/rift-ox', log_dir)
+        else:
+            self.dir = Path.home().joinpath(log_dir)
+        Path.mkdir(self.dir, parents=True, exist_ok=True)
+
+        self.name: str = cfg.rift_ox_pi.PAYOUT_FN
+        self.flush_secs: float = cfg.rift_ox_pi.PAYOUT_FLUSH_SECS
+        self.fl: Union[None, IO[str]] = None
+        self.path: Union[None, Path] = None
+        self.last_state = ''
+        self.last_flush = 0.0
+
+    def open(self):
+        self.close()
+        self.path = self.dir.joinpath(f'{self.name}-{datetime.fromtimestamp(clock.time()).strftime("%Y%m%d-%H%M%S")}.csv')
+        self.fl = open(self.path, mode='a', buffering=64 * 1024)
+        if self.fl.tell() == 0:
+            self.fl.write(HEADER)
+        self.last_flush = clock.monotonic()
+        logger.info('payouts to %s', self.path)
+
+    def record(self, status: dict, edges: list[int]):
+        state = status['state']
+        if self.fl is None or (self.last_state == WinchStateName.PARKED.value and state != self.last_state):
+            self.open()
+
+        self.fl.write(f'{status["ts"]:.2f},{edges[0]},{edges[1]},{status["depth_m"]:.2f},{state}\n')
+
+        now = clock.monotonic()
+        if state != self.last_state or now - self.last_flush >= self.flush_secs:
+            self.fl.flush()
+            self.last_flush = now
+        self.last_state = state
+
+    def close(self):
+        if self.fl is not None:
+            self.fl.close()
+            self.fl = None
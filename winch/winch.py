@@ -1,17 +1,19 @@
 #!/usr/bin/env python3
 
 from dataclasses import dataclass
-from datetime import datetime
-from math import pi
-from threading import Timer
-import time
-from typing import Protocol, Tuple, Union
+import logging
+from typing import Generator, Iterator, Protocol, Tuple, Union
 
-import paho.mqtt.client as mqtt
+import clock
+import metrics
+import mqttbus
 
 from .dio_cmds import DIOCommander
+from .maneuver import ManeuverExecutor
 from . import WinchStateName, WinchDir, WinchCmd
 
+logger = logging.getLogger(__name__)
+
 
 class WinchState(Protocol):
 
@@ -46,7 +48,7 @@ class WinchState(Protocol):
 class WinchProto(Protocol):
     cmndr: DIOCommander
     pause_t: str
-    pausemon_pub: mqtt.Client
+    pausemon_pub: mqttbus.Connection
 
     def stop(self):
         ...
@@ -72,9 +74,12 @@ class WinchProto(Protocol):
     def set_state(self, state: WinchState):
         ...
 
-    def get_latch_edge_count(self) -> Tuple[int, bool]:
+    def run_maneuver(self, name: str, steps: Iterator[float]) -> bool:
         ...
-    
+
+    def park_steps(self) -> Generator[float, None, bool]:
+        ...
+
     def latch_release(self):
         ...
 
@@ -86,19 +91,26 @@ class ParkedState():
     winch: WinchProto
 
     def stop(self):
-        print(f'Can not stop when already {self}')
+        logger.warning('Can not stop when already %s', self)
 
     def start(self):
-        unpark_up: int = int(self.winch.cmndr.cfg['winch']['UNPARKING_UPCAST_MS'])
-        unpark_down: int = int(self.winch.cmndr.cfg['winch']['UNPARKING_DOWNCAST_MS'])
-        self.winch.cmndr.up_cast(stop_after_ms=unpark_up)
+        self.winch.run_maneuver('UNPARKING', self._unpark_steps())
+
+    def _unpark_steps(self) -> Iterator[float]:
+        unpark_up: int = self.winch.cmndr.cfg.winch.UNPARKING_UPCAST_MS
+        unpark_down: int = self.winch.cmndr.cfg.winch.UNPARKING_DOWNCAST_MS
+        self.winch.cmndr.up_cast()
+        yield unpark_up / 1000
+        self.winch.cmndr.stop_winch()
         # time.sleep(2)
         self.winch.cmndr.latch_hold()
-        time.sleep(2)
-        self.winch.cmndr.down_cast(stop_after_ms=unpark_down)
-        time.sleep(5)
+        yield 2
+        self.winch.cmndr.down_cast()
+        yield unpark_down / 1000
+        self.winch.cmndr.stop_winch()
+        yield 5
         self.winch.cmndr.latch_release()
-        time.sleep(5)
+        yield 5
         self.winch.cmndr.stage()
         self.winch.set_state(StagingState(self.winch))
 
@@ -107,16 +119,16 @@ class ParkedState():
         self.start()
 
     def pause(self, pause_cmd: str = WinchCmd.WINCH_CMD_PAUSE.value):
-        print(f'Can not pause when {self}')
+        logger.warning('Can not pause when %s', self)
 
     def stop_at_bottom(self):
-        print(f'Can not stop-at-bottom when {self}')
+        logger.warning('Can not stop-at-bottom when %s', self)
 
     def up_cast(self):
-        print(f'Can not up-cast when {self}')
+        logger.warning('Can not up-cast when %s', self)
 
     def up_stage(self):
-        print(f'Can not up_stage when {self}')
+        logger.warning('Can not up_stage when %s', self)
 
     def park(self):
         pass
@@ -130,13 +142,13 @@ class StagingState():
     winch: WinchProto
 
     def stop(self):
-        print(f'Can not stop when {self}')
+        logger.warning('Can not stop when %s', self)
 
     def start(self):
-        print(f'Can not start when {self}')
+        logger.warning('Can not start when %s', self)
 
     def down_cast(self):
-        print(f'Can not down-cast when {self}')
+        logger.warning('Can not down-cast when %s', self)
 
     def pause(self, pause_cmd: str = WinchCmd.WINCH_CMD_PAUSE.value):
         self.winch.cmndr.stop_winch()
@@ -147,16 +159,16 @@ class StagingState():
         #TODO Need to send CMD to start ctdmon data acq (initlogging, etc)
 
     def stop_at_bottom(self):
-        print(f'Can not stop-at-bottom when {self}')
+        logger.warning('Can not stop-at-bottom when %s', self)
 
     def up_cast(self):
-        print(f'Can not up-cast when {self}')
+        logger.warning('Can not up-cast when %s', self)
 
     def up_stage(self):
-        print(f'Can not up-stage when {self}')
+        logger.warning('Can not up-stage when %s', self)
 
     def park(self):
-        print(f'Can not park when {self}')
+        logger.warning('Can not park when %s', self)
 
     def __str__(self):
         return WinchStateName.STAGING.value
@@ -167,7 +179,7 @@ class DownStagedState():
     winch: WinchProto
 
     def stop(self):
-        print(f'Can not stop when {self}')
+        logger.warning('Can not stop when %s', self)
 
     def start(self):
         # start called after pause duration elapses
@@ -182,19 +194,19 @@ class DownStagedState():
         self.winch.set_state(DowncastingState(self.winch))
 
     def stop_at_bottom(self):
-        print(f'Can not stop-at-bottom when {self}')
+        logger.warning('Can not stop-at-bottom when %s', self)
 
     def pause(self, pause_cmd: str = WinchCmd.WINCH_CMD_PAUSE.value):
-        print(f'Can not pause when {self}')
+        logger.warning('Can not pause when %s', self)
 
     def up_cast(self):
-        print(f'Can not up-cast when {self}')
+        logger.warning('Can not up-cast when %s', self)
 
     def up_stage(self):
-        print(f'Can not up-stage when {self}')
+        logger.warning('Can not up-stage when %s', self)
 
     def park(self):
-        print(f'Can not park when {self}')
+        logger.warning('Can not park when %s', self)
 
     def __str__(self):
         return WinchStateName.DOWN_STAGED.value
@@ -205,43 +217,44 @@ class UpStagedState():
     winch: WinchProto
 
     def stop(self):
-        print(f'Can not stop when {self}')
+        logger.warning('Can not stop when %s', self)
 
     def start(self):
         # same as Park when UpStaged
         self.park()
 
     def down_cast(self):
-        print(f'Can not downcast when {self}')
+        logger.warning('Can not downcast when %s', self)
 
     def pause(self, pause_cmd: str = WinchCmd.WINCH_CMD_PAUSE.value):
-        print(f'Can not pause when {self}')
+        logger.warning('Can not pause when %s', self)
 
     def stop_at_bottom(self):
-        print(f'Can not stop-at-bottom when {self}')
+        logger.warning('Can not stop-at-bottom when %s', self)
 
     def up_cast(self):
-        print(f'Can not upcast when {self}, only Park or Start')
+        logger.warning('Can not upcast when %s, only Park or Start', self)
 
     def up_stage(self):
-        print(f'Can not up-stage when {self}')
+        logger.warning('Can not up-stage when %s', self)
 
     def park(self):
         #TODO send cmd to stop data acq in ctdmon
-        if not self.winch.cmndr.cfg['winch']['NO_PARKING']:
-            self.winch.set_state(ParkingState(self.winch))
-            time.sleep(2)
-            # winch moving at ~ 2/3 meter per sec. Upcast for STGAING_DEPTH secs
-            # to get most of the way back to the winch latch
-            # park() takes it the rest of the way in small/short moves
-            self.winch.cmndr.up_cast(stop_after_ms=int(self.winch.cmndr.cfg['winch']['STAGING_DEPTH']))
-            self.winch.park()
-            self.winch.set_state(ParkedState(self.winch))
+        if not self.winch.cmndr.cfg.winch.NO_PARKING:
+            parking = ParkingState(self.winch)
+            self.winch.set_state(parking)
+            self.winch.run_maneuver('PARKING', self._park_steps(parking))
         else:
-            print(f'Sorry, parking is disabled for today. STOPPING HERE')
+            logger.warning('Sorry, parking is disabled for today. STOPPING HERE')
             self.winch.cmndr.stop_winch()
             # self.winch.set_state(ParkedState(self.winch))
 
+    def _park_steps(self, parking: 'ParkingState') -> Iterator[float]:
+        yield 2
+        # parking reels in all STAGING_DEPTH, checking the latch as it goes,
+        # an unchecked upcast ahead of it could only carry the bullet past the latch
+        yield from parking.steps()
+
     def __str__(self):
         return WinchStateName.UP_STAGED.value
 
@@ -252,13 +265,13 @@ class DowncastingState():
     winch: WinchProto
 
     def stop(self):
-        print(f'Can not stop when {self}')
+        logger.warning('Can not stop when %s', self)
 
     def start(self):
-        print(f'Can not start when {self}')
+        logger.warning('Can not start when %s', self)
 
     def down_cast(self):
-        print(f'Can not downcast when {self}.')
+        logger.warning('Can not downcast when %s.', self)
 
     def pause(self, pause_cmd: str = WinchCmd.WINCH_CMD_PAUSE.value):
         self.winch.cmndr.stop_winch()
@@ -273,13 +286,13 @@ class DowncastingState():
         self.winch.set_state(MaxDepthState(self.winch))
 
     def up_cast(self):
-        print(f'Can not up-cast when {self}')
+        logger.warning('Can not up-cast when %s', self)
 
     def up_stage(self):
-        print(f'Can not up-stage when {self}')
+        logger.warning('Can not up-stage when %s', self)
 
     def park(self):
-        print(f'Can not park when {self}')
+        logger.warning('Can not park when %s', self)
 
     def __str__(self):
         return WinchStateName.DOWNCASTING.value
@@ -290,13 +303,13 @@ class UpcastingState():
     winch: WinchProto
 
     def stop(self):
-        print(f'Can not stop when {self}')
+        logger.warning('Can not stop when %s', self)
 
     def start(self):
-        print(f'Can not start when {self}')
+        logger.warning('Can not start when %s', self)
 
     def down_cast(self):
-        print(f'Can not downcast when {self}.')
+        logger.warning('Can not downcast when %s.', self)
 
     def pause(self, pause_cmd: str = WinchCmd.WINCH_CMD_PAUSE.value):
         self.winch.cmndr.stop_winch()
@@ -305,10 +318,10 @@ class UpcastingState():
         self.winch.set_state(UpPausedState(self.winch))        
 
     def stop_at_bottom(self):
-        print(f'Can not stop-at-bottom when {self}')
+        logger.warning('Can not stop-at-bottom when %s', self)
 
     def up_cast(self):
-        print(f'Can not upcast when {self}')
+        logger.warning('Can not upcast when %s', self)
 
     def up_stage(self):
         self.winch.cmndr.stop_winch()
@@ -317,7 +330,7 @@ class UpcastingState():
         self.winch.set_state(UpStagedState(self.winch))        
 
     def park(self):
-        print(f'Can not park when {self}')
+        logger.warning('Can not park when %s', self)
 
     def __str__(self):
         return WinchStateName.UPCASTING.value
@@ -328,29 +341,29 @@ class MaxDepthState():
     winch: WinchProto
 
     def stop(self):
-        print(f'Can not stop when {self}.')
+        logger.warning('Can not stop when %s.', self)
 
     def start(self):
         self.up_cast()
 
     def down_cast(self):
-        print(f'Can not downcast when {self}.')
+        logger.warning('Can not downcast when %s.', self)
 
     def pause(self, pause_cmd: str = WinchCmd.WINCH_CMD_PAUSE.value):
-        print(f'Can not downpause when {self}')
+        logger.warning('Can not downpause when %s', self)
 
     def stop_at_bottom(self):
-        print(f'Can not stop-at-bottom when {self}')
+        logger.warning('Can not stop-at-bottom when %s', self)
 
     def up_cast(self):
         self.winch.cmndr.up_cast()
         self.winch.set_state(UpcastingState(self.winch))
 
     def up_stage(self):
-        print(f'Can not up-stage when {self}')
+        logger.warning('Can not up-stage when %s', self)
 
     def park(self):
-        print(f'Can not park when {self}')
+        logger.warning('Can not park when %s', self)
 
     def __str__(self):
         return WinchStateName.MAXDEPTH.value
@@ -359,33 +372,41 @@ class MaxDepthState():
 @dataclass
 class ParkingState():
     # the park() command which intiates ParkingState
-    # ends by setting state to ParkedState
-    # so no cmds active while parking
+    # ends by setting state to ParkedState once the latch is found,
+    # if it is not found (or the sensor can not be read) the winch is stopped
+    # and stays PARKING. no cmds active while parking, except STOP which cancels it.
+    # start or park after a STOP or a failure carries on parking
     winch: WinchProto
 
     def stop(self):
-        print(f'Can not stop when {self}')
+        logger.warning('Can not stop when %s', self)
 
     def start(self):
-        print(f'Can not start when {self}')
+        self.park()
+
+    def steps(self) -> Iterator[float]:
+        if (yield from self.winch.park_steps()):
+            self.winch.set_state(ParkedState(self.winch))
+        else:
+            logger.error('PARKING FAILED, still %s, send PARK or START to try again', self)
 
     def down_cast(self):
-        print(f'Can not down-cast when {self}.')
+        logger.warning('Can not down-cast when %s.', self)
 
     def pause(self, pause_cmd: str = WinchCmd.WINCH_CMD_PAUSE.value):
-        print(f'Can not pause when {self}')
+        logger.warning('Can not pause when %s', self)
 
     def stop_at_bottom(self):
-        print(f'Can not stop-at-bottom when {self}')
+        logger.warning('Can not stop-at-bottom when %s', self)
 
     def up_cast(self):
-        print(f'Can not upcast when {self}')
+        logger.warning('Can not upcast when %s', self)
 
     def up_stage(self):
-        print(f'Can not up-stage when {self}')
+        logger.warning('Can not up-stage when %s', self)
 
     def park(self):
-        print(f'Can not park when {self}')
+        self.winch.run_maneuver('PARKING', self.steps())
 
     def __str__(self):
         return WinchStateName.PARKING.value
@@ -395,31 +416,31 @@ class DownPausedState():
     winch: WinchProto
 
     def stop(self):
-        print(f'Can not stop when {self}')
+        logger.warning('Can not stop when %s', self)
 
     def start(self):
         # same as down cast
         self.down_cast()
-        print(f'Can not start when {self}')
+        logger.warning('Can not start when %s', self)
 
     def down_cast(self):
         self.winch.cmndr.down_cast()
         self.winch.set_state(DowncastingState(self.winch))
 
     def pause(self, pause_cmd: str = WinchCmd.WINCH_CMD_PAUSE.value):
-        print(f'Can not pause when {self}')
+        logger.warning('Can not pause when %s', self)
 
     def stop_at_bottom(self):
-        print(f'Can not stop-at-bottom when {self}')
+        logger.warning('Can not stop-at-bottom when %s', self)
 
     def up_cast(self):
-        print(f'Can not upcast when {self}')
+        logger.warning('Can not upcast when %s', self)
 
     def up_stage(self):
-        print(f'Can not up-stage when {self}')
+        logger.warning('Can not up-stage when %s', self)
 
     def park(self):
-        print(f'Can not park when {self}')
+        logger.warning('Can not park when %s', self)
 
     def __str__(self):
         return WinchStateName.DOWN_PAUSED.value
@@ -429,7 +450,7 @@ class UpPausedState():
     winch: WinchProto
 
     def stop(self):
-        print(f'Can not stop when {self}')
+        logger.warning('Can not stop when %s', self)
 
     def start(self):
         # same as up_cast when in up-paused state
@@ -437,23 +458,23 @@ class UpPausedState():
         self.winch.set_state(UpcastingState(self.winch))
 
     def down_cast(self):
-        print(f'Can not downcast when {self}.')
+        logger.warning('Can not downcast when %s.', self)
 
     def pause(self, pause_cmd: str = WinchCmd.WINCH_CMD_PAUSE.value):
-        print(f'Can not pause when {self}')
+        logger.warning('Can not pause when %s', self)
 
     def stop_at_bottom(self):
-        print(f'Can not stop-at-bottom when {self}')
+        logger.warning('Can not stop-at-bottom when %s', self)
 
     def up_cast(self):
         self.winch.cmndr.up_cast()
         self.winch.set_state(UpcastingState(self.winch))
 
     def up_stage(self):
-        print(f'Can not up-stage when {self}')
+        logger.warning('Can not up-stage when %s', self)
 
     def park(self):
-        print(f'Can not park when {self}, only when up-staged')
+        logger.warning('Can not park when %s, only when up-staged', self)
 
     def __str__(self):
         return WinchStateName.UP_PAUSED.value
@@ -464,80 +485,91 @@ class Winch:
 
     def __init__(self, cmndr: DIOCommander):
 
-        def on_connect(client, userdata, flags, rc):
-            if rc==0:
-                client.connected_flag=True #set flag
-                # print("winctl:winch:Winch connected OK: {client}")
-            else:
-                print("winctl:winch:Winch Bad connection for {client} Returned code: ", rc)
-                client.loop_stop()
-
-        def on_disconnect(client, userdata, rc):
-            client.connected_flag=False #set flag
-            # print("winctl:winch:Winch client disconnected ok")
-
-        def _on_pause_publish(client, userdata, mid):
-            print("winctl:winch:Winch: {client} mid= "  ,mid)
-
-    
         self.cmndr: DIOCommander = cmndr
         self.state: WinchState = ParkedState(self)
 
+        # unparking and parking run here, off the command loop
+        self.maneuvers = ManeuverExecutor(on_error=self.cmndr.stop_winch)
+        self.cmndr.cancel_check = self.maneuvers.check
+        labels = self.cmndr.cfg.metric_labels
+        self.park_time = metrics.histogram('winch_park_seconds', 'parking upcast start to latch found',
+                                           buckets=(1, 2, 5, 10, 20, 30, 60, 120), labels=labels)
+        self.park_overshoot = metrics.gauge('winch_park_overshoot_m', 'cable reeled in after the latch was seen, last park',
+                                            labels=labels)
+
         # set up payout vars
         self.down_edges: float = 0.0
         self.up_edges: float = 0.0
         self.last_payout_cnt: int
-        self._sim_payout_ts: float = time.time()  # only used when simulation == True
+        self.payout_counts: list[int] = [0, 0]     # last raw edge counts of both payout sensors
+        self._sim_payout_ts: float = clock.time()  # only used when simulation == True
 
         if not self.cmndr.simulation:
             payouts, err = self.cmndr.get_payout_edge_count()
             if err:
-                print(f'winch:winch: ERROR getting payout edge cnts')
+                logger.error('ERROR getting payout edge cnts')
                 return 
             else:
                 self.last_payout_cnt = payouts[0]  # doesn't matter which sensor we use
+                self.payout_counts = payouts
 
         # vars only to facilitate simulated responses from winch
         self._sim_latch_edge_count = 0
 
-        mqtt_host : str = self.cmndr.cfg["mqtt"]["HOST"]
-        mqtt_port : int = self.cmndr.cfg["mqtt"]["PORT"]
+        # pause commands go to pausemon over the daemon's mqtt connection
+        self.pause_t = self.cmndr.cfg.mqtt.WINCH_PAUSE_TOPIC
+        self.pausemon_pub: mqttbus.Connection = mqttbus.connection()
 
-        # set up pause cmd mqtt publisher
-        self.pause_t = self.cmndr.cfg["mqtt"]["WINCH_PAUSE_TOPIC"]
+        logger.info('SEA_CABLE_DIAMETER: %s', self.cmndr.cfg.winch.SEA_CABLE_DIAMETER_INCH)
+        logger.info('SHEAVE_RADIUS_INCH: %s', self.cmndr.cfg.winch.SHEAVE_RADIUS_INCH)
 
-        self.pausemon_pub : mqtt.Client = mqtt.Client('pausemon-ctl-pub')
-        self.pausemon_pub.on_connect = on_connect
-        self.pausemon_pub.on_disconnect = on_disconnect
-        self.pausemon_pub.on_publish = _on_pause_publish
-        self.pausemon_pub.connect(mqtt_host, mqtt_port)
-        self.pausemon_pub.loop_start()
+    def run_maneuver(self, name: str, steps: Iterator[float]) -> bool:
+        return self.maneuvers.run(name, steps)
 
-        print(f"SEA_CABLE_DIAMETER: {self.cmndr.cfg['winch']['SEA_CABLE_DIAMETER_INCH']}")
-        print(f"SHEAVE_RADIUS_INCH: {self.cmndr.cfg['winch']['SHEAVE_RADIUS_INCH']}")
+    def cancel_maneuver(self) -> bool:
+        """Stop the winch if a maneuver is running, and the maneuver with it.
+        Returns False if none was running."""
+        if not self.maneuvers.cancel():
+            return False
+        self.cmndr.stop_winch()
+        self.maneuvers.join()
+        return True
+
+    def _maneuvering(self, cmd: str) -> bool:
+        if self.maneuvers.busy():
+            logger.warning('Can not %s when %s while %s', cmd, self.state, self.maneuvers.name)
+            return True
+        return False
 
     def stop(self):
-        self.state.stop()
+        if not self.cancel_maneuver():
+            self.state.stop()
 
     def start(self):
-        self.state.start()
+        if not self._maneuvering('start'):
+            self.state.start()
 
     def down_cast(self):
-        self.state.down_cast()
+        if not self._maneuvering('down-cast'):
+            self.state.down_cast()
 
     # def pause(self, pause_cmd: str = WinchCmd.WINCH_CMD_PAUSE.value):
         # self.state.pause(pause_cmd)
     def pause(self, pause_cmd: str = WinchCmd.WINCH_CMD_PAUSE.value):
-        self.state.pause()
+        if not self._maneuvering('pause'):
+            self.state.pause()
 
     def stop_at_bottom(self):
-        self.state.stop_at_bottom()
+        if not self._maneuvering('stop-at-bottom'):
+            self.state.stop_at_bottom()
 
     def up_cast(self):
-        self.state.up_cast()
+        if not self._maneuvering('up-cast'):
+            self.state.up_cast()
 
     def up_stage(self):
-        self.state.up_stage()
+        if not self._maneuvering('up-stage'):
+            self.state.up_stage()
 
     # def park(self):
     #     #TODO WORK ON LATCH_EDGE SIMULATION: use timer() ??
@@ -547,21 +579,37 @@ class Winch:
     #     self.state.park()
 
     def unpark(self):
-        unpark_up: int = int(self.cmndr.cfg['winch']['UNPARKING_UPCAST_MS'])
-        unpark_down: int = int(self.cmndr.cfg['winch']['UNPARKING_DOWNCAST_MS'])
-        self.cmndr.up_cast(stop_after_ms=unpark_up)
+        self.run_maneuver('UNPARKING', self.unpark_steps())
+
+    def unpark_steps(self) -> Iterator[float]:
+        unpark_up: int = self.cmndr.cfg.winch.UNPARKING_UPCAST_MS
+        unpark_down: int = self.cmndr.cfg.winch.UNPARKING_DOWNCAST_MS
+        self.cmndr.up_cast()
+        yield unpark_up / 1000
+        self.cmndr.stop_winch()
         # time.sleep(2)
         self.cmndr.latch_hold()
-        time.sleep(3.5)
-        self.cmndr.down_cast(stop_after_ms=unpark_down)
-        time.sleep(1)
+        yield 3.5
+        self.cmndr.down_cast()
+        yield unpark_down / 1000
+        self.cmndr.stop_winch()
+        yield 1
         self.cmndr.latch_release()
 
-
     def park(self):
+        self.run_maneuver('PARKING', self.park_steps())
+
+    def park_steps(self) -> Generator[float, None, bool]:
         """Parking is moving winch backwards until LATCH signal
         is detected and then paying out for < 1sec so that bullet will latch.
-        This should leave the winch in the (physically) LATCHED position
+        This should leave the winch in the (physically) LATCHED position.
+        Returns False, with the winch stopped, if the latch was not found.
+
+        The winch creeps up without stopping while the latch edge count is
+        polled every PARKING_LATCH_POLL_MS over an open DIO session, so it is
+        stopped within one poll of the latch edge. Park duration and the
+        overshoot (cable reeled in from the poll that saw the edge to
+        standstill) are logged per cast.
         
         NOTE we are using dio_cmndr.<command> directly to control winch while bypassing the 
         Winch state machine because Parking is a compound command and requires multiple winch
@@ -570,77 +618,99 @@ class Winch:
 
         def _sim_inc_latch_cnt(edgeinc: int) -> None:
             self._sim_latch_edge_count += edgeinc
-            print(f'PARKING Timer changed latch edge count to {self._sim_latch_edge_count}')
+            logger.info('PARKING Timer changed latch edge count to %s', self._sim_latch_edge_count)
+
+        poll_secs: float = self.cmndr.cfg.winch.PARKING_LATCH_POLL_MS / 1000
+        timeout_secs: float = self.cmndr.cfg.winch.PARKING_TIMEOUT_SECS
+        max_poll_errors: int = self.cmndr.cfg.winch.PARKING_MAX_POLL_ERRORS
 
-        print(f'PARKING: STARTING')
+        logger.info('PARKING: STARTING')
 
         if self.cmndr.simulation:
-            t = Timer(interval=3, function=_sim_inc_latch_cnt, args=(10,))
-            t.start()
-            # self._sim_latch_edge_count += 3
-
-        # check current latch edge count
-        start_latch_edge_cnt, err = self.get_latch_edge_count()
-        if err:
-            print('PARKING UNABLE to get LATCH SENSOR state when PARKING')
-            return
-
-        new_latch_edge_count = start_latch_edge_cnt
-        print(f'PARKING: EDGE CNT: starting: {start_latch_edge_cnt}; now: {new_latch_edge_count}')
-    
-        latch_found: bool = new_latch_edge_count > start_latch_edge_cnt
-        while not (latch_found):
+            clock.timer(interval=3, function=_sim_inc_latch_cnt, args=(10,))
+
+        with self.cmndr.session():
 
-            # check fr new LATCH edge count
-            new_latch_edge_count, err = self.get_latch_edge_count()
+            # check current latch edge count
+            start_latch_edge_cnt, _, err = self.latch_poll()
             if err:
-                self.cmndr.stop_winch()
-                print('PARKING UNABLE to get LATCH SENSOR state when PARKING')
-                return
-            print(f'PARKING: NEW LATCH EDGE CNT: {new_latch_edge_count}')
-            
-            latch_found = new_latch_edge_count > start_latch_edge_cnt
-            print(f'PARKING: LATCH FOUND? - LOOP: {latch_found}')
-            if latch_found:
-                self.cmndr.pin_hi('stop')  # stop ASAP
-                break
-
-            print(f'PARKING: UP CASTING')
-            self.cmndr.up_cast(int(self.cmndr.cfg["winch"]["PARKING_UPCAST_INC_MS"]))
-            # need a pretty fast loop here while up_casting
-            time.sleep(1)    
+                logger.error('PARKING UNABLE to get LATCH SENSOR state when PARKING')
+                return False
+            logger.info('PARKING: EDGE CNT: starting: %s', start_latch_edge_cnt)
+
+            t0 = clock.monotonic()
+            poll_errors = 0
+            logger.debug('PARKING: UP CASTING')
+            self.cmndr.up_cast()
+            while True:
+                latch_edge_cnt, found_payout_cnt, err = self.latch_poll()
+                if err:
+                    # one garbled poll is retried, the edge count keeps the edge for the next one
+                    poll_errors += 1
+                    if poll_errors >= max_poll_errors:
+                        self.cmndr.stop_winch()
+                        logger.error('PARKING UNABLE to get LATCH SENSOR state when PARKING')
+                        return False
+                    yield poll_secs
+                    continue
+                poll_errors = 0
+                if latch_edge_cnt > start_latch_edge_cnt:
+                    self.cmndr.pin_hi('stop')  # stop ASAP
+                    break
+                if clock.monotonic() - t0 > timeout_secs:
+                    self.cmndr.stop_winch()
+                    logger.error('PARKING: NO LATCH after %.0f secs, winch stopped', timeout_secs)
+                    return False
+                yield poll_secs
+
+            park_secs = clock.monotonic() - t0
+            self.cmndr.stop_winch()
+            logger.info('PARKING: LATCH FOUND, STOPPING WINCH')
+            # latch has been found
+            # presumably we are above the LATCH now.
+            logger.info('PARKING: RELEASING LATCH')
+            self.cmndr.latch_release()
+            yield 1
+
+            # winch has coasted to a stop by now
+            _, rest_payout_cnt, err = self.latch_poll()
+            if not err:
+                overshoot_m = self.edges_to_m(rest_payout_cnt - found_payout_cnt)
+                self.park_overshoot.set(overshoot_m)
+                logger.info('PARKING: latch found after %.1f secs, overshoot %.3fm (%d edges)',
+                            park_secs, overshoot_m, rest_payout_cnt - found_payout_cnt)
+            else:
+                logger.info('PARKING: latch found after %.1f secs', park_secs)
+            self.park_time.observe(park_secs)
 
-        self.cmndr.stop_winch()
-        print(f'PARKING: LATCH FOUND: {latch_found}')
-        print(f'PARKING: STOPPING WINCH')
-        # latch has been found
-        # presumably we are above the LATCH now.
-        print(f'PARKING: RELEASING LATCH')
-        self.cmndr.latch_release()
-        time.sleep(1)
         # drop a fraction of a sec (an inch or two) so bullet rests on latch
-        print(f'PARKING: DOWNCASTING FOR {self.cmndr.cfg["winch"]["PARKING_DOWNCAST_MS"]}ms')
-        self.cmndr.down_cast(stop_after_ms=int(self.cmndr.cfg["winch"]["PARKING_DOWNCAST_MS"]))
+        logger.info('PARKING: DOWNCASTING FOR %sms', self.cmndr.cfg.winch.PARKING_DOWNCAST_MS)
+        self.cmndr.down_cast()
+        yield self.cmndr.cfg.winch.PARKING_DOWNCAST_MS / 1000
+        self.cmndr.stop_winch()
+        return True
 
     def set_state(self, state: WinchState):
         if self.cmndr.simulation:
             self.update_payout_edge_counts()
         self.state = state
 
-    def get_latch_edge_count(self) -> Tuple[int, bool]:
-        latch_edge_count_str, _ = self.cmndr.get_latch_edge_count()
+    def latch_poll(self) -> Tuple[int, int, bool]:
+        """Latch and payout1 edge counts in one exchange"""
+        latch_edges, payout_edges, err = self.cmndr.latch_poll()
         if self.cmndr.simulation:
-            latch_edge_count_str = self._sim_latch_edge_count
-        return int(latch_edge_count_str), False
+            return int(self._sim_latch_edge_count), 0, False
+        return latch_edges, payout_edges, err
     
     def latch_release(self):
         self.cmndr.latch_release()
 
-    def update_payout_edge_counts(self):
+    def update_payout_edge_counts(self, payouts: Union[None, list[int]] = None):
+        """Add the payout edges since the last call, from `payouts` if already read"""
         if self.cmndr.simulation:
             # calling get_payout)_edge_count just so we can send cmd being 'sent'
             _, _ = self.cmndr.get_payout_edge_count()
-            t = time.time()
+            t = clock.time()
             if isinstance(self.state, (StagingState, DowncastingState)):
                 self.down_edges += (t - self._sim_payout_ts) * 12.0
             elif isinstance(self.state, UpcastingState):
@@ -649,28 +719,33 @@ class Winch:
 
         else:
             # get real payout sensors readings
-            payouts, err = self.cmndr.get_payout_edge_count()
-            if err:
-                print(f'states:winch ERROR get payout edge count')
-                return
+            if payouts is None:
+                payouts, err = self.cmndr.get_payout_edge_count()
+                if err:
+                    logger.error('ERROR get payout edge count')
+                    return
             if isinstance(self.state, (StagingState, DowncastingState)):
                 self.down_edges += (payouts[0] - self.last_payout_cnt)
             elif isinstance(self.state, UpcastingState):
                 self.up_edges += (payouts[0] - self.last_payout_cnt)
             self.last_payout_cnt = payouts[0]
 
+    def edges_to_m(self, edges: float) -> float:
+        """Cable paid out or reeled in over `edges` payout sensor edges, 12 per sheave revolution"""
+        return edges * self.cmndr.cfg.winch.m_per_edge
+
     def depth_from_payout_edges_m(self) -> float:
 
-        # assumes 5.25in radius sheave/wheel
-        cable_radius_inches = self.cmndr.cfg["winch"]["SEA_CABLE_DIAMETER_INCH"] / 2.0
-        dist_down: float = (self.down_edges / 12) * 2 * pi * (self.cmndr.cfg["winch"]["SHEAVE_RADIUS_INCH"] + cable_radius_inches) / 39.37008
-        dist_up: float = (self.up_edges / 12) * 2 * pi * (self.cmndr.cfg["winch"]["SHEAVE_RADIUS_INCH"] + cable_radius_inches) / 39.37008
-        print(f'cnt/Down/Up edges: {self.last_payout_cnt}/{self.down_edges}/{self.up_edges} : dist_m dopwn/up: {dist_down}/{dist_up}')
+        dist_down: float = self.edges_to_m(self.down_edges)
+        dist_up: float = self.edges_to_m(self.up_edges)
+        logger.debug('cnt/Down/Up edges: %s/%s/%s : dist_m down/up: %s/%s',
+                     self.last_payout_cnt, self.down_edges, self.up_edges, dist_down, dist_up)
         return dist_down - dist_up
 
     def status(self) -> Tuple[dict, bool]:
 
         cur_status = {}
+        payouts: Union[None, list[int]] = None
 
         # get winch direction, if any
         if self.cmndr.simulation:
@@ -682,16 +757,20 @@ class Winch:
                 cur_status["dir"] = WinchDir.DIRECTION_NONE.value
             err = False
         else:
-            cur_status["dir"], err = self.cmndr.get_winch_direction()
+            # direction from the output pins' shadow register, payouts in the same exchange
+            snap, err = self.cmndr.snapshot()
             if err:
-                print(f'states:winch ERROR get winch direction')
+                logger.error('ERROR get winch snapshot')
                 return {}, err
+            cur_status["dir"] = snap['dir']
+            payouts = snap['payout']
+            self.payout_counts = payouts
 
         if cur_status['dir'] != WinchDir.DIRECTION_NONE.value:
-            self.update_payout_edge_counts()
+            self.update_payout_edge_counts(payouts)
 
         cur_status["depth_m"] = round(self.depth_from_payout_edges_m(), 2)
         cur_status["state"] = str(self.state)
-        cur_status["ts"] = round(datetime.utcnow().timestamp(), 2)
+        cur_status["ts"] = round(clock.time(), 2)
 
         return cur_status, False
@@ -5,140 +5,124 @@ import logging
 from pathlib import Path
 import queue
 import threading
-import time
 from typing import Tuple, Union
 
 import paho.mqtt.client as mqtt
 
+import clock
+from config import Config
+from config.watch import LiveConfig
+import metrics
+import mqttbus
+import profiling
+
 from .dio_cmds import DIOCommander
+from .latest_value import LatestValue
+from .payout_recorder import PayoutRecorder
 from .winch import Winch
 
 from . import WINCH_CMD_LIST, WinchCmd
 
+logger = logging.getLogger(__name__)
+
 
-def wincmd_loop(cfg: dict, winch_status_q: queue.Queue, quit_evt : threading.Event):
+def wincmd_loop(cfg: Config, winch_status: LatestValue, quit_evt : threading.Event,
+                live_cfg: Union[None, LiveConfig] = None):
 
     # internal queue to take message from MQTT client callback
     # and forward to main winctl loop
-    def on_cmd_msg(client, userdata, message):
+    def on_cmd_msg(message: mqtt.MQTTMessage):
 
         msg_str = message.payload.decode('utf-8')
-        print(f'winctl:wincmd_loop: : CMD RCVD: {msg_str}')
+        logger.info('CMD RCVD: %s', msg_str)
         msg_json = json.loads(msg_str)
+        if str(msg_json.get('command', '')).upper() == profiling.PROFILE_CMD:
+            # handled here rather than in the command loop, which may be what is falling behind
+            profiling.command(cfg, 'winctl', msg_json.get('action', profiling.ACTION_START), msg_json.get('secs'))
+            return
         cmd_q.put(msg_json)
 
-    def on_connect(client, userdata, flags, rc):
-        if rc==0:
-            print("winctl:wincmd: connected OK: {client}")
-        else:
-            print("winctl:wincmd: Bad connection for {client} Returned code: ", rc)
-            client.loop_stop()
-
-    def on_disconnect(client, userdata, rc):
-        print("client disconnected ok")
-
-    def on_cmd_subscribe(client, userdata, mid, granted_qos):
-        print("Subscribed: "+str(mid)+" "+str(granted_qos))
-
-    def _on_pause_publish(client, userdata, mid):
-        print("winctl:wincmd:pause_pub: {client} mid= "  ,mid)
+    def status_changed(status: dict, last: dict) -> bool:
+        return (not last or status['state'] != last['state'] or status['dir'] != last['dir'] or
+                abs(status['depth_m'] - last['depth_m']) >= status_depth_delta)
 
-    def get_payout_fn(name: Path) -> Path:
-        log_dir = Path(cfg['rift-ox-pi']['LOG_DIR'])
-
-        payout_fpath: Path
-        if str(Path.home()).startswith('/Users/'):   # hack because dev dir path on Dan's computer is not th same as ~/dev on productionb Pi's
-            payout_fpath = Path.home().joinpath('dev/rift-ox', log_dir)             # pause at these depths in meters
-        else:
-            payout_fpath = Path.home().joinpath(log_dir)             # pause at these depths in meters
-        
-        Path.mkdir(payout_fpath, parents = True, exist_ok = True)
-        payout_fpath = payout_fpath.joinpath(name)
-
-        return payout_fpath
-    
-    def save_payout(status: dict, fn: Path):
-        ts = status["ts"]
-        payout_depth = status["depth_m"]
-        with open(get_payout_fn(fn), mode='a') as pofl:
-            pofl.write(f'{ts:<26}, {payout_depth}\r')
-        return
-
-    def share_new_winch_status(winch: Winch, fname: Path) -> Tuple[dict, bool]:
+    def share_new_winch_status(winch: Winch) -> Tuple[dict, bool]:
+        # winmon only sees a status when the state, direction or depth changed
+        nonlocal last_shared
         status, err = winch.status()
         if err:
             return {}, True
         else:
-            winch_status_q.put(status)
-            save_payout(status, fname)
+            if status_changed(status, last_shared):
+                winch_status.set(status)
+                last_shared = status
+                statuses_shared.inc()
+            payouts.record(status, winch.payout_counts)
             return status, False
 
-    mqtt_host : str = cfg["mqtt"]["HOST"]
-    mqtt_port : int = cfg["mqtt"]["PORT"]
-    payout_log_file: str = cfg['rift-ox-pi']['PAYOUT_FN']
+    payouts = PayoutRecorder(cfg)
+    status_depth_delta: float = cfg.winch.STATUS_DEPTH_DELTA_M
+    last_shared: dict = {}
+    statuses_shared = metrics.counter('winch_status_shared_total', 'winch statuses passed on to winmon',
+                                      labels=cfg.metric_labels)
     cmd_q = queue.Queue()
+    metrics.gauge('winch_cmd_q_depth', 'winch commands waiting for wincmd', fn=cmd_q.qsize,
+                  labels=cfg.metric_labels)
 
-    wincmd_sub = mqtt.Client('wincmd-sub')
-    wincmd_sub.on_connect = on_connect
-    wincmd_sub.on_disconnect = on_disconnect
-    wincmd_sub.on_subscribe = on_cmd_subscribe
-    wincmd_sub.on_message = on_cmd_msg
-    wincmd_sub.connect(mqtt_host, mqtt_port)
-    res, _ = wincmd_sub.subscribe(cfg["mqtt"]["WINCH_CMD_TOPIC"], qos=2)
-    if res != mqtt.MQTT_ERR_SUCCESS:
-        print(f'winmon:wincmd ERROR subscribing to {cfg["mqtt"]["WINCH_CMD_TOPIC"]}')
-        print(f'winmon:wincmd shutting down')
-        quit_evt.set()
-        time.sleep(.25)
-    else:
-        wincmd_sub.loop_start()
-
-        # simulator_pub = winmqtt.winmon_pubber('winmon-simul-pub')
-        # simulator_pub.loop_start
+    cmd_t: str = cfg.mqtt.WINCH_CMD_TOPIC
+    bus = mqttbus.connection()
+    bus.subscribe(cmd_t, on_cmd_msg, qos=2)
 
     dio_cmndr: DIOCommander = DIOCommander(cfg)
     winch: Winch = Winch(dio_cmndr)
 
     last_winch_state = ''
+    cfg_version: int = 0
 
     # get initial winch status
-    _, err = share_new_winch_status(winch, Path(payout_log_file))
+    _, err = share_new_winch_status(winch)
     if err:
-        print(f'winctl:winmon: ERROR getting initial winch status')
+        logger.error('ERROR getting initial winch status')
 
     while not quit_evt.is_set():
 
-        status, err = share_new_winch_status(winch, Path(payout_log_file))
+        if live_cfg is not None and live_cfg.version != cfg_version:
+            # the winch and its maneuvers read [winch] settings through its commander's cfg
+            cfg, cfg_version = live_cfg.get(cfg.name)
+            dio_cmndr.cfg = cfg
+            status_depth_delta = cfg.winch.STATUS_DEPTH_DELTA_M
+
+        status, err = share_new_winch_status(winch)
         if err:
-            print(f'winctl:winmon: ERROR getting winch status')
+            logger.error('ERROR getting winch status')
         else:
             if status['state'] != last_winch_state:
                 last_winch_state = status['state']
                 state_json = json.dumps(status)
-                print(f'winctl:winmon: WINCH STATE: {state_json}')
+                logger.info('WINCH STATE: %s', state_json)
 
         cmd_msg = ""
         try:
-            cmd_msg = cmd_q.get(block=True, timeout=0.25)
+            cmd_msg = cmd_q.get(block=True, timeout=clock.timeout(0.25))
             cmd_q.task_done()
         except queue.Empty as em:
-            # print('winctl:wincmd: NO WINCH COMMAND message in cmd_q queue')
             continue
         except Exception as e:
-            print(f'winctl:wincmd: Error receiving msg from cmd_q Queue: {e}')
+            logger.error('Error receiving msg from cmd_q Queue: %s', e)
             continue
 
         cmd = cmd_msg['command'].upper()
         if cmd not in WINCH_CMD_LIST:
-            print(f'winctl:wincmd: INVALID COMMAND ===>>> {cmd}')
+            logger.warning('INVALID COMMAND ===>>> %s', cmd)
             continue
 
         
         if cmd == WinchCmd.WINCH_CMD_START.value:
             winch.start()
 
-        # elif cmd == WinchCmd.WINCH_CMD_STOP.value:
-        #     winch.stop()
+        elif cmd == WinchCmd.WINCH_CMD_STOP.value:
+            # cancels unparking or parking, otherwise the state decides
+            winch.stop()
 
         elif cmd == WinchCmd.WINCH_CMD_PAUSE.value:
             # winch.pause(WinchCmd.WINCH_CMD_PAUSE.value)
@@ -161,13 +145,16 @@ def wincmd_loop(cfg: dict, winch_status_q: queue.Queue, quit_evt : threading.Eve
             winch.up_stage()
 
     
-    status, err = share_new_winch_status(winch, Path(payout_log_file))
+    # don't leave the winch running on a maneuver nobody is watching
+    winch.cancel_maneuver()
+    status, err = share_new_winch_status(winch)
     if err:
-        print(f'winctl:winmon: ERROR getting final winch status')
+        logger.error('ERROR getting final winch status')
+    payouts.close()
+    bus.unsubscribe(cmd_t, on_cmd_msg)
 
 
     # err = save_payout(status, Path('last_payouts'))
     # if err:
     #     print(f"winctl:wincmd: ERROR GET LAST Payout Edge Counts")
 
-    # wincmd_sub.loop_stop()
@@ -6,21 +6,30 @@ import logging
 from pathlib import Path
 import queue
 import threading
-import time
 from typing import Tuple, Union
 
 import paho.mqtt.client as mqtt
 import toml
 
+import clock
+from config import Config
+from config.watch import LiveConfig
+import metrics
+import mqttbus
 from winch import pausemon
 
 from . import WinchDir, WinchStateName, WinchCmd, pub_cmd
+from .cast_plan import CastPlan
+from .latest_value import LatestValue
 from .pause_depths import PauseDepths
 # from inverter import InverterState, INVERTER_CMD_LIST
 
+logger = logging.getLogger(__name__)
 
 
-def winmon_loop(cfg: dict, winch_status_q: queue.Queue, quit_evt : threading.Event):
+
+def winmon_loop(cfg: Config, winch_status_latest: LatestValue, quit_evt : threading.Event,
+                live_cfg: Union[None, LiveConfig] = None):
     """Listen to data_q queue for data records to check
     CTD depth and CTD altimeter as well as the winch PAYOUT sensors."""
 
@@ -29,71 +38,97 @@ def winmon_loop(cfg: dict, winch_status_q: queue.Queue, quit_evt : threading.Eve
     #     # send inverter state cmd to inverter cmd queue
     #     pass
 
-    def _on_connect(client, userdata, flags, rc):
-        if rc==0:
-            print("winctl:winmon: connected OK: {client}")
-        else:
-            print("winctl:winmon: Bad connection for {client} Returned code: ", rc)
-            client.loop_stop()
-
-    def _on_disconnect(client, userdata, rc):
-        print("winctl:winmon: client disconnected ok")
-
-    def _on_data_message(client : mqtt.Client, userdata, message):
+    def _on_data_message(message: mqtt.MQTTMessage):
         payload = message.payload.decode("utf-8")
         payjson = json.loads(payload)
         if data_q: data_q.put(payjson)
 
-    def _on_data_subscribe(client, userdata, mid, granted_qos):
-        print("winctl:winmon: Subscribed: "+str(mid)+" "+str(granted_qos))
-
-    def get_winch_status(q: queue.Queue) -> Tuple[dict, bool]:
-        status: dict
-        try:
-            status = q.get(block=True, timeout=0.1)
-        except queue.Empty as em:
+    def get_winch_status(latest: LatestValue) -> Tuple[dict, bool]:
+        # only a status newer than the last one seen, waiting up to 100ms for one
+        nonlocal status_version
+        status, version = latest.wait_newer(status_version, timeout=clock.timeout(0.1))
+        if version == status_version:
             return {}, True
-        else:
-            q.task_done()
+        status_version = version
         return status, False
     
-    data_q : queue.Queue = queue.Queue()
+    def publish_plan():
+        # retained, so an operator subscribing mid-cast gets the ETAs straight away
+        bus.publish(plan_topic, json.dumps(cast_plan.to_dict()), qos=1, retain=True)
+
+    def follow_plan(last_state: str, cur_state: str):
+        nonlocal cast_plan
+        now = clock.time()
+
+        if cast_plan is None or cast_plan.finished:
+            if cur_state in (WinchStateName.PARKED.value, WinchStateName.PARKING.value):
+                return
+            pause_depths.refresh()
+            cast_plan = CastPlan(cfg, pause_depths.depths, now)
+            logger.info('cast plan %s', cast_plan)
+
+        elif cur_state == WinchStateName.UPCASTING.value and last_state == WinchStateName.MAXDEPTH.value:
+            # heading up from bottom
+            # lets reread pause_depths...
+            # and kill power to the SBE-33
+            pause_depths.refresh()
+            # set_inverter_power(InverterState.POWER_OFF)
+            # KILL POWER to SBE-33 by powering off the inverter
+            cast_plan.revise_bottom(max_depth_reached, now, cur_depth, pause_depths.depths)
 
-    MIN_ALTITUDE : float = float(cfg["winch"]["MIN_ALTITUDE"])    # meters. DOn't get any closer to the seafloor than this
-    MAX_DEPTH : float = float(cfg["winch"]["MAX_DEPTH"])          # meters. GO NO FARTHER
-    STAGING_DEPTH : float = float(cfg["winch"]["STAGING_DEPTH"])  # meters. This is depth of initial pause at start of the downcast
-    DEPTH_OFFSET_M: float = float(cfg["winch"]["DEPTH_OFFSET_M"])  # amount to adjust target depths by to account for slight delay in winch response
+        else:
+            action = PLAN_ACTIONS.get(cur_state)
+            waypoint = cast_plan.waypoint(action) if action else None
+            if waypoint is None:
+                return
+            cast_plan.reached(waypoint, now)
+
+        publish_plan()
 
-    cdt_cmd_t : str = cfg["mqtt"]["CTD_CMD_TOPIC"]
-    cdt_data_t : str = cfg["mqtt"]["CTD_DATA_TOPIC"]
-    winch_command_topic : str = cfg["mqtt"]["WINCH_CMD_TOPIC"]
+    data_q : queue.Queue = queue.Queue()
+    metrics.gauge('winmon_data_q_depth', 'CTD scans waiting for winmon', fn=data_q.qsize,
+                  labels=cfg.metric_labels)
+
+    def winch_settings(cfg: Config) -> Tuple[float, float, float, float, float]:
+        return (
+            cfg.winch.MIN_ALTITUDE,    # meters. DOn't get any closer to the seafloor than this
+            cfg.winch.MAX_DEPTH,          # meters. GO NO FARTHER
+            cfg.winch.STAGING_DEPTH,  # meters. This is depth of initial pause at start of the downcast
+            cfg.winch.DEPTH_OFFSET_M,  # amount to adjust target depths by to account for slight delay in winch response
+            cfg.winch.PLAN_REVISE_M,  # revise the cast plan when the altimeter moves the bottom this much
+        )
+
+    MIN_ALTITUDE, MAX_DEPTH, STAGING_DEPTH, DEPTH_OFFSET_M, PLAN_REVISE_M = winch_settings(cfg)
+    cfg_version: int = 0
+
+    # the cast plan waypoint reached on entering each state
+    PLAN_ACTIONS = {
+        WinchStateName.DOWN_STAGED.value: WinchCmd.WINCH_CMD_PAUSE.value,
+        WinchStateName.MAXDEPTH.value: WinchCmd.WINCH_CMD_STOP_AT_MAX_DEPTH.value,
+        WinchStateName.UP_STAGED.value: WinchCmd.WINCH_CMD_UPSTAGE.value,
+        WinchStateName.PARKED.value: WinchCmd.WINCH_CMD_PARK.value,
+    }
+
+    cdt_cmd_t : str = cfg.mqtt.CTD_CMD_TOPIC
+    cdt_data_t : str = cfg.mqtt.CTD_DATA_TOPIC
+    winch_command_topic : str = cfg.mqtt.WINCH_CMD_TOPIC
+    plan_topic : str = cfg.mqtt.WINCH_PLAN_TOPIC
     
-    pause_depths_fn = Path(cfg['bottles']['PAUSE_DEPTHS_FN'])
+    pause_depths_fn = Path(cfg.bottles.PAUSE_DEPTHS_FN)
     if str(Path.home()).startswith('/Users/'):   # hack because dev dir path on Dan's computer is not th same as ~/dev on productionb Pi's
         pause_depths: PauseDepths = PauseDepths(Path.home().joinpath('dev/rift-ox/dev/config', pause_depths_fn))             # pause at these depths in meters
     else:
         pause_depths: PauseDepths = PauseDepths(Path.home().joinpath('config', pause_depths_fn))             # pause at these depths in meters
 
-    mqtt_host : str = cfg["mqtt"]["HOST"]
-    mqtt_port : int = cfg["mqtt"]["PORT"]
-
-    # lets make a mqtt pubber to send winctl msgs. 
-    # using mqtt instead of an internal queue will make it easier for external 
-    # clients to send winch ctl instructions in an "emergency"
-    cmd_pub : mqtt.Client = mqtt.Client('winmon-ctl-pub')
-    cmd_pub.on_connect = _on_connect
-    cmd_pub.on_disconnect = _on_disconnect
-    cmd_pub.connect(mqtt_host, mqtt_port)
-    cmd_pub.loop_start()
-
-    datamon_sub : mqtt.Client = mqtt.Client('winmon-data-sub')
-    datamon_sub.on_connect = _on_connect
-    datamon_sub.on_disconnect = _on_disconnect
-    datamon_sub.on_subscribe = _on_data_subscribe
-    datamon_sub.on_message = _on_data_message
-    datamon_sub.connect(mqtt_host, mqtt_port)
-    datamon_sub.subscribe(cdt_data_t, qos=2)
-    datamon_sub.loop_start()
+    # an edited pause depths file is picked up mid-cast
+    pause_depths_changed = threading.Event()
+    if live_cfg is not None:
+        live_cfg.watch(pause_depths.path, lambda path: pause_depths_changed.set())
+
+    # winch commands go out over mqtt rather than an internal queue, so
+    # external clients can send winch ctl instructions in an "emergency" too
+    bus = mqttbus.connection()
+    bus.subscribe(cdt_data_t, _on_data_message, qos=2)
 
     # assume we're at the surface, aka "Parked"
     winch_status: dict = {}
@@ -104,12 +139,25 @@ def winmon_loop(cfg: dict, winch_status_q: queue.Queue, quit_evt : threading.Eve
     last_state: str = ''
     cur_altitude: float = 100  # meters, limit of alt range
     max_depth_reached: float = 0.0  # will change on the way down
+    cast_plan: Union[None, CastPlan] = None   # made at START, see follow_plan()
 
     empty_count: int = 0
+    status_version: int = 0
 
     while not quit_evt.is_set():
 
-        status, err = get_winch_status(winch_status_q)
+        if live_cfg is not None and live_cfg.version != cfg_version:
+            # a cast plan already made keeps its bottom and ETAs, the limits apply now
+            cfg, cfg_version = live_cfg.get(cfg.name)
+            MIN_ALTITUDE, MAX_DEPTH, STAGING_DEPTH, DEPTH_OFFSET_M, PLAN_REVISE_M = winch_settings(cfg)
+
+        if pause_depths_changed.is_set():
+            pause_depths_changed.clear()
+            if pause_depths.refresh() and cast_plan is not None and not cast_plan.finished:
+                cast_plan.revise_pauses(pause_depths.depths, clock.time(), cur_depth)
+                publish_plan()
+
+        status, err = get_winch_status(winch_status_latest)
         if len(status.keys()) > 0:
             winch_status = status
             cur_direction = winch_status["dir"]
@@ -117,29 +165,22 @@ def winmon_loop(cfg: dict, winch_status_q: queue.Queue, quit_evt : threading.Eve
             last_state = cur_state
             cur_state = winch_status["state"]
 
-            # heading up from bottom
-            # lets reread pause_depths...
-            # and kill power to the SBE-33
-            if (last_state == WinchStateName.MAXDEPTH.value) and \
-                (cur_state == WinchStateName.UPCASTING.value):
-                pause_depths.refresh()
-                # set_inverter_power(InverterState.POWER_OFF)
-                # KILL POWER to SBE-33 by powering off the inverter
+            if cur_state != last_state:
+                follow_plan(last_state, cur_state)
 
         data_dict = {}
         try:
-            data_dict : dict = data_q.get(block=True, timeout=0.1)
+            data_dict : dict = data_q.get(block=True, timeout=clock.timeout(0.1))
             data_q.task_done()
             empty_count = 0
         except queue.Empty as e:
-            # print('winctl:winmon: NO CTDDATA message in data_q queue')
-            if cfg["rift-ox-pi"]["REALTIME_CTD"]:
+            if cfg.rift_ox_pi.REALTIME_CTD:
                 empty_count += 1
                 if empty_count > 600:
-                    print('winctl:winmon: still NO CTD data')
+                    logger.warning('still NO CTD data')
                     empty_count = 0
         except Exception as e:
-            print(f'winctl:winmon: ERROR receiving data msg: {e}')
+            logger.error('ERROR receiving data msg: %s', e)
             continue
 
         # set Direction and log change in motion state
@@ -147,17 +188,17 @@ def winmon_loop(cfg: dict, winch_status_q: queue.Queue, quit_evt : threading.Eve
             if data_dict.get('type') == 'ctd':
                 # NOTE: PRIMARY DEPTH INFO COMES FROM PAYOUT SENSORS
                 #       THIS IS FOR COMPARISON ONLY
-                cur_depth_ctd = data_dict["depth_m"]
+                cur_depth_ctd = data_dict["dep_m"]
                 cur_altitude = data_dict["alt_m"]
 
-                if cfg["rift-ox-pi"]["REALTIME_CTD"]:
+                if cfg.rift_ox_pi.REALTIME_CTD:
                     # Let's compare winch payout readings with depth from CTD
                     delta: float = cur_depth - cur_depth_ctd
                     if (cur_depth_ctd > 10) and ((delta / cur_depth_ctd) > 0.005):
                         # report difference if more than 0.5%
-                        print(f'winctl:winmon: WARNING: winch PAYOUT reading differs from CTD DEPTH by {delta} meters at CTD depth of: {cur_depth_ctd}.')
+                        logger.warning('winch PAYOUT reading differs from CTD DEPTH by %s meters at CTD depth of: %s.', delta, cur_depth_ctd)
 
-        print(f'winctl:winmon: winch status: {winch_status}')
+        logger.debug('winch status: %s', winch_status)
         if (cur_direction == WinchDir.DIRECTION_DOWN.value):
 
             max_depth_reached = cur_depth if cur_depth > max_depth_reached else max_depth_reached
@@ -165,39 +206,46 @@ def winmon_loop(cfg: dict, winch_status_q: queue.Queue, quit_evt : threading.Eve
             if (cur_depth > (STAGING_DEPTH - DEPTH_OFFSET_M) and \
                 (cur_state == WinchStateName.STAGING.value)):
                     # just hit stagin depth on way down, call winch.state.pause() pause
-                pub_cmd(cmd_pub, winch_command_topic, WinchCmd.WINCH_CMD_PAUSE.value)
-                # pub_cmd(cmd_pub, cdt_cmd_t, "startnow")
+                pub_cmd(bus, winch_command_topic, WinchCmd.WINCH_CMD_PAUSE.value)
+                # pub_cmd(bus, cdt_cmd_t, "startnow")
 
             if (cur_depth > STAGING_DEPTH) and (cur_altitude < (MIN_ALTITUDE + DEPTH_OFFSET_M)):
                 # only check altimeter when below staging depth
                 # this avoids issues with invalid (and low numbers) in the first few samples
-                print(f'winctl:winmon: Winch is stopping within {MIN_ALTITUDE}m of the seafloor.')
-                pub_cmd(cmd_pub, winch_command_topic, WinchCmd.WINCH_CMD_STOP_AT_MAX_DEPTH.value)
+                logger.info('Winch is stopping within %sm of the seafloor.', MIN_ALTITUDE)
+                pub_cmd(bus, winch_command_topic, WinchCmd.WINCH_CMD_STOP_AT_MAX_DEPTH.value)
                 continue
 
             elif (cur_depth > (MAX_DEPTH - DEPTH_OFFSET_M)):
-                pub_cmd(cmd_pub, winch_command_topic, WinchCmd.WINCH_CMD_STOP_AT_MAX_DEPTH.value)
-                print(f'winctl:winmon: Winch is stopping at MAX depth {MAX_DEPTH} meters.')
+                pub_cmd(bus, winch_command_topic, WinchCmd.WINCH_CMD_STOP_AT_MAX_DEPTH.value)
+                logger.info('Winch is stopping at MAX depth %s meters.', MAX_DEPTH)
                 continue
 
+            if cast_plan is not None and cur_state == WinchStateName.DOWNCASTING.value and \
+                MIN_ALTITUDE >= 0 and cur_depth > STAGING_DEPTH and 0 < cur_altitude < 100:
+                # altimeter has the seafloor in range, move the plan's bottom to it
+                bottom_m = cast_plan.bottom_from(cur_depth + cur_altitude)
+                if abs(bottom_m - cast_plan.bottom_m) > PLAN_REVISE_M:
+                    cast_plan.revise_bottom(bottom_m, clock.time(), cur_depth)
+                    publish_plan()
+
         elif (cur_direction == WinchDir.DIRECTION_UP.value):
             
             if (cur_state in [WinchStateName.UPCASTING.value]):
 
                 if (cur_depth < (STAGING_DEPTH + DEPTH_OFFSET_M)):
                     # just hit stagin depth on way up, let's pause here]
-                    pub_cmd(cmd_pub, winch_command_topic, WinchCmd.WINCH_CMD_UPSTAGE.value)
-                    pub_cmd(cmd_pub, cdt_cmd_t, "stop")
+                    pub_cmd(bus, winch_command_topic, WinchCmd.WINCH_CMD_UPSTAGE.value)
+                    pub_cmd(bus, cdt_cmd_t, "stop")
 
-                else:
-                    next_pause = pause_depths.get_next_depth(max_depth=max_depth_reached)
-                    if next_pause:
-                        if cur_depth < (next_pause + DEPTH_OFFSET_M):
-                            pub_cmd(cmd_pub, winch_command_topic, WinchCmd.WINCH_CMD_BOTTLE_PAUSE.value)
-                            pause_depths.use_next_depth()
+                elif cast_plan is not None:
+                    next_stop = cast_plan.next_up_stop()
+                    if next_stop and cur_depth < (next_stop.depth_m + DEPTH_OFFSET_M):
+                        pub_cmd(bus, winch_command_topic, WinchCmd.WINCH_CMD_BOTTLE_PAUSE.value)
+                        cast_plan.reached(next_stop, clock.time())
+                        publish_plan()
 
 
-        time.sleep(0.1)
+        clock.sleep(0.1)
 
-    cmd_pub.loop_stop()
-    datamon_sub.loop_stop()
+    bus.unsubscribe(cdt_data_t, _on_data_message)
@@ -1,36 +1,66 @@
 #!/usr/bin/env python3
 
+import logging
 import os
 from pathlib import Path
 import queue
 import signal
 import sys
 import threading 
+from typing import Union
 # import time
 
 # import paho.mqtt.client as mqtt
 # import toml
 
+import winch.latest_value
 import winch.pausemon
 import winch.winmon
 import winch.wincmd
 import inverter.invmon
 
 import config
+import config.watch
+import log
+import metrics
+import mqttbus
+
+logger = logging.getLogger('winctl')
 
 
 def interrupt_handler(signum, frame):
 
     quit_evt.set()
-    wincmd_thr.join()
-    winmon_thr.join()
-    pause_thr.join()
+    for thr in threads:
+        thr.join()
+    mqttbus.stop()
 
     # do whatever...
     # time.sleep(1)
     sys.exit(0)
 
 
+def start_instance(inst_cfg: config.Config, quit_evt: threading.Event,
+                   live_cfg: Union[None, config.watch.LiveConfig]) -> list[threading.Thread]:
+    """The pausemon, wincmd and winmon threads of one winch and its CTD"""
+
+    # thread names get the instance name, so the log says which winch a line is about
+    suffix = f'-{inst_cfg.name}' if inst_cfg.name else ''
+
+    pause_thr = threading.Thread(target=winch.pausemon.pause_monitor, args=(inst_cfg, quit_evt, live_cfg), name=f"pausemon{suffix}")
+    pause_thr.start()
+
+    # latest status, so wincmd can tell winmon what state the winch is in
+    winch_status = winch.latest_value.LatestValue()
+
+    wincmd_thr = threading.Thread(target=winch.wincmd.wincmd_loop, args=(inst_cfg, winch_status, quit_evt, live_cfg), name=f"wincmd{suffix}")
+    wincmd_thr.start()
+
+    winmon_thr = threading.Thread(target=winch.winmon.winmon_loop, args=(inst_cfg, winch_status, quit_evt, live_cfg), name=f"winmon{suffix}")
+    winmon_thr.start()
+
+    return [pause_thr, wincmd_thr, winmon_thr]
+
 
 if __name__ == "__main__":
     
@@ -41,29 +71,36 @@ if __name__ == "__main__":
         print(f'winmon: ERROR unable to read rift-ox.toml config file. Quitting.')
         sys.exit(1)
 
+    log.setup(cfg, 'winctl')
+
     quit_evt = threading.Event()
 
+    # one broker connection for every thread and instance below
+    mqttbus.start(cfg, 'winctl')
+    metrics.start(cfg, 'winctl', quit_evt)
+
+    # rift-ox.toml edits reach the threads below as new snapshots
+    live_cfg = config.watch.start(cfg, quit_evt)
+    if live_cfg is not None:
+        live_cfg.subscribe(log.set_levels)
+
     # inv_cmd_q: queue.Queue = queue.Queue()
     # invertermon_thr = threading.Thread(target=inverter.invmon.inverter_monitor, args=(cfg, inv_cmd_q, quit_evt), name="invmon")
     # invertermon_thr.start()
     
-    pause_thr = threading.Thread(target=winch.pausemon.pause_monitor, args=(cfg, quit_evt), name="pausemon")
-    pause_thr.start()
-    
-    # queue so wincmd can tell winmon what state the winch is in
-    winch_status_q: queue.Queue = queue.Queue()
-
-    wincmd_thr = threading.Thread(target=winch.wincmd.wincmd_loop, args=(cfg, winch_status_q, quit_evt), name="wincmd")
-    wincmd_thr.start()
-
-    winmon_thr = threading.Thread(target=winch.winmon.winmon_loop, args=(cfg, winch_status_q, quit_evt), name="winmon")
-    winmon_thr.start()
+    # the main config's winch, then one per [[instances]] table
+    threads: list[threading.Thread] = []
+    for inst_cfg in cfg.systems:
+        if inst_cfg.name:
+            logger.info('instance %s: DIO %s, commands on %s', inst_cfg.name, inst_cfg.rift_ox_pi.DIO_PORT,
+                        inst_cfg.mqtt.WINCH_CMD_TOPIC)
+        threads += start_instance(inst_cfg, quit_evt, live_cfg)
 
     # wait for a interrupt handler or another thread to set() the quit_evt
     quit_evt.wait()
 
     # gives threads a chance to exit cleanly    
-    winmon_thr.join()
-    wincmd_thr.join()
-    pause_thr.join()
+    for thr in threads:
+        thr.join()
     # invertermon_thr.join()
+    mqttbus.stop()